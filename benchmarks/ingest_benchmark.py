@@ -0,0 +1,153 @@
+"""
+Ingest benchmark: generates synthetic recently-played payloads and pushes them through the
+ingest paths against a throwaway database, reporting plays/sec, queries per play and memory.
+
+    python -m benchmarks.ingest_benchmark --plays 10000
+    python -m benchmarks.ingest_benchmark --plays 100000 --db-url postgresql://localhost/spotilens_bench
+    python -m benchmarks.ingest_benchmark --path spool-drain --path async-pipeline --fetch-latency-ms 150
+
+Every run appends one JSON line per path to --output so results can be compared over time.
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import platform
+import resource
+import tempfile
+import subprocess
+import tracemalloc
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timezone
+from urllib.parse import urlparse
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--plays', type=int, default=10_000, help='number of plays to generate (default 10000)')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--zipf-exponent', type=float, default=1.1, help='power-law exponent of the track distribution')
+    parser.add_argument('--db-url', default=None, help='throwaway database, defaults to a temporary sqlite file')
+    parser.add_argument('--path', action='append', dest='paths', help='ingest path(s) to run, defaults to all')
+    parser.add_argument('--fetch-latency-ms', type=float, default=0, help='simulated API latency per page of 50 for the paged paths')
+    parser.add_argument('--trace-memory', action='store_true', help='report the tracemalloc peak (slows the run down)')
+    parser.add_argument('--output', default=os.path.join(os.path.dirname(__file__), 'results', 'ingest.jsonl'))
+    args = parser.parse_args()
+
+    db_url = args.db_url or f"sqlite:///{os.path.join(tempfile.mkdtemp(prefix='spotilens-bench-'), 'bench.db')}"
+    _ensure_throwaway(db_url)
+
+    # must happen before anything imports utils.constants
+    os.environ['SUPABASE_DB_URL'] = db_url
+    os.environ.setdefault('SUPABASE_DB_PASSWORD', '')
+    os.environ['APP_ENV'] = 'benchmark'
+
+    from benchmarks.paths import INGEST_PATHS
+
+    paths = args.paths or list(INGEST_PATHS)
+    unknown_paths = set(paths) - set(INGEST_PATHS)
+    if unknown_paths:
+        parser.error(f"unknown path(s) {sorted(unknown_paths)}, available: {sorted(INGEST_PATHS)}")
+
+    os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+    for path in paths:
+        # a fresh process per path: ru_maxrss is the peak of the whole process, a path run after
+        # another would otherwise report the highest peak so far instead of its own
+        with ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context('spawn')) as pool:
+            result = pool.submit(run_path_in_fresh_process, path, args).result()
+        result['db_dialect'] = urlparse(db_url).scheme
+        with open(args.output, 'a') as f:
+            f.write(json.dumps(result) + '\n')
+        print(json.dumps(result, indent=2))
+
+def run_path_in_fresh_process(name, args):
+    """
+    Runs in the per-path child process, which inherits the database settings through the environment
+    """
+    import benchmarks.paths
+    from benchmarks.paths import INGEST_PATHS
+    from benchmarks.payload_generator import generate_recently_played
+
+    benchmarks.paths.FETCH_LATENCY_SECONDS = args.fetch_latency_ms / 1000
+
+    generation_started_at = time.perf_counter()
+    items = generate_recently_played(args.plays, seed=args.seed, zipf_exponent=args.zipf_exponent)
+    print(f"Generated {len(items)} plays in {time.perf_counter() - generation_started_at:.1f}s", file=sys.stderr)
+
+    return run_path(name, INGEST_PATHS[name], items, args)
+
+def run_path(name, ingest, items, args):
+    from config.logger import log_batch_summary
+    from sqlalchemy.engine import Engine
+    from config.postgres import get_engine, close_session
+    from db.models.base_model import Base
+    from utils.instrumentation import QueryRecorder
+    import db.models  # noqa: F401 registers every table on Base.metadata
+
+    engine = get_engine()
+    close_session()
+    Base.metadata.drop_all(engine)
+    Base.metadata.create_all(engine)
+
+    queries = QueryRecorder(Engine)
+    if args.trace_memory:
+        tracemalloc.start()
+
+    queries.start()
+    started_at = time.perf_counter()
+    try:
+        ingest(items)
+    finally:
+        elapsed = time.perf_counter() - started_at
+        queries.stop()
+        close_session()
+        log_batch_summary(f"Benchmark path {name}")
+
+    traced_peak_mb = None
+    if args.trace_memory:
+        traced_peak_mb = round(tracemalloc.get_traced_memory()[1] / 1024 / 1024, 2)
+        tracemalloc.stop()
+
+    return {
+        'benchmark': 'ingest',
+        'path': name,
+        'plays': len(items),
+        'seed': args.seed,
+        'zipf_exponent': args.zipf_exponent,
+        'fetch_latency_ms': args.fetch_latency_ms,
+        'seconds': round(elapsed, 3),
+        'plays_per_second': round(len(items) / elapsed, 1) if elapsed else None,
+        'queries': queries.count,
+        'queries_per_play': round(queries.count / len(items), 2) if items else None,
+        'db_seconds': round(queries.total_time, 3),
+        'peak_rss_mb': _peak_rss_mb(),
+        'traced_peak_mb': traced_peak_mb,
+        'git_commit': _git_commit(),
+        'python': platform.python_version(),
+        'timestamp': datetime.now(timezone.utc).isoformat()
+    }
+
+def _ensure_throwaway(db_url: str) -> None:
+    """
+    The benchmark drops and recreates every table, refuse anything that is not local
+    """
+    parsed = urlparse(db_url)
+    if parsed.scheme.startswith('sqlite'):
+        return
+    if parsed.hostname not in ('localhost', '127.0.0.1', '::1'):
+        sys.exit(f"Refusing to run against non-local database host {parsed.hostname!r}; the benchmark drops all tables.")
+
+def _peak_rss_mb() -> float:
+    # ru_maxrss is in KiB on linux and bytes on macOS, and covers the whole process (one per path)
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return round(peak / 1024 / (1024 if sys.platform == 'darwin' else 1), 1)
+
+def _git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,64 @@
+import time
+import asyncio
+import tempfile
+import importlib.util
+import utils.constants as constants
+from sqlalchemy.engine import make_url
+from typing import Callable, Dict, List, Any
+from utils.helper import store_spotify_track_in_db, bulk_store_spotify_tracks
+
+# simulated Spotify round trip per page for the paged paths, set from --fetch-latency-ms
+FETCH_LATENCY_SECONDS = 0.0
+
+def per_item(items: List[Dict[str, Any]]) -> None:
+    """The daily-sync/historical path: one store_spotify_track_in_db call per play"""
+    for item in items:
+        store_spotify_track_in_db(item, 'benchmark')
+
+def bulk(items: List[Dict[str, Any]], batch_size: int = 5000) -> None:
+    """Set-based inserts, one transaction per batch"""
+    for start in range(0, len(items), batch_size):
+        bulk_store_spotify_tracks(items[start:start + batch_size], 'benchmark')
+
+def spool_drain(items: List[Dict[str, Any]], segment_size: int = 50) -> None:
+    """The daily-sync path: spool segments the size of one API page, then drain them in bulk"""
+    from utils.spool import Spool
+
+    spool = Spool(tempfile.mkdtemp(prefix='spotilens-bench-spool-'))
+    for start in range(0, len(items), segment_size):
+        time.sleep(FETCH_LATENCY_SECONDS)
+        spool.append(items[start:start + segment_size], 'benchmark')
+    spool.drain(lambda records: bulk_store_spotify_tracks([ record['payload'] for record in records ], 'benchmark'))
+
+def async_pipeline(items: List[Dict[str, Any]], page_size: int = 50) -> None:
+    """The asyncio path: pages of one API response each through the producer/consumer pipeline"""
+    from config.postgres import create_async_engine
+    from utils.async_pipeline import IngestPipeline
+
+    async def pages():
+        for start in range(0, len(items), page_size):
+            await asyncio.sleep(FETCH_LATENCY_SECONDS)
+            yield items[start:start + page_size]
+
+    async def run():
+        engine = create_async_engine('bulk-load')
+        try:
+            await IngestPipeline(engine, 'benchmark').run([ (None, pages()) ])
+        finally:
+            await engine.dispose()
+
+    asyncio.run(run())
+
+def _async_driver_available() -> bool:
+    driver = 'aiosqlite' if make_url(constants.SUPABASE_DB_URL).get_backend_name() == 'sqlite' else 'asyncpg'
+    return importlib.util.find_spec(driver) is not None
+
+# name -> callable ingesting a list of recently-played items
+INGEST_PATHS: Dict[str, Callable[[List[Dict[str, Any]]], None]] = {
+    'per-item': per_item,
+    'bulk': bulk,
+    'spool-drain': spool_drain
+}
+# the async path needs the async driver for the target database (aiosqlite is not a dependency)
+if _async_driver_available():
+    INGEST_PATHS['async-pipeline'] = async_pipeline
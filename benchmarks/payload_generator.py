@@ -0,0 +1,92 @@
+import random
+import itertools
+from typing import Dict, List, Optional, Any
+from datetime import datetime, timedelta, timezone
+
+def generate_recently_played(plays: int, seed: int = 42, zipf_exponent: float = 1.1, plays_per_track: int = 20) -> List[Dict[str, Any]]:
+    """
+    Generates items shaped like the /me/player/recently-played response, sorted by played_at.
+    Track popularity follows a power law (a few tracks take most plays), tracks and albums
+    can have several artists, and identical tracks share the same dict like real payloads do.
+    """
+    rng = random.Random(seed)
+
+    track_count = max(plays // plays_per_track, 50)
+    album_count = max(track_count // 8, 10)
+    artist_count = max(album_count // 2, 10)
+
+    artists = [ _artist(i) for i in range(artist_count) ]
+    albums = [ _album(i, rng.sample(artists, k=_artist_count(rng)), rng) for i in range(album_count) ]
+    tracks = [ _track(i, rng.choice(albums), rng.sample(artists, k=_artist_count(rng)), rng) for i in range(track_count) ]
+
+    cum_weights = list(itertools.accumulate(1 / (rank ** zipf_exponent) for rank in range(1, track_count + 1)))
+    played_tracks = rng.choices(tracks, cum_weights=cum_weights, k=plays)
+
+    played_at = datetime(2020, 1, 1, tzinfo=timezone.utc)
+    items = []
+    for track in played_tracks:
+        played_at += timedelta(seconds=rng.randint(30, 600), milliseconds=rng.randint(0, 999))
+        items.append({
+            'track': track,
+            'played_at': played_at.isoformat(timespec='milliseconds').replace('+00:00', 'Z'),
+            'context': _context(rng, track)
+        })
+
+    return items
+
+def _artist_count(rng: random.Random) -> int:
+    # roughly 75% solo, 20% duets, 5% three-way features
+    return rng.choices((1, 2, 3), weights=(75, 20, 5))[0]
+
+def _artist(i: int) -> Dict[str, Any]:
+    artist_id = f"bench-artist-{i:07d}"
+    return {
+        'id': artist_id,
+        'name': f"Artist {i}",
+        'type': 'artist',
+        'uri': f"spotify:artist:{artist_id}",
+        'href': f"https://api.spotify.com/v1/artists/{artist_id}",
+        'external_urls': {'spotify': f"https://open.spotify.com/artist/{artist_id}"}
+    }
+
+def _album(i: int, artists: List[Dict[str, Any]], rng: random.Random) -> Dict[str, Any]:
+    album_id = f"bench-album-{i:07d}"
+    return {
+        'id': album_id,
+        'name': f"Album {i}",
+        'album_type': rng.choice(('album', 'single', 'compilation')),
+        'release_date': f"{rng.randint(1970, 2025)}-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d}",
+        'release_date_precision': 'day',
+        'total_tracks': rng.randint(1, 20),
+        'artists': artists,
+        'images': [{'url': f"https://i.scdn.co/image/{album_id}", 'height': 640, 'width': 640}],
+        'type': 'album',
+        'uri': f"spotify:album:{album_id}",
+        'href': f"https://api.spotify.com/v1/albums/{album_id}",
+        'external_urls': {'spotify': f"https://open.spotify.com/album/{album_id}"}
+    }
+
+def _track(i: int, album: Dict[str, Any], artists: List[Dict[str, Any]], rng: random.Random) -> Dict[str, Any]:
+    track_id = f"bench-track-{i:07d}"
+    return {
+        'id': track_id,
+        'name': f"Track {i}",
+        'album': album,
+        'artists': artists,
+        'duration_ms': rng.randint(90_000, 420_000),
+        'explicit': rng.random() < 0.2,
+        'popularity': rng.randint(0, 100),
+        'disc_number': 1,
+        'track_number': rng.randint(1, album['total_tracks']),
+        'is_playable': True,
+        'preview_url': None,
+        'type': 'track',
+        'uri': f"spotify:track:{track_id}",
+        'href': f"https://api.spotify.com/v1/tracks/{track_id}",
+        'external_urls': {'spotify': f"https://open.spotify.com/track/{track_id}"}
+    }
+
+def _context(rng: random.Random, track: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    if rng.random() < 0.3:
+        return None
+    return {'type': 'album', 'uri': track['album']['uri']}
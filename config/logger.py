@@ -1,8 +1,12 @@
 import os
+import time
+import queue
+import atexit
 import logging
+import threading
 from datetime import datetime
 import utils.constants as constants
-from logging.handlers import TimedRotatingFileHandler
+from logging.handlers import TimedRotatingFileHandler, QueueHandler, QueueListener
 
 def _get_file_path(timestamp: str) -> str:
     return os.path.join(log_dir, f"{constants.PROJECT_NAME}.{timestamp}.log")
@@ -14,21 +18,85 @@ def _custom_namer(default_name: str) -> str:
   except ValueError:
       return default_name
 
-# setup directory
+def _parse_sample_limits(raw: str) -> dict:
+	"""Parses 'artist.found=0,track.found=5' into {'artist.found': 0, 'track.found': 5}"""
+	limits = {}
+	for entry in filter(None, (part.strip() for part in (raw or '').split(','))):
+		key, _, limit = entry.partition('=')
+		limits[key.strip()] = int(limit)
+	return limits
+
+class SamplingFilter(logging.Filter):
+	"""
+	Rate-limits records logged with `extra={'sample_key': ...}`: each key lets through at most
+	`limit` records per `interval` seconds (0 drops them all, a negative limit disables sampling).
+	Every record is counted, so `log_batch_summary` can report what was seen and suppressed.
+	Records without a sample_key are never filtered.
+	"""
+
+	def __init__(self, default_limit: int, interval: float, limits: dict = None):
+		super().__init__()
+		self.default_limit = default_limit
+		self.interval = interval
+		self.limits = limits or {}
+		self._lock = threading.Lock()
+		self._windows = {}
+		self._counts = {}
+
+	def filter(self, record: logging.LogRecord) -> bool:
+		key = getattr(record, 'sample_key', None)
+		if key is None:
+			return True
+
+		limit = self.limits.get(key, self.default_limit)
+		now = time.monotonic()
+		with self._lock:
+			counts = self._counts.setdefault(key, {'seen': 0, 'suppressed': 0})
+			counts['seen'] += 1
+			if limit < 0:
+				return True
+
+			window_started_at, emitted = self._windows.get(key, (now, 0))
+			if now - window_started_at >= self.interval:
+				window_started_at, emitted = now, 0
+			allowed = emitted < limit
+			self._windows[key] = (window_started_at, emitted + allowed)
+			if not allowed:
+				counts['suppressed'] += 1
+			return allowed
+
+	def pop_counts(self) -> dict:
+		with self._lock:
+			counts, self._counts = self._counts, {}
+		return counts
+
+class _LazyQueueHandler(QueueHandler):
+	"""Starts the background listener that writes to file and stdout on the first record"""
+	def emit(self, record):
+		_start_listener()
+		super().emit(record)
+
+class _LazyTimedRotatingFileHandler(TimedRotatingFileHandler):
+	"""Creates the log directory and opens the file on the first emitted record"""
+	def _open(self):
+		os.makedirs(os.path.dirname(self.baseFilename), exist_ok=True)
+		return super()._open()
+
+# log directory, created on first write
 log_dir = os.path.join(os.getcwd(), 'log')
-os.makedirs(log_dir, exist_ok=True)
 
 # formatter
 formatter = logging.Formatter("%(asctime)s %(levelname)s %(name)s : %(message)s")
 
 # rotation file handler
-file_handler = TimedRotatingFileHandler(
+file_handler = _LazyTimedRotatingFileHandler(
 	filename = _get_file_path(timestamp=datetime.now().strftime('%Y-%m-%d')),
 	when = 'midnight',
 	interval = 1,
 	utc = True,
 	backupCount = 7,
-	encoding = 'utf-8'
+	encoding = 'utf-8',
+	delay = True
 )
 file_handler.namer = _custom_namer
 file_handler.setFormatter(formatter)
@@ -37,8 +105,41 @@ file_handler.setFormatter(formatter)
 console_handler = logging.StreamHandler()
 console_handler.setFormatter(formatter)
 
+# sampling of high-volume messages, see SamplingFilter
+sampling_filter = SamplingFilter(
+	default_limit = constants.LOG_SAMPLE_LIMIT,
+	interval = constants.LOG_SAMPLE_INTERVAL,
+	limits = _parse_sample_limits(constants.LOG_SAMPLE_LIMITS)
+)
+
+# file and console I/O happen on the listener thread, callers only enqueue the record
+log_queue = queue.SimpleQueue()
+queue_handler = _LazyQueueHandler(log_queue)
+queue_handler.addFilter(sampling_filter)
+_listener = QueueListener(log_queue, file_handler, console_handler, respect_handler_level=True)
+_listener_lock = threading.Lock()
+_listener_started = False
+
+def _start_listener():
+	global _listener_started
+	if _listener_started:
+		return
+	with _listener_lock:
+		if not _listener_started:
+			_listener.start()
+			_listener_started = True
+			# flush whatever is still queued when the process exits
+			atexit.register(_listener.stop)
+
+def log_batch_summary(label: str, level: int = logging.INFO) -> None:
+	"""Logs one line with how many sampled messages of each type were seen since the last summary"""
+	counts = sampling_filter.pop_counts()
+	if not counts:
+		return
+	parts = [ f"{key}={c['seen']}" + (f" ({c['suppressed']} suppressed)" if c['suppressed'] else '') for key, c in sorted(counts.items()) ]
+	logger.log(level, f"{label}: {', '.join(parts)}")
+
 # config
 logger = logging.getLogger(__name__)
 logger.setLevel(logging.DEBUG)
-logger.addHandler(file_handler)
-logger.addHandler(console_handler)
+logger.addHandler(queue_handler)
@@ -1,23 +1,157 @@
+import threading
+from uuid import uuid4
 from config.logger import logger
 import utils.constants as constants
-from sqlalchemy import create_engine, text
+from sqlalchemy.pool import NullPool
+from sqlalchemy.engine import make_url
+from sqlalchemy import create_engine, event, text
 from sqlalchemy.orm import sessionmaker, scoped_session
 
-_engine = create_engine(
-	constants.SUPABASE_DB_URL,
-	echo=constants.APP_ENV == 'development',
-	pool_size=5,
-	pool_recycle=3600,
-	max_overflow=10,
-	pool_pre_ping=True,
-	pool_timeout=30,
-	connect_args={
-		"connect_timeout": 10,
-		"application_name": constants.PROJECT_NAME
+# Named engine profiles, every value can be overridden with DB_<PROFILE>_<SETTING>, e.g. DB_BULK_LOAD_POOL_SIZE=8
+ENGINE_PROFILES = {
+	# cron jobs and the poller: few short transactions, connections may sit idle between runs
+	'sync': {
+		'pool_size': 2,
+		'max_overflow': 8,
+		'pool_pre_ping': True,
+		'statement_timeout_ms': 30_000
+	},
+	# backfills and bulk ingest: long write transactions on a few busy connections
+	'bulk-load': {
+		'pool_size': 4,
+		'max_overflow': 4,
+		'pool_pre_ping': False,
+		'statement_timeout_ms': 0
+	},
+	# audits and exploration: read-only, on SUPABASE_DB_READ_URL when a replica is configured
+	'analytics': {
+		'pool_size': 2,
+		'max_overflow': 2,
+		'pool_pre_ping': True,
+		'statement_timeout_ms': 300_000,
+		'read_only': True
 	}
-)
+}
 
-db_session = scoped_session(sessionmaker(bind=_engine))
+_engines = {}
+_engine_lock = threading.Lock()
+_session_factory = sessionmaker()
+
+def get_engine(profile = 'sync'):
+	"""Builds the engine for a profile on first use, so importing this module needs no DB credentials"""
+	if profile not in ENGINE_PROFILES:
+		raise ValueError(f"Unknown engine profile '{profile}', expected one of {list(ENGINE_PROFILES)}")
+
+	with _engine_lock:
+		if profile not in _engines:
+			_engines[profile] = _create_engine(profile)
+	return _engines[profile]
+
+def pool_capacity(profile = 'sync'):
+	"""Most connections the profile's engine hands out at once, None when it does not pool (behind a transaction pooler)"""
+	if constants.DB_POOLER_MODE == 'transaction':
+		return None
+	settings = ENGINE_PROFILES[profile]
+	return constants.get_engine_setting(profile, 'pool_size', settings['pool_size']) + constants.get_engine_setting(profile, 'max_overflow', settings['max_overflow'])
+
+def _create_engine(profile):
+	db_url, settings, engine_kwargs = _engine_config(profile)
+	engine = create_engine(db_url, **engine_kwargs)
+	return _configure_engine(engine, db_url, settings)
+
+def create_async_engine(profile = 'bulk-load'):
+	"""
+	Builds an AsyncEngine (asyncpg, or aiosqlite for local sqlite) with the same profile settings.
+	Not cached: asyncpg connections are bound to the event loop that opened them, so the caller
+	creates one per asyncio.run() and disposes it at the end.
+	"""
+	from sqlalchemy.ext.asyncio import create_async_engine as _create_async_engine
+
+	db_url, settings, engine_kwargs = _engine_config(profile, async_driver = True)
+	engine = _create_async_engine(db_url, **engine_kwargs)
+	_configure_engine(engine.sync_engine, db_url, settings)
+	if db_url.startswith('postgresql') and settings.get('read_only'):
+		engine = engine.execution_options(postgresql_readonly = True)
+	return engine
+
+def _engine_config(profile, async_driver = False):
+	settings = { name: constants.get_engine_setting(profile, name, default) for name, default in ENGINE_PROFILES[profile].items() }
+	db_url = (settings.get('read_only') and constants.SUPABASE_DB_READ_URL) or constants.SUPABASE_DB_URL
+	if async_driver:
+		db_url = _to_async_url(db_url)
+	is_postgres = db_url.startswith('postgresql')
+	behind_pooler = constants.DB_POOLER_MODE == 'transaction'
+
+	engine_kwargs = {
+		'echo': constants.APP_ENV == 'development',
+		'pool_recycle': 3600,
+		'pool_pre_ping': settings['pool_pre_ping'] and not behind_pooler,
+		'connect_args': _connect_args(db_url, profile, settings, behind_pooler) if is_postgres else {}
+	}
+	if behind_pooler:
+		# the pooler multiplexes server connections, holding our own pool on top of it only pins them
+		engine_kwargs['poolclass'] = NullPool
+	else:
+		engine_kwargs['pool_timeout'] = 30
+		engine_kwargs['pool_size'] = settings['pool_size']
+		engine_kwargs['max_overflow'] = settings['max_overflow']
+
+	return db_url, settings, engine_kwargs
+
+def _configure_engine(engine, db_url, settings):
+	is_postgres = db_url.startswith('postgresql')
+	behind_pooler = constants.DB_POOLER_MODE == 'transaction'
+
+	if is_postgres and behind_pooler and settings['statement_timeout_ms']:
+		# startup options are not forwarded by transaction poolers, scope the timeout to each transaction instead
+		@event.listens_for(engine, 'begin')
+		def _set_statement_timeout(connection):
+			connection.exec_driver_sql(f"SET LOCAL statement_timeout = {int(settings['statement_timeout_ms'])}")
+
+	if is_postgres and settings.get('read_only') and not engine.dialect.is_async:
+		engine = engine.execution_options(postgresql_readonly=True)
+
+	return engine
+
+def _to_async_url(db_url):
+	url = make_url(db_url)
+	if url.get_backend_name() == 'sqlite':
+		return url.set(drivername = 'sqlite+aiosqlite').render_as_string(hide_password = False)
+
+	url = url.set(drivername = 'postgresql+asyncpg')
+	# asyncpg takes `ssl` rather than libpq's `sslmode`
+	if 'sslmode' in url.query:
+		url = url.difference_update_query(['sslmode']).update_query_dict({'ssl': url.query['sslmode']})
+	return url.render_as_string(hide_password = False)
+
+def _connect_args(db_url, profile, settings, behind_pooler):
+	driver = make_url(db_url).get_driver_name()
+	if driver == 'asyncpg':
+		connect_args = {'timeout': 10, 'server_settings': {'application_name': f"{constants.PROJECT_NAME}:{profile}"}}
+	else:
+		connect_args = {'connect_timeout': 10, 'application_name': f"{constants.PROJECT_NAME}:{profile}"}
+
+	statement_timeout_ms = int(settings['statement_timeout_ms'])
+	if behind_pooler:
+		# server-side prepared statements break when consecutive transactions land on different server connections
+		if driver == 'asyncpg':
+			connect_args['statement_cache_size'] = 0
+			connect_args['prepared_statement_cache_size'] = 0
+			# unnamed statements are not enough, asyncpg needs names that never repeat across server connections
+			connect_args['prepared_statement_name_func'] = lambda: f"__asyncpg_{uuid4()}__"
+		elif driver == 'psycopg':
+			connect_args['prepare_threshold'] = None
+	elif statement_timeout_ms and driver == 'asyncpg':
+		connect_args['server_settings']['statement_timeout'] = str(statement_timeout_ms)
+	elif statement_timeout_ms:
+		connect_args['options'] = f"-c statement_timeout={statement_timeout_ms}"
+
+	return connect_args
+
+def _create_session():
+	return _session_factory(bind=get_engine('sync'))
+
+db_session = scoped_session(_create_session)
 
 def close_session():
 	try:
@@ -29,10 +163,12 @@ def close_session():
 		except Exception:
 			pass
 
-def execute_query(raw_query, params = None):
+def execute_query(raw_query, params = None, commit = False, profile = 'sync'):
 	res = {}
 	try:
-		with _engine.connect() as connection:
+		engine = get_engine(profile)
+		# `begin()` commits on exit, `connect()` rolls back whatever was not committed
+		with (engine.begin() if commit else engine.connect()) as connection:
 			result = connection.execute(text(raw_query), params)
 			res['raw_result'] = result
 			if result.rowcount is not None:
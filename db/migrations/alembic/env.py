@@ -10,7 +10,8 @@ from alembic import context
 # Add project root to path
 sys.path.append(os.path.join(os.path.dirname(__file__), '../../..'))
 
-from utils.constants import SUPABASE_DB_URL, PROJECT_NAME
+import utils.constants as constants
+from utils.constants import PROJECT_NAME
 from db.models.base_model import Base
 import db.models
 
@@ -55,7 +56,7 @@ def run_migrations_offline() -> None:
     script output.
 
     """
-    url = config.get_main_option("sqlalchemy.url") or SUPABASE_DB_URL
+    url = config.get_main_option("sqlalchemy.url") or constants.SUPABASE_DB_URL
     context.configure(
         url=url,
         target_metadata=target_metadata,
@@ -78,7 +79,7 @@ def run_migrations_online() -> None:
     """
     from sqlalchemy import create_engine
 
-    connectable = create_engine(SUPABASE_DB_URL)
+    connectable = create_engine(constants.SUPABASE_DB_URL)
 
     with connectable.connect() as connection:
         context.configure(
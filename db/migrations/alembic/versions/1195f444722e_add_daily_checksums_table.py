@@ -0,0 +1,35 @@
+"""add daily_checksums table
+
+Revision ID: 1195f444722e
+Revises: 088610ec7ebf
+Create Date: 2026-10-19 10:12:41.204518
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '1195f444722e'
+down_revision: Union[str, Sequence[str], None] = '088610ec7ebf'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table('spotilens__daily_checksums',
+    sa.Column('day', sa.Date(), nullable=False),
+    sa.Column('play_count', sa.Integer(), nullable=False),
+    sa.Column('checksum', sa.Text(), nullable=False),
+    sa.Column('created_at', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=False),
+    sa.Column('updated_at', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=False),
+    sa.PrimaryKeyConstraint('day')
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_table('spotilens__daily_checksums')
@@ -0,0 +1,49 @@
+"""add raw payload archive tables
+
+Revision ID: 5b0e3c9a71d2
+Revises: d6ae696269f6
+Create Date: 2026-10-19 15:10:04.381920
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '5b0e3c9a71d2'
+down_revision: Union[str, Sequence[str], None] = 'd6ae696269f6'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table('spotilens__raw_objects',
+    sa.Column('digest', sa.Text(), nullable=False),
+    sa.Column('kind', sa.Text(), nullable=False),
+    sa.Column('body', sa.LargeBinary(), nullable=False),
+    sa.Column('size', sa.Integer(), nullable=False),
+    sa.Column('created_at', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=False),
+    sa.PrimaryKeyConstraint('digest')
+    )
+    op.create_table('spotilens__raw_plays',
+    sa.Column('id', sa.Integer(), autoincrement=True, nullable=False),
+    sa.Column('user_id', sa.Text(), nullable=True),
+    sa.Column('track_id', sa.Text(), nullable=False),
+    sa.Column('played_at', sa.DateTime(timezone=True), nullable=False),
+    sa.Column('entry_type', sa.Text(), nullable=False),
+    sa.Column('track_digest', sa.Text(), nullable=False),
+    sa.Column('envelope', sa.JSON(), nullable=False),
+    sa.Column('created_at', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=False),
+    sa.ForeignKeyConstraint(['track_digest'], ['spotilens__raw_objects.digest'], ),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('user_id', 'track_id', 'played_at', name='uq_raw_user_track_played_at', postgresql_nulls_not_distinct=True)
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_table('spotilens__raw_plays')
+    op.drop_table('spotilens__raw_objects')
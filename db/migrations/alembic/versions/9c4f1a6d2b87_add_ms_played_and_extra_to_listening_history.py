@@ -0,0 +1,30 @@
+"""add ms_played and extra to listening_history
+
+Revision ID: 9c4f1a6d2b87
+Revises: 5b0e3c9a71d2
+Create Date: 2026-10-19 15:14:27.902113
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '9c4f1a6d2b87'
+down_revision: Union[str, Sequence[str], None] = '5b0e3c9a71d2'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column('spotilens__listening_history', sa.Column('ms_played', sa.Integer(), nullable=True))
+    op.add_column('spotilens__listening_history', sa.Column('extra', sa.JSON(), nullable=True))
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_column('spotilens__listening_history', 'extra')
+    op.drop_column('spotilens__listening_history', 'ms_played')
@@ -0,0 +1,52 @@
+"""add users table and user_id to listening_history
+
+Revision ID: d6ae696269f6
+Revises: 1195f444722e
+Create Date: 2026-10-19 13:02:17.640211
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'd6ae696269f6'
+down_revision: Union[str, Sequence[str], None] = '1195f444722e'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table('spotilens__users',
+    sa.Column('user_id', sa.Text(), nullable=False),
+    sa.Column('display_name', sa.Text(), nullable=True),
+    sa.Column('refresh_token', sa.Text(), nullable=False),
+    sa.Column('is_active', sa.Boolean(), server_default='true', nullable=False),
+    sa.Column('last_played_at', sa.DateTime(timezone=True), nullable=True),
+    sa.Column('last_synced_at', sa.DateTime(timezone=True), nullable=True),
+    sa.Column('created_at', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=False),
+    sa.Column('updated_at', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=False),
+    sa.PrimaryKeyConstraint('user_id')
+    )
+
+    # existing rows keep user_id NULL, they belong to the original single account
+    op.add_column('spotilens__listening_history', sa.Column('user_id', sa.Text(), nullable=True))
+    op.create_foreign_key('spotilens__listening_history_user_id_fkey', 'spotilens__listening_history', 'spotilens__users', ['user_id'], ['user_id'])
+    op.create_index(op.f('ix_spotilens__listening_history_user_id'), 'spotilens__listening_history', ['user_id'], unique=False)
+
+    # NULLS NOT DISTINCT (Postgres 15+) keeps de-duplicating the legacy rows with user_id NULL
+    op.drop_constraint('uq_track_played_at', 'spotilens__listening_history', type_='unique')
+    op.create_unique_constraint('uq_user_track_played_at', 'spotilens__listening_history', ['user_id', 'track_id', 'played_at'], postgresql_nulls_not_distinct=True)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_constraint('uq_user_track_played_at', 'spotilens__listening_history', type_='unique')
+    op.create_unique_constraint('uq_track_played_at', 'spotilens__listening_history', ['track_id', 'played_at'])
+    op.drop_index(op.f('ix_spotilens__listening_history_user_id'), table_name='spotilens__listening_history')
+    op.drop_constraint('spotilens__listening_history_user_id_fkey', 'spotilens__listening_history', type_='foreignkey')
+    op.drop_column('spotilens__listening_history', 'user_id')
+    op.drop_table('spotilens__users')
@@ -0,0 +1,51 @@
+"""add cold listening history tier
+
+Revision ID: f3a81c5d0e69
+Revises: 9c4f1a6d2b87
+Create Date: 2026-10-19 16:02:41.518274
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'f3a81c5d0e69'
+down_revision: Union[str, Sequence[str], None] = '9c4f1a6d2b87'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table('spotilens__track_keys',
+    sa.Column('track_key', sa.Integer(), autoincrement=True, nullable=False),
+    sa.Column('track_id', sa.Text(), nullable=False),
+    sa.Column('created_at', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=False),
+    sa.ForeignKeyConstraint(['track_id'], ['spotilens__tracks.track_id'], ),
+    sa.PrimaryKeyConstraint('track_key'),
+    sa.UniqueConstraint('track_id')
+    )
+    op.create_table('spotilens__listening_history_cold',
+    sa.Column('id', sa.Integer(), autoincrement=True, nullable=False),
+    sa.Column('user_id', sa.Text(), nullable=True),
+    sa.Column('day', sa.Date(), nullable=False),
+    sa.Column('play_count', sa.Integer(), nullable=False),
+    sa.Column('plays', sa.LargeBinary(), nullable=False),
+    sa.Column('created_at', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=False),
+    sa.Column('updated_at', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=False),
+    sa.ForeignKeyConstraint(['user_id'], ['spotilens__users.user_id'], ),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('user_id', 'day', name='uq_cold_user_day', postgresql_nulls_not_distinct=True)
+    )
+    # the plays are compressed by the application (a day is mostly below the ~2KB row size at which
+    # Postgres would compress it), don't let TOAST spend time trying again
+    op.execute("ALTER TABLE spotilens__listening_history_cold ALTER COLUMN plays SET STORAGE EXTERNAL")
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_table('spotilens__listening_history_cold')
+    op.drop_table('spotilens__track_keys')
@@ -6,6 +6,12 @@ from db.models.listening_history import ListeningHistory
 from db.models.sync_logs import SyncLog
 from db.models.album_artists import AlbumArtist
 from db.models.track_artists import TrackArtist
+from db.models.daily_checksums import DailyChecksum
+from db.models.users import User
+from db.models.raw_objects import RawObject
+from db.models.raw_plays import RawPlay
+from db.models.track_keys import TrackKey
+from db.models.listening_history_cold import ListeningHistoryCold
 
 __all__ = [
     "BaseModel",
@@ -15,5 +21,11 @@ __all__ = [
     "ListeningHistory",
     "SyncLog",
     "AlbumArtist",
-    "TrackArtist"
+    "TrackArtist",
+    "DailyChecksum",
+    "User",
+    "RawObject",
+    "RawPlay",
+    "TrackKey",
+    "ListeningHistoryCold"
 ]
@@ -0,0 +1,12 @@
+from sqlalchemy.sql import func
+from db.models.base_model import BaseModel
+from sqlalchemy import Column, Integer, Text, Date, DateTime
+
+class DailyChecksum(BaseModel):
+    __tablename__ = "spotilens__daily_checksums"
+
+    day = Column(Date, primary_key=True)                # UTC day of played_at
+    play_count = Column(Integer, nullable=False)
+    checksum = Column(Text, nullable=False)             # md5 over track_id + played_at of the day's plays
+    created_at = Column(DateTime(timezone=True), server_default=func.now(), nullable=False)
+    updated_at = Column(DateTime(timezone=True), onupdate=func.now(), server_default=func.now(), nullable=False)
@@ -1,20 +1,24 @@
 from sqlalchemy.sql import func
 from sqlalchemy.orm import relationship
 from db.models.base_model import BaseModel
-from sqlalchemy import Column, Integer, Text, DateTime, ForeignKey, UniqueConstraint
+from sqlalchemy import Column, Integer, Text, DateTime, JSON, ForeignKey, UniqueConstraint
 
 class ListeningHistory(BaseModel):
     __tablename__ = "spotilens__listening_history"
-    __table_args__ = ( UniqueConstraint("track_id", "played_at", name="uq_track_played_at"), )
+    __table_args__ = ( UniqueConstraint("user_id", "track_id", "played_at", name="uq_user_track_played_at", postgresql_nulls_not_distinct=True), )
 
     play_id = Column(Integer, primary_key=True, autoincrement=True)
+    user_id = Column(Text, ForeignKey("spotilens__users.user_id"), nullable=True, index=True)  # NULL for the original single-account history
     track_id = Column(Text, ForeignKey("spotilens__tracks.track_id"), nullable=False)
     track_name = Column(Text, nullable=True)
     context_type = Column(Text, nullable=True)
     context_uri = Column(Text, nullable=True)
-    entry_type = Column(Text, nullable=False)  # 'historical-data' or 'daily-sync'
+    entry_type = Column(Text, nullable=False)  # 'historical-data', 'daily-sync' or 'extended-history'
     played_at = Column(DateTime(timezone=True), nullable=False)
+    ms_played = Column(Integer, nullable=True)  # only known for extended streaming history imports
+    extra = Column(JSON, nullable=True)         # remaining export fields, e.g. platform, reason_end, shuffle, skipped
     created_at = Column(DateTime(timezone=True), server_default=func.now(), nullable=False)
     updated_at = Column(DateTime(timezone=True), onupdate=func.now(), server_default=func.now(), nullable=False)
 
     track = relationship("Track", back_populates="plays")
+    user = relationship("User", back_populates="plays")
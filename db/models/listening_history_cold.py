@@ -0,0 +1,16 @@
+from sqlalchemy.sql import func
+from db.models.base_model import BaseModel
+from sqlalchemy import Column, Integer, Text, Date, DateTime, LargeBinary, ForeignKey, UniqueConstraint
+
+class ListeningHistoryCold(BaseModel):
+    __tablename__ = "spotilens__listening_history_cold"
+    __table_args__ = ( UniqueConstraint("user_id", "day", name="uq_cold_user_day", postgresql_nulls_not_distinct=True), )
+
+    # one row per user and UTC day
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    user_id = Column(Text, ForeignKey("spotilens__users.user_id"), nullable=True)
+    day = Column(Date, nullable=False)
+    play_count = Column(Integer, nullable=False)
+    plays = Column(LargeBinary, nullable=False)     # zlib-compressed offsets, track keys and ms_played, see utils.cold_storage.encode_day
+    created_at = Column(DateTime(timezone=True), server_default=func.now(), nullable=False)
+    updated_at = Column(DateTime(timezone=True), onupdate=func.now(), server_default=func.now(), nullable=False)
@@ -0,0 +1,12 @@
+from sqlalchemy.sql import func
+from db.models.base_model import BaseModel
+from sqlalchemy import Column, Integer, Text, LargeBinary, DateTime
+
+class RawObject(BaseModel):
+    __tablename__ = "spotilens__raw_objects"
+
+    digest = Column(Text, primary_key=True)         # sha256 of the canonical JSON, nested objects replaced by {"$ref": digest}
+    kind = Column(Text, nullable=False)             # 'artist', 'album', 'track' or a metadata response type
+    body = Column(LargeBinary, nullable=False)      # zlib-compressed canonical JSON
+    size = Column(Integer, nullable=False)          # uncompressed size in bytes
+    created_at = Column(DateTime(timezone=True), server_default=func.now(), nullable=False)
@@ -0,0 +1,16 @@
+from sqlalchemy.sql import func
+from db.models.base_model import BaseModel
+from sqlalchemy import Column, Integer, Text, DateTime, JSON, ForeignKey, UniqueConstraint
+
+class RawPlay(BaseModel):
+    __tablename__ = "spotilens__raw_plays"
+    __table_args__ = ( UniqueConstraint("user_id", "track_id", "played_at", name="uq_raw_user_track_played_at", postgresql_nulls_not_distinct=True), )
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    user_id = Column(Text, nullable=True)
+    track_id = Column(Text, nullable=False)
+    played_at = Column(DateTime(timezone=True), nullable=False)
+    entry_type = Column(Text, nullable=False)
+    track_digest = Column(Text, ForeignKey("spotilens__raw_objects.digest"), nullable=False)
+    envelope = Column(JSON, nullable=False)         # the recently-played item without its track, e.g. played_at and context
+    created_at = Column(DateTime(timezone=True), server_default=func.now(), nullable=False)
@@ -0,0 +1,10 @@
+from sqlalchemy.sql import func
+from db.models.base_model import BaseModel
+from sqlalchemy import Column, Integer, Text, DateTime, ForeignKey
+
+class TrackKey(BaseModel):
+    __tablename__ = "spotilens__track_keys"
+
+    track_key = Column(Integer, primary_key=True, autoincrement=True)  # int surrogate the cold tier stores instead of the 22 char id
+    track_id = Column(Text, ForeignKey("spotilens__tracks.track_id"), nullable=False, unique=True)
+    created_at = Column(DateTime(timezone=True), server_default=func.now(), nullable=False)
@@ -0,0 +1,18 @@
+from sqlalchemy.sql import func
+from sqlalchemy.orm import relationship
+from db.models.base_model import BaseModel
+from sqlalchemy import Column, Text, Boolean, DateTime
+
+class User(BaseModel):
+    __tablename__ = "spotilens__users"
+
+    user_id = Column(Text, primary_key=True)                    # spotify user id
+    display_name = Column(Text, nullable=True)
+    refresh_token = Column(Text, nullable=False)
+    is_active = Column(Boolean, nullable=False, default=True, server_default='true')
+    last_played_at = Column(DateTime(timezone=True), nullable=True)   # cursor for the recently-played API
+    last_synced_at = Column(DateTime(timezone=True), nullable=True)
+    created_at = Column(DateTime(timezone=True), server_default=func.now(), nullable=False)
+    updated_at = Column(DateTime(timezone=True), onupdate=func.now(), server_default=func.now(), nullable=False)
+
+    plays = relationship("ListeningHistory", back_populates="user")
@@ -1,4 +1,7 @@
 from invoke.collection import Collection
-from utils.tasks import daily_sync, one_time_tasks
+from utils.profiling import add_profile_option
+# task modules import their heavy dependencies (sqlalchemy, models, requests) inside the task
+# bodies, so building this collection and `invoke --list` stay fast
+from utils.tasks import daily_sync, one_time_tasks, audit, poller, accounts, archive, explore, retention
 
-ns = Collection(daily_sync, one_time_tasks)
+ns = add_profile_option(Collection(daily_sync, one_time_tasks, audit, poller, accounts, archive, explore, retention))
@@ -0,0 +1,44 @@
+import os
+import tempfile
+
+# must happen before anything imports utils.constants: every test runs against a throwaway sqlite file
+_TEST_DIR = tempfile.mkdtemp(prefix='spotilens-tests-')
+os.environ['SUPABASE_DB_URL'] = f"sqlite:///{os.path.join(_TEST_DIR, 'test.db')}"
+os.environ['SUPABASE_DB_READ_URL'] = ''
+os.environ['SUPABASE_DB_PASSWORD'] = ''
+os.environ['DB_POOLER_MODE'] = ''
+os.environ['APP_ENV'] = 'test'
+os.environ['SPOOL_DIR'] = os.path.join(_TEST_DIR, 'spool')
+
+import pytest
+
+@pytest.fixture
+def db():
+    """
+    Fresh tables for every test
+    """
+    from config.postgres import get_engine, close_session
+    from db.models.base_model import Base
+    import db.models  # noqa: F401 registers every table on Base.metadata
+
+    close_session()
+    engine = get_engine()
+    Base.metadata.drop_all(engine)
+    Base.metadata.create_all(engine)
+    yield engine
+    close_session()
+
+@pytest.fixture
+def store_plays(db):
+    """
+    Bulk-loads `count` synthetic recently-played items and returns them
+    """
+    from benchmarks.payload_generator import generate_recently_played
+    from utils.helper import bulk_store_spotify_tracks
+
+    def store(count, seed=7, user_id=None):
+        items = generate_recently_played(count, seed=seed)
+        bulk_store_spotify_tracks(items, 'daily-sync', user_id)
+        return items
+
+    return store
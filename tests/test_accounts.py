@@ -0,0 +1,140 @@
+import io
+import pytest
+import requests
+from utils.tasks import accounts
+import utils.spotify_service as spotify_service
+
+class FakeResponse:
+    def __init__(self, body, status_code=200):
+        self.body = body
+        self.status_code = status_code
+        self.headers = {}
+
+    def json(self):
+        return self.body
+
+    def raise_for_status(self):
+        if self.status_code >= 400:
+            raise requests.exceptions.HTTPError(f"{self.status_code} error")
+
+class FakeSpotify:
+    """Answers token and recently-played calls per account, keyed by refresh token"""
+    def __init__(self, items_by_token, rotated_tokens=None):
+        self.items_by_token = items_by_token
+        self.rotated_tokens = rotated_tokens or {}
+
+    def request(self, method, url, **kwargs):
+        if url.endswith('/api/token'):
+            refresh_token = kwargs['data']['refresh_token']
+            body = {'access_token': f"access-{refresh_token}", 'expires_in': 3600}
+            if refresh_token in self.rotated_tokens:
+                body['refresh_token'] = self.rotated_tokens[refresh_token]
+            return FakeResponse(body)
+
+        refresh_token = kwargs['headers']['Authorization'].removeprefix('Bearer access-')
+        if refresh_token not in self.items_by_token:
+            return FakeResponse({'error': 'invalid token'}, 401)
+        return FakeResponse({'items': self.items_by_token[refresh_token]})
+
+@pytest.fixture
+def add_account(db, monkeypatch):
+    def add(user_id, refresh_token, display_name=None):
+        monkeypatch.setenv(accounts.REFRESH_TOKEN_ENV, refresh_token)
+        accounts.add_account.body(None, user_id, display_name=display_name)
+
+    return add
+
+def _users():
+    from config.postgres import execute_query
+    return { row[0]: row[1:] for row in execute_query("SELECT user_id, refresh_token, display_name, last_played_at FROM spotilens__users")['rows'] }
+
+def test_add_account_creates_then_updates(add_account):
+    add_account('alice', 'token-1', display_name='Alice')
+    add_account('alice', 'token-2')
+
+    assert _users() == {'alice': ('token-2', 'Alice', None)}
+
+def test_add_account_fails_when_the_record_cannot_be_created(add_account, monkeypatch):
+    from db.models.users import User
+
+    monkeypatch.setattr(User, 'create_record', classmethod(lambda cls, fields: False))
+
+    with pytest.raises(RuntimeError):
+        add_account('alice', 'token-1')
+
+def test_refresh_token_is_read_from_stdin_when_not_in_the_environment(monkeypatch):
+    monkeypatch.delenv(accounts.REFRESH_TOKEN_ENV, raising=False)
+    monkeypatch.setattr(accounts.sys, 'stdin', io.StringIO('token-from-stdin\n'))
+
+    assert accounts._read_refresh_token() == 'token-from-stdin'
+
+def test_missing_refresh_token_is_rejected(monkeypatch):
+    monkeypatch.delenv(accounts.REFRESH_TOKEN_ENV, raising=False)
+    monkeypatch.setattr(accounts.sys, 'stdin', io.StringIO(''))
+
+    with pytest.raises(ValueError):
+        accounts._read_refresh_token()
+
+def test_sync_accounts_stores_each_accounts_plays_and_persists_rotated_tokens(add_account, monkeypatch):
+    from config.postgres import execute_query
+    from benchmarks.payload_generator import generate_recently_played
+
+    add_account('alice', 'alice-token')
+    add_account('bob', 'bob-token')
+    add_account('carol', 'revoked-token')
+    fake = FakeSpotify(
+        {'alice-token': generate_recently_played(5, seed=1), 'bob-token': generate_recently_played(3, seed=2)},
+        rotated_tokens={'alice-token': 'alice-token-2'}
+    )
+    monkeypatch.setattr(requests.Session, 'request', fake.request)
+
+    budgets = []
+    acquire = spotify_service.RequestBudget.acquire
+    monkeypatch.setattr(spotify_service.RequestBudget, 'acquire', lambda self: (budgets.append(self), acquire(self)))
+
+    accounts.sync_accounts.body(None, workers=3, requests_per_minute=6000, app_requests_per_minute=60000)
+
+    plays = execute_query("SELECT user_id, COUNT(*) FROM spotilens__listening_history GROUP BY user_id ORDER BY user_id")['rows']
+    assert plays == [('alice', 5), ('bob', 3)]
+    users = _users()
+    assert users['alice'][0] == 'alice-token-2'
+    assert users['carol'][2] is None
+    # one budget per account, each drawing from the app-wide one
+    account_budgets = { id(budget): budget for budget in budgets if budget.parent }
+    assert len(account_budgets) == 3
+    assert len({ id(budget.parent) for budget in account_budgets.values() }) == 1
+    assert sum(1 for budget in budgets if not budget.parent) == sum(1 for budget in budgets if budget.parent)
+    statuses = execute_query("SELECT status, COUNT(*) FROM spotilens__sync_logs WHERE sync_source = 'recently-played-api' GROUP BY status ORDER BY status")['rows']
+    assert [ (bool(int(status)), count) for status, count in statuses ] == [(False, 1), (True, 2)]
+
+def test_request_budget_allows_a_burst_then_paces_calls(monkeypatch):
+    now = [0.0]
+    sleeps = []
+    def sleep(seconds):
+        sleeps.append(seconds)
+        now[0] += seconds
+    monkeypatch.setattr(spotify_service.time, 'monotonic', lambda: now[0])
+    monkeypatch.setattr(spotify_service.time, 'sleep', sleep)
+
+    budget = spotify_service.RequestBudget(60, burst=3)
+    for _ in range(5):
+        budget.acquire()
+
+    assert sleeps == [pytest.approx(1.0), pytest.approx(1.0)]
+
+def test_workers_are_limited_by_the_sync_pool(db, monkeypatch):
+    from concurrent.futures import ThreadPoolExecutor
+
+    pool_sizes = []
+    def executor(max_workers, **kwargs):
+        pool_sizes.append(max_workers)
+        return ThreadPoolExecutor(max_workers, **kwargs)
+    monkeypatch.setattr(accounts, 'ThreadPoolExecutor', executor)
+    monkeypatch.setattr(accounts, '_fetch_accounts_by_staleness', lambda: [{'user_id': 'alice', 'refresh_token': 'token', 'last_played_at': None}])
+    monkeypatch.setattr(accounts, '_sync_account', lambda account, request_budget: 0)
+
+    accounts.sync_accounts.body(None, workers=50)
+    accounts.sync_accounts.body(None, workers=2)
+
+    # sync pool: pool_size 2 + max_overflow 8, two connections per worker
+    assert pool_sizes == [5, 2]
@@ -0,0 +1,113 @@
+import json
+import pytest
+from config.postgres import execute_query
+from benchmarks.payload_generator import generate_recently_played
+
+SNAPSHOT_QUERIES = {
+    'plays': "SELECT user_id, track_id, played_at, track_name, context_type, context_uri, entry_type FROM spotilens__listening_history ORDER BY played_at, track_id",
+    'tracks': "SELECT track_id, album_id, name, duration_ms, explicit, popularity FROM spotilens__tracks ORDER BY track_id",
+    'albums': "SELECT album_id, name, album_type, release_date, images FROM spotilens__albums ORDER BY album_id",
+    'artists': "SELECT artist_id, name, uri FROM spotilens__artists ORDER BY artist_id",
+    'track_artists': "SELECT track_id, artist_id FROM spotilens__track_artists ORDER BY track_id, artist_id",
+    'album_artists': "SELECT album_id, artist_id FROM spotilens__album_artists ORDER BY album_id, artist_id"
+}
+
+def _snapshot():
+    # JSON columns come back as text on sqlite, compare them by value
+    decode = lambda value: json.loads(value) if isinstance(value, str) and value[:1] in '[{' else value
+    return { table: [ tuple(decode(value) for value in row) for row in execute_query(query)['rows'] ] for table, query in SNAPSHOT_QUERIES.items() }
+
+def _count(table):
+    return execute_query(f"SELECT COUNT(*) FROM {table}")['rows'][0][0]
+
+def test_objects_shared_by_plays_are_archived_once():
+    from utils.archive import archive_rows
+
+    items = generate_recently_played(200, seed=3)
+    rows = archive_rows(items, 'daily-sync')
+
+    distinct_tracks = { item['track']['id'] for item in items }
+    distinct_artists = { artist['id'] for item in items for artist in item['track']['artists'] + item['track']['album']['artists'] }
+    kinds = [ row['kind'] for row in rows['raw_objects'] ]
+    assert len(rows['raw_plays']) == 200
+    assert kinds.count('track') == len(distinct_tracks)
+    assert kinds.count('artist') == len(distinct_artists)
+
+def test_archived_items_are_rebuilt_exactly(db):
+    from utils.archive import archive_rows, write_archive_rows, iter_archived_items
+
+    items = generate_recently_played(50, seed=3)
+    with db.begin() as connection:
+        write_archive_rows(connection, archive_rows(items, 'daily-sync', 'alice'))
+        # writing the same objects again sends nothing new
+        assert write_archive_rows(connection, archive_rows(items, 'daily-sync', 'alice')) == 0
+
+    with db.connect() as connection:
+        rebuilt = list(iter_archived_items(connection, 0, 10_000))
+
+    assert rebuilt == [ ('daily-sync', 'alice', item) for item in items ]
+
+def test_rebuild_with_truncate_reproduces_the_derived_tables(store_plays):
+    from utils.helper import store_spotify_track_in_db
+    from utils.tasks.archive import rebuild_from_archive
+
+    store_plays(300)
+    for item in generate_recently_played(310, seed=7)[300:]:
+        store_spotify_track_in_db(item, 'daily-sync')
+    before = _snapshot()
+
+    rebuild_from_archive.body(None, workers=2, chunk_size=100, truncate=True)
+
+    assert _snapshot() == before
+    assert len(before['plays']) == 310
+
+def test_rebuild_assigns_the_same_play_ids_every_time(store_plays):
+    from utils.tasks.archive import rebuild_from_archive
+
+    store_plays(200, seed=3)
+    store_plays(100, seed=3, user_id='alice')
+    play_ids = "SELECT play_id, user_id, track_id, played_at FROM spotilens__listening_history ORDER BY play_id"
+
+    rebuild_from_archive.body(None, workers=3, chunk_size=20, truncate=True)
+    first = execute_query(play_ids)['rows']
+    rebuild_from_archive.body(None, workers=3, chunk_size=20, truncate=True)
+
+    assert len(first) == 300
+    assert execute_query(play_ids)['rows'] == first
+
+def test_truncate_refuses_to_drop_plays_the_archive_does_not_hold(store_plays):
+    from utils.tasks.archive import _truncate_derived_tables
+
+    store_plays(20)
+    execute_query("DELETE FROM spotilens__raw_plays WHERE id % 2 = 0", commit=True)
+
+    with pytest.raises(RuntimeError):
+        _truncate_derived_tables()
+    assert _count('spotilens__listening_history') == 20
+
+def test_truncate_resets_backfill_checkpoints(store_plays):
+    from db.models.sync_logs import SyncLog
+    from utils.tasks.archive import _truncate_derived_tables
+
+    store_plays(20)
+    SyncLog.create_record({'sync_source': 'backfill:populate-track-names', 'status': 'error', 'response': json.dumps({'table': 'spotilens__listening_history', 'next_id': 11})})
+
+    _truncate_derived_tables()
+
+    assert [ log.status for log in SyncLog.fetch_records(filters={'sync_source': 'backfill:populate-track-names'}) ] == ['reset']
+
+def test_play_stored_before_a_failed_archive_is_archived_on_retry(db, monkeypatch):
+    import utils.helper
+    from utils.helper import store_spotify_track_in_db
+
+    item = generate_recently_played(1, seed=3)[0]
+    with monkeypatch.context() as patch:
+        patch.setattr(utils.helper, 'write_archive_rows', lambda connection, rows: (_ for _ in ()).throw(RuntimeError('archive down')))
+        with pytest.raises(RuntimeError):
+            store_spotify_track_in_db(item)
+    assert (_count('spotilens__listening_history'), _count('spotilens__raw_plays')) == (1, 0)
+
+    store_spotify_track_in_db(item)
+    store_spotify_track_in_db(item)
+
+    assert (_count('spotilens__listening_history'), _count('spotilens__raw_plays')) == (1, 1)
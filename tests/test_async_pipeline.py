@@ -0,0 +1,129 @@
+import json
+import asyncio
+import httpx
+import pytest
+from datetime import datetime
+from config.postgres import execute_query
+from benchmarks.payload_generator import generate_recently_played
+
+async def _pages(items, page_size=10, fail_after=None):
+    for start in range(0, len(items), page_size):
+        if fail_after is not None and start >= fail_after:
+            raise httpx.ConnectError('connection reset')
+        await asyncio.sleep(0)
+        yield items[start:start + page_size]
+
+def _run_pipeline(sources, **kwargs):
+    from config.postgres import create_async_engine
+    from utils.async_pipeline import IngestPipeline
+
+    async def run():
+        engine = create_async_engine('bulk-load')
+        try:
+            return await IngestPipeline(engine, 'daily-sync', **kwargs).run(sources)
+        finally:
+            await engine.dispose()
+
+    return asyncio.run(run())
+
+def test_pipeline_stores_every_source_in_batches(db, tmp_path):
+    from utils.spool import Spool
+
+    spool = Spool(str(tmp_path / 'spool'))
+    default_items, alice_items = generate_recently_played(40, seed=1), generate_recently_played(25, seed=2)
+
+    stats = _run_pipeline([ (None, _pages(default_items)), ('alice', _pages(alice_items)) ], batch_size=20, spool=spool)
+
+    assert (stats['pages'], stats['fetched'], stats['inserted'], stats['errors']) == (7, 65, 65, {})
+    assert 1 < stats['batches'] < 7
+    assert execute_query("SELECT user_id, COUNT(*) FROM spotilens__listening_history GROUP BY user_id ORDER BY user_id")['rows'] == [(None, 40), ('alice', 25)]
+    assert spool.segments() == []
+
+def test_failing_source_is_skipped_and_reported(db):
+    items = generate_recently_played(30, seed=1)
+
+    stats = _run_pipeline([ (None, _pages(items)), ('alice', _pages(generate_recently_played(30, seed=2), fail_after=20)) ])
+
+    assert stats['inserted'] == 50
+    assert stats['errors'] == {'alice': 'connection reset'}
+
+def test_iter_recently_played_follows_the_after_cursor():
+    from utils.async_spotify_service import AsyncSpotifyService
+
+    items = generate_recently_played(120, seed=1)
+    requested_after = []
+    def handler(request):
+        if request.url.path == '/api/token':
+            return httpx.Response(200, json={'access_token': 'token', 'expires_in': 3600})
+        after, limit = int(request.url.params['after']), int(request.url.params['limit'])
+        requested_after.append(after)
+        page = [ item for item in items if _epoch_ms(item['played_at']) > after ][:limit]
+        cursors = {'after': str(_epoch_ms(page[-1]['played_at']))} if page else None
+        return httpx.Response(200, json={'items': page, 'cursors': cursors})
+
+    async def collect():
+        async with AsyncSpotifyService(client=httpx.AsyncClient(transport=httpx.MockTransport(handler)), refresh_token='refresh') as spotify_service:
+            return [ page async for page in spotify_service.iter_recently_played(cutoff_timestamp='2019-12-31T00:00:00.000Z') ]
+
+    pages = asyncio.run(collect())
+
+    assert [ len(page) for page in pages ] == [50, 50, 20]
+    assert [ item for page in pages for item in page ] == items
+    assert requested_after == sorted(requested_after)
+
+@pytest.mark.parametrize('interruption', [asyncio.CancelledError, KeyboardInterrupt])
+def test_interrupted_async_sync_still_writes_its_sync_log(db, monkeypatch, interruption):
+    from utils.tasks import daily_sync
+    from db.models.sync_logs import SyncLog
+
+    async def interrupted(*args):
+        raise interruption()
+    monkeypatch.setattr(daily_sync, '_run_async_pipeline', interrupted)
+
+    with pytest.raises(interruption):
+        daily_sync.sync_data_with_spotify_async.body(None)
+
+    sync_log, = SyncLog.fetch_records(filters={'sync_source': 'recently-played-api'})
+    assert int(sync_log.status) == 0  # status is a text column, sqlite stores False as '0'
+    assert json.loads(sync_log.response)['error'] == 'cancelled'
+
+def _epoch_ms(played_at):
+    return int(datetime.fromisoformat(played_at.replace('Z', '+00:00')).timestamp() * 1000)
+
+def test_both_clients_wait_out_rate_limits_and_rotate_tokens(monkeypatch):
+    import requests
+    from utils.spotify_service import SpotifyService
+    from utils.async_spotify_service import AsyncSpotifyService
+
+    rotated = []
+    def respond(url, calls):
+        calls.append(url)
+        if url.endswith('/api/token'):
+            return 200, {}, {'access_token': 'token', 'expires_in': 3600, 'refresh_token': 'rotated'}
+        if calls.count(url) == 1:
+            return 429, {'Retry-After': '0'}, {}
+        return 200, {}, {'items': [{'played_at': '2024-03-01T10:00:00.000Z'}]}
+
+    async_calls = []
+    def handler(request):
+        status_code, headers, body = respond(str(request.url.copy_with(query=None)), async_calls)
+        return httpx.Response(status_code, headers=headers, json=body)
+    async def fetch_async():
+        async with AsyncSpotifyService(client=httpx.AsyncClient(transport=httpx.MockTransport(handler)), refresh_token='refresh', on_refresh_token=rotated.append) as spotify_service:
+            return await spotify_service.fetch_recently_played()
+
+    sync_calls = []
+    def request(self, method, url, **kwargs):
+        status_code, headers, body = respond(url, sync_calls)
+        response = requests.Response()
+        response.status_code, response._content = status_code, json.dumps(body).encode()
+        response.headers.update(headers)
+        return response
+    monkeypatch.setattr(requests.Session, 'request', request)
+
+    sync_items = SpotifyService(refresh_token='refresh', on_refresh_token=rotated.append).fetch_recently_played()['items']
+    async_items = asyncio.run(fetch_async())['items']
+
+    assert sync_items == async_items
+    assert [ url.rsplit('/', 1)[-1] for url in sync_calls ] == [ url.rsplit('/', 1)[-1] for url in async_calls ] == ['token', 'recently-played', 'recently-played']
+    assert rotated == ['rotated', 'rotated']
@@ -0,0 +1,109 @@
+import json
+import pytest
+from datetime import date, timedelta
+from utils.tasks import audit
+
+# the audit queries are Postgres SQL, these tests answer them with canned rows and check what the task does with them
+DAY_1, DAY_2, DAY_3, DAY_4 = date(2024, 3, 1), date(2024, 3, 2), date(2024, 3, 3), date(2024, 3, 4)
+
+class FakeDatabase:
+    def __init__(self, current, stored, mismatches=(), mismatched_days=()):
+        self.answers = {
+            audit.DAILY_CHECKSUMS_QUERY: [ (day, count, checksum) for day, (count, checksum) in current.items() ],
+            audit.STORED_CHECKSUMS_QUERY: [ (day, count, checksum) for day, (count, checksum) in stored.items() ],
+            audit.TRACK_NAME_MISMATCH_QUERY: [ (*row, len(mismatches)) for row in mismatches ],
+            audit.MISMATCHED_DAYS_QUERY: [ (day,) for day in mismatched_days ]
+        }
+        self.calls = []
+
+    def execute_query(self, query, params=None, commit=False, profile='sync'):
+        self.calls.append((query, params))
+        return {'rows': self.answers.get(query, [])}
+
+    def params_of(self, query):
+        return [ params for called_query, params in self.calls if called_query == query ]
+
+@pytest.fixture
+def fake_database(db, monkeypatch):
+    import config.postgres
+
+    def install(*args, **kwargs):
+        fake = FakeDatabase(*args, **kwargs)
+        monkeypatch.setattr(config.postgres, 'execute_query', fake.execute_query)
+        return fake
+
+    return install
+
+def _last_report():
+    from db.models.sync_logs import SyncLog
+
+    sync_log = max(SyncLog.fetch_records(filters={'sync_source': 'consistency-audit'}), key=lambda log: log.id)
+    return sync_log.status, json.loads(sync_log.response) if sync_log.status == 'success' else sync_log.response
+
+def test_only_changed_days_are_checked_and_checkpointed(fake_database):
+    fake = fake_database(
+        current={DAY_1: (3, 'a'), DAY_2: (2, 'b'), DAY_3: (1, 'c')},
+        stored={DAY_1: (3, 'a'), DAY_2: (2, 'old'), DAY_4: (1, 'd')}
+    )
+
+    audit.audit_data_consistency.body(None)
+
+    assert fake.params_of(audit.TRACK_NAME_MISMATCH_QUERY)[0]['days'] == [DAY_2, DAY_3]
+    assert [ row['day'] for row in fake.params_of(audit.UPSERT_CHECKSUM_QUERY)[0] ] == [DAY_2, DAY_3]
+    assert fake.params_of("DELETE FROM spotilens__daily_checksums WHERE day = ANY(:days)") == [{'days': [DAY_4]}]
+    status, report = _last_report()
+    assert status == 'success'
+    assert (report['days_checked'], report['days_removed']) == (2, 1)
+
+def test_incremental_audit_checksums_from_shortly_before_the_last_audited_day(fake_database):
+    old_day = date(2024, 1, 1)
+    fake = fake_database(current={DAY_4: (1, 'd')}, stored={old_day: (5, 'x'), DAY_4: (1, 'old')})
+
+    audit.audit_data_consistency.body(None)
+
+    assert fake.params_of(audit.DAILY_CHECKSUMS_QUERY) == [{'since': DAY_4 - timedelta(days=audit.LOOKBACK_DAYS)}]
+    # days before the window are not checksummed, so they are not removed either
+    assert fake.params_of("DELETE FROM spotilens__daily_checksums WHERE day = ANY(:days)") == []
+    _, report = _last_report()
+    assert (report['days_checked'], report['days_removed']) == (1, 0)
+
+def test_days_with_bad_plays_keep_their_old_checksum(fake_database):
+    fake = fake_database(
+        current={DAY_1: (3, 'a'), DAY_2: (2, 'b')},
+        stored={},
+        mismatches=[(17, 'track-1', 'Old name', 'New name')],
+        mismatched_days=[DAY_1]
+    )
+
+    audit.audit_data_consistency.body(None)
+
+    assert [ row['day'] for row in fake.params_of(audit.UPSERT_CHECKSUM_QUERY)[0] ] == [DAY_2]
+    _, report = _last_report()
+    assert report['track_name_mismatches'] == {'count': 1, 'sample': [[17, 'track-1', 'Old name', 'New name']]}
+
+def test_full_audit_checks_every_day(fake_database):
+    fake = fake_database(current={DAY_1: (3, 'a'), DAY_2: (2, 'b')}, stored={DAY_1: (3, 'a'), DAY_2: (2, 'b')})
+
+    audit.audit_data_consistency.body(None, full=True)
+
+    assert fake.params_of(audit.DAILY_CHECKSUMS_QUERY) == [{'since': None}]
+    assert fake.params_of(audit.TRACK_NAME_MISMATCH_QUERY)[0]['days'] is None
+    _, report = _last_report()
+    assert report['days_checked'] == 2
+
+def test_unchanged_history_skips_the_per_play_check(fake_database):
+    fake = fake_database(current={DAY_1: (3, 'a')}, stored={DAY_1: (3, 'a')})
+
+    audit.audit_data_consistency.body(None)
+
+    assert fake.params_of(audit.TRACK_NAME_MISMATCH_QUERY) == []
+    assert fake.params_of(audit.UPSERT_CHECKSUM_QUERY) == []
+
+def test_failed_audit_is_logged_as_error(fake_database):
+    fake = fake_database(current={}, stored={})
+    fake.answers[audit.DAILY_CHECKSUMS_QUERY] = None
+
+    audit.audit_data_consistency.body(None)
+
+    status, _ = _last_report()
+    assert status == 'error'
@@ -0,0 +1,89 @@
+import pytest
+from config.postgres import execute_query
+from utils.backfill import ChunkedBackfill, reset_checkpoints
+
+FILL_TRACK_NAMES = """
+    UPDATE spotilens__listening_history
+    SET track_name = (SELECT name FROM spotilens__tracks t WHERE t.track_id = spotilens__listening_history.track_id)
+    WHERE track_name IS NULL AND play_id >= :start_id AND play_id < :end_id
+"""
+
+def _clear_track_names():
+    execute_query("UPDATE spotilens__listening_history SET track_name = NULL", commit=True)
+
+def _missing_track_names():
+    return execute_query("SELECT COUNT(*) FROM spotilens__listening_history WHERE track_name IS NULL")['rows'][0][0]
+
+def _backfill(**kwargs):
+    return ChunkedBackfill('test-track-names', 'spotilens__listening_history', 'play_id', FILL_TRACK_NAMES, **kwargs)
+
+def test_backfill_walks_the_table_in_chunks(store_plays):
+    store_plays(100)
+    _clear_track_names()
+
+    result = _backfill(chunk_size=30).run()
+
+    assert result == {'rows_affected': 100, 'chunks': 4}
+    assert _missing_track_names() == 0
+
+def test_backfill_resumes_after_a_failed_chunk(store_plays, monkeypatch):
+    import utils.backfill
+
+    store_plays(100)
+    _clear_track_names()
+
+    calls = []
+    def fail_on_third_chunk(query, params=None, **kwargs):
+        if params and 'start_id' in params:
+            calls.append(params['start_id'])
+            if len(calls) == 3:
+                raise RuntimeError('connection lost')
+        return execute_query(query, params, **kwargs)
+
+    with monkeypatch.context() as patch:
+        patch.setattr(utils.backfill, 'execute_query', fail_on_third_chunk)
+        with pytest.raises(RuntimeError):
+            _backfill(chunk_size=30).run()
+    assert _missing_track_names() == 40
+
+    result = _backfill(chunk_size=30).run()
+
+    assert result == {'rows_affected': 100, 'chunks': 2}
+    assert _missing_track_names() == 0
+
+def test_reset_checkpoints_makes_the_next_run_start_over(store_plays, monkeypatch):
+    import utils.backfill
+
+    store_plays(60)
+    _clear_track_names()
+
+    def fail(query, params=None, **kwargs):
+        if params and 'start_id' in params:
+            raise RuntimeError('connection lost')
+        return execute_query(query, params, **kwargs)
+
+    with monkeypatch.context() as patch:
+        patch.setattr(utils.backfill, 'execute_query', fail)
+        with pytest.raises(RuntimeError):
+            _backfill(chunk_size=30).run()
+
+    assert reset_checkpoints('spotilens__tracks') == 0
+    assert reset_checkpoints('spotilens__listening_history') == 1
+    assert _backfill(chunk_size=30)._get_checkpoint() is None
+
+def test_backfill_throttles_to_rows_per_second(store_plays, monkeypatch):
+    import utils.backfill
+
+    store_plays(20)
+    _clear_track_names()
+    sleeps = []
+    monkeypatch.setattr(utils.backfill.time, 'sleep', sleeps.append)
+
+    _backfill(chunk_size=10, rows_per_second=2.5).run()
+
+    assert len(sleeps) == 2
+    assert all(3 < seconds <= 4 for seconds in sleeps)
+
+def test_backfill_rejects_empty_chunks():
+    with pytest.raises(ValueError):
+        _backfill(chunk_size=0)
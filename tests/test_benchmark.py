@@ -0,0 +1,76 @@
+import pytest
+from config.postgres import execute_query
+from benchmarks.payload_generator import generate_recently_played
+
+def _stored_tables():
+    return {
+        table: execute_query(query)['rows']
+        for table, query in {
+            'plays': "SELECT user_id, track_id, played_at, track_name, context_type, context_uri FROM spotilens__listening_history ORDER BY played_at, track_id",
+            'tracks': "SELECT track_id, album_id, name FROM spotilens__tracks ORDER BY track_id",
+            'albums': "SELECT album_id, name FROM spotilens__albums ORDER BY album_id",
+            'artists': "SELECT artist_id, name FROM spotilens__artists ORDER BY artist_id",
+            'track_artists': "SELECT track_id, artist_id FROM spotilens__track_artists ORDER BY track_id, artist_id",
+            'album_artists': "SELECT album_id, artist_id FROM spotilens__album_artists ORDER BY album_id, artist_id"
+        }.items()
+    }
+
+def test_generator_is_reproducible():
+    items = generate_recently_played(500, seed=3)
+
+    assert items == generate_recently_played(500, seed=3)
+    assert items != generate_recently_played(500, seed=4)
+    assert [ item['played_at'] for item in items ] == sorted(item['played_at'] for item in items)
+
+def test_generator_shares_track_dicts_between_plays():
+    items = generate_recently_played(1000, seed=3)
+    tracks = {}
+    for item in items:
+        assert tracks.setdefault(item['track']['id'], item['track']) is item['track']
+
+    # power law: the most played track is played far more often than the median one
+    play_counts = sorted((sum(item['track']['id'] == track_id for item in items) for track_id in tracks), reverse=True)
+    assert play_counts[0] > 10 * play_counts[len(play_counts) // 2]
+
+def test_every_ingest_path_stores_the_same_rows(db):
+    from config.postgres import close_session
+    from db.models.base_model import Base
+    from benchmarks.paths import INGEST_PATHS
+
+    items = generate_recently_played(300, seed=11)
+    results = {}
+    for name, ingest in INGEST_PATHS.items():
+        close_session()
+        Base.metadata.drop_all(db)
+        Base.metadata.create_all(db)
+        ingest(items)
+        results[name] = _stored_tables()
+
+    expected = results.pop('per-item')
+    assert len(expected['plays']) == 300
+    for name, tables in results.items():
+        assert tables == expected, name
+
+@pytest.mark.parametrize('plays', [1, 49])
+def test_generator_keeps_a_minimum_catalog(plays):
+    items = generate_recently_played(plays)
+
+    assert len(items) == plays
+    assert all(item['track']['artists'] and item['track']['album']['artists'] for item in items)
+
+def test_benchmark_runs_each_path_in_its_own_process(tmp_path):
+    import os
+    import sys
+    import json
+    import subprocess
+
+    output = tmp_path / 'ingest.jsonl'
+    env = {**os.environ, 'SUPABASE_DB_URL': ''}
+    subprocess.run(
+        [sys.executable, '-m', 'benchmarks.ingest_benchmark', '--plays', '100', '--path', 'bulk', '--path', 'per-item', '--db-url', f"sqlite:///{tmp_path / 'bench.db'}", '--output', str(output)],
+        cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))), env=env, check=True, capture_output=True
+    )
+
+    results = [ json.loads(line) for line in output.read_text().splitlines() ]
+    assert [ result['path'] for result in results ] == ['bulk', 'per-item']
+    assert all(result['plays'] == 100 and result['peak_rss_mb'] for result in results)
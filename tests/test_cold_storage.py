@@ -0,0 +1,93 @@
+import json
+from datetime import date, datetime, timedelta, timezone
+from config.postgres import execute_query
+from utils.cold_storage import move_to_cold, iter_plays, encode_day, decode_day
+
+FIRST_DAY = datetime(2020, 1, 1, tzinfo=timezone.utc)
+
+def _tiers():
+    return execute_query("SELECT (SELECT COUNT(*) FROM spotilens__listening_history), (SELECT COALESCE(SUM(play_count), 0) FROM spotilens__listening_history_cold)")['rows'][0]
+
+def _all_plays(db):
+    with db.connect() as connection:
+        return list(iter_plays(connection))
+
+def test_moved_days_read_back_the_same_through_iter_plays(store_plays, db):
+    store_plays(300, seed=1)
+    store_plays(50, seed=1, user_id='alice')
+    before = _all_plays(db)
+
+    with db.begin() as connection:
+        stats = move_to_cold(connection, FIRST_DAY, FIRST_DAY + timedelta(days=1))
+
+    hot, cold = _tiers()
+    assert stats['plays'] == cold > 0
+    assert hot + cold == 350
+    assert _all_plays(db) == before
+    with db.connect() as connection:
+        windowed = list(iter_plays(connection, FIRST_DAY + timedelta(hours=12), FIRST_DAY + timedelta(hours=30)))
+    assert windowed == [ play for play in before if FIRST_DAY + timedelta(hours=12) <= datetime.fromtimestamp(play[0] / 1000, timezone.utc) < FIRST_DAY + timedelta(hours=30) ]
+
+def test_day_payload_round_trip():
+    plays = [ (offset_ms, offset_ms % 7 + 1, None if offset_ms % 3 else offset_ms % 240_000) for offset_ms in range(0, 86_400_000, 61_337) ]
+
+    encoded = encode_day(reversed(plays))
+
+    assert decode_day(encoded) == plays
+    assert len(encoded) < len(plays) * 12 / 2
+    assert decode_day(encode_day([])) == []
+
+def test_reading_small_batches_does_not_touch_the_callers_connection(store_plays, db):
+    store_plays(300, seed=1)
+    with db.begin() as connection:
+        move_to_cold(connection, FIRST_DAY, FIRST_DAY + timedelta(days=1))
+    before = _all_plays(db)
+
+    with db.connect() as connection:
+        options = connection.get_execution_options()
+        assert list(iter_plays(connection, batch_size=1)) == before
+        assert connection.get_execution_options() == options
+
+def test_moving_a_day_again_merges_instead_of_duplicating(store_plays, db):
+    items = store_plays(100, seed=1)
+    with db.begin() as connection:
+        move_to_cold(connection, FIRST_DAY, FIRST_DAY + timedelta(days=1))
+    # a play that reached the hot table again after its day was moved
+    execute_query(f"INSERT INTO spotilens__listening_history (track_id, played_at, entry_type) VALUES ('{items[0]['track']['id']}', '{items[0]['played_at'].replace('T', ' ').replace('Z', '')}', 'daily-sync')", commit=True)
+
+    with db.begin() as connection:
+        move_to_cold(connection, FIRST_DAY, FIRST_DAY + timedelta(days=1))
+
+    assert _tiers() == (0, 100)
+
+def test_ingest_skips_plays_already_in_the_cold_tier(store_plays, db):
+    from utils.helper import bulk_store_spotify_tracks, store_spotify_track_in_db
+
+    items = store_plays(200, seed=1)
+    with db.begin() as connection:
+        move_to_cold(connection, FIRST_DAY, FIRST_DAY + timedelta(days=2))
+    assert _tiers() == (0, 200)
+
+    assert bulk_store_spotify_tracks(items[:150], 'daily-sync') == 0
+    for item in items[150:]:
+        assert store_spotify_track_in_db(item, 'daily-sync') is None
+    # another account's plays on the same days are still new
+    assert bulk_store_spotify_tracks(items[:10], 'daily-sync', 'alice') == 10
+
+    assert _tiers() == (10, 200)
+
+def test_move_to_cold_storage_drops_the_checksums_of_moved_days(store_plays):
+    from db.models.sync_logs import SyncLog
+    from utils.tasks.retention import move_to_cold_storage
+
+    store_plays(300, seed=1)
+    tomorrow = datetime.now(timezone.utc).date() + timedelta(days=1)
+    for day in (date(2020, 1, 1), date(2020, 1, 2), tomorrow):
+        execute_query(f"INSERT INTO spotilens__daily_checksums (day, play_count, checksum) VALUES ('{day.isoformat()}', 1, 'checksum')", commit=True)
+
+    move_to_cold_storage.body(None, older_than_days=0, days_per_batch=1)
+
+    assert _tiers() == (0, 300)
+    assert [ str(row[0]) for row in execute_query("SELECT day FROM spotilens__daily_checksums")['rows'] ] == [tomorrow.isoformat()]
+    stats = json.loads(SyncLog.fetch_records(filters={'sync_source': 'cold-storage'})[0].response)
+    assert (stats['plays'], stats['days']) == (300, 2)
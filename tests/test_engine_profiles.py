@@ -0,0 +1,57 @@
+import pytest
+from sqlalchemy.pool import NullPool
+import config.postgres as postgres
+import utils.constants as constants
+
+PRIMARY_URL = 'postgresql://app@primary.example.com/spotilens?sslmode=require'
+REPLICA_URL = 'postgresql://app@replica.example.com/spotilens'
+
+@pytest.fixture
+def postgres_settings(monkeypatch):
+    monkeypatch.setattr(constants, 'SUPABASE_DB_URL', PRIMARY_URL)
+    monkeypatch.setattr(constants, 'SUPABASE_DB_READ_URL', REPLICA_URL)
+    monkeypatch.setattr(constants, 'DB_POOLER_MODE', 'session')
+
+def test_engine_setting_overrides_are_cast_to_the_default_type(monkeypatch):
+    monkeypatch.setenv('DB_BULK_LOAD_POOL_SIZE', '8')
+    monkeypatch.setenv('DB_SYNC_POOL_PRE_PING', 'false')
+    monkeypatch.setenv('DB_ANALYTICS_STATEMENT_TIMEOUT_MS', '')
+
+    assert constants.get_engine_setting('bulk-load', 'pool_size', 4) == 8
+    assert constants.get_engine_setting('sync', 'pool_pre_ping', True) is False
+    assert constants.get_engine_setting('analytics', 'statement_timeout_ms', 300_000) == 300_000
+
+def test_unknown_profile_is_rejected():
+    with pytest.raises(ValueError):
+        postgres.get_engine('reporting')
+
+def test_analytics_reads_from_the_replica(postgres_settings):
+    analytics_url, analytics_settings, _ = postgres._engine_config('analytics')
+    bulk_url, _, bulk_kwargs = postgres._engine_config('bulk-load')
+
+    assert (analytics_url, analytics_settings['read_only']) == (REPLICA_URL, True)
+    assert bulk_url == PRIMARY_URL
+    assert (bulk_kwargs['pool_size'], bulk_kwargs['pool_pre_ping']) == (4, False)
+    assert bulk_kwargs['connect_args']['application_name'] == 'spotilens:bulk-load'
+    assert 'options' not in bulk_kwargs['connect_args']
+
+def test_statement_timeout_is_a_startup_option_on_direct_connections(postgres_settings):
+    _, _, engine_kwargs = postgres._engine_config('sync')
+
+    assert engine_kwargs['connect_args']['options'] == '-c statement_timeout=30000'
+
+def test_transaction_pooler_mode_drops_the_local_pool_and_prepared_statements(postgres_settings, monkeypatch):
+    monkeypatch.setattr(constants, 'DB_POOLER_MODE', 'transaction')
+
+    _, _, engine_kwargs = postgres._engine_config('sync')
+    _, _, async_kwargs = postgres._engine_config('sync', async_driver=True)
+
+    assert engine_kwargs['poolclass'] is NullPool
+    assert engine_kwargs['pool_pre_ping'] is False
+    assert 'options' not in engine_kwargs['connect_args']
+    assert async_kwargs['connect_args']['statement_cache_size'] == 0
+    assert async_kwargs['connect_args']['prepared_statement_name_func']() != async_kwargs['connect_args']['prepared_statement_name_func']()
+
+def test_async_urls():
+    assert postgres._to_async_url(PRIMARY_URL) == 'postgresql+asyncpg://app@primary.example.com/spotilens?ssl=require'
+    assert postgres._to_async_url('sqlite:////tmp/spotilens.db') == 'sqlite+aiosqlite:////tmp/spotilens.db'
@@ -0,0 +1,102 @@
+import json
+from datetime import datetime, timedelta
+from config.postgres import execute_query
+from benchmarks.payload_generator import generate_recently_played
+from utils.extended_history import parse_export_file, resolve_tracks, build_items, without_stored_plays
+
+class FakeSpotifyService:
+    """Resolves ids from a catalog, ids outside it are unknown to Spotify"""
+    TRACKS_BATCH_SIZE = 50
+
+    def __init__(self, catalog):
+        self.catalog = catalog
+        self.requested = []
+
+    def fetch_tracks(self, track_ids):
+        self.requested.extend(track_ids)
+        return { track_id: self.catalog.get(track_id) for track_id in track_ids }
+
+def _entry(track_id, ts, ms_played=180000, **fields):
+    return {
+        'ts': ts, 'ms_played': ms_played, 'spotify_track_uri': f"spotify:track:{track_id}" if track_id else None,
+        'master_metadata_track_name': 'Track', 'ip_addr': '10.0.0.1', 'username': 'someone', **fields
+    }
+
+def _export_ts(played_at, shift_seconds=0):
+    # the export has whole-second UTC timestamps
+    value = datetime.fromisoformat(played_at.replace('Z', '+00:00')) + timedelta(seconds=shift_seconds)
+    return value.strftime('%Y-%m-%dT%H:%M:%SZ')
+
+def test_parse_keeps_track_plays_long_enough_and_drops_personal_fields(tmp_path):
+    path = tmp_path / 'Streaming_History_Audio_2023.json'
+    path.write_text(json.dumps([
+        _entry('track-1', '2023-01-01T10:00:00Z', shuffle=True, platform='android', skipped=None),
+        _entry('track-2', '2023-01-01T10:05:00Z', ms_played=29999),
+        _entry(None, '2023-01-01T10:10:00Z', spotify_episode_uri='spotify:episode:1'),
+        _entry('track-3', '2023-01-01T10:20:00Z', ms_played=None)
+    ]))
+
+    plays, stats = parse_export_file(str(path))
+
+    assert plays == [('track-1', '2023-01-01T10:00:00Z', 180000, {'shuffle': True, 'platform': 'android'})]
+    assert stats == {'entries': 4, 'not_a_track': 1, 'too_short': 2}
+    assert len(parse_export_file(str(path), min_ms_played=0)[0]) == 3
+
+def test_tracks_come_from_the_archive_before_the_api(store_plays):
+    archived = store_plays(10, seed=1)
+    archived_track = archived[0]['track']
+    relinked = {**generate_recently_played(1, seed=2)[0]['track'], 'id': 'relinked-id'}
+    spotify_service = FakeSpotifyService({'new-track': relinked})
+
+    tracks, stats = resolve_tracks([archived_track['id'], 'new-track', 'gone-track', 'new-track'], spotify_service)
+
+    assert spotify_service.requested == ['new-track', 'gone-track']
+    assert tracks[archived_track['id']] == archived_track
+    assert tracks['new-track'] == {**relinked, 'id': 'new-track'}
+    assert 'gone-track' not in tracks
+    assert stats == {'from_archive': 1, 'from_api': 1, 'unresolved': 1, 'api_calls': 1}
+    assert build_items([('gone-track', '2023-01-01T10:00:00Z', 60000, {})], tracks) == []
+
+def test_plays_within_the_tolerance_of_a_stored_play_are_dropped(store_plays):
+    stored = store_plays(3, seed=1)
+    other_track = next(item['track'] for item in generate_recently_played(50, seed=1) if item['track']['id'] != stored[0]['track']['id'])
+    items = [
+        {**stored[0], 'played_at': _export_ts(stored[0]['played_at'], 3)},
+        {**stored[0], 'track': other_track, 'played_at': _export_ts(stored[0]['played_at'])},
+        {**stored[1], 'played_at': _export_ts(stored[1]['played_at'], -10)},
+        {**stored[2], 'played_at': _export_ts(stored[2]['played_at'], -4)}
+    ]
+    items.sort(key=lambda item: item['played_at'])
+
+    remaining, dropped = without_stored_plays(items, None)
+
+    assert dropped == 2
+    assert sorted((item['track']['id'], item['played_at']) for item in remaining) == sorted([
+        (other_track['id'], _export_ts(stored[0]['played_at'])), (stored[1]['track']['id'], _export_ts(stored[1]['played_at'], -10))
+    ])
+    # another account's plays never match
+    assert without_stored_plays(items, 'alice') == (items, 0)
+
+def test_import_extended_history_skips_plays_already_synced(store_plays, tmp_path, monkeypatch):
+    import utils.spotify_service
+    from utils.tasks.one_time_tasks import import_extended_history
+    from db.models.sync_logs import SyncLog
+
+    synced = store_plays(5, seed=1)
+    exported = generate_recently_played(8, seed=3)
+    spotify_service = FakeSpotifyService({ item['track']['id']: item['track'] for item in exported })
+    monkeypatch.setattr(utils.spotify_service, 'SpotifyService', lambda: spotify_service)
+    (tmp_path / 'Streaming_History_Audio_2023_0.json').write_text(json.dumps(
+        [ _entry(item['track']['id'], _export_ts(item['played_at'], 1)) for item in synced ] + [ _entry('episode', '2023-01-01T10:00:00Z', ms_played=1000) ]
+    ))
+    (tmp_path / 'Streaming_History_Audio_2023_1.json').write_text(json.dumps(
+        [ _entry(item['track']['id'], _export_ts(item['played_at']), ms_played=120000 + i, reason_end='trackdone') for i, item in enumerate(exported) ]
+    ))
+
+    import_extended_history.body(None, path=str(tmp_path), workers=2)
+
+    rows = execute_query("SELECT entry_type, ms_played FROM spotilens__listening_history WHERE entry_type = 'extended-history' ORDER BY ms_played")['rows']
+    assert rows == [ ('extended-history', 120000 + i) for i in range(8) ]
+    assert execute_query("SELECT COUNT(*) FROM spotilens__listening_history")['rows'] == [(13,)]
+    stats = json.loads(SyncLog.fetch_records(filters={'sync_source': 'extended-history-import'})[0].response)
+    assert (stats['files'], stats['entries'], stats['too_short'], stats['skipped_stored'], stats['inserted']) == (2, 14, 1, 5, 8)
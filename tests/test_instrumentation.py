@@ -0,0 +1,57 @@
+from sqlalchemy import text
+from utils.instrumentation import QueryRecorder, SyncMetrics, normalize_statement
+
+def test_query_recorder_groups_statements_by_shape(db):
+    recorder = QueryRecorder(db)
+    recorder.start()
+    try:
+        with db.connect() as connection:
+            for track_ids in (['a'], ['a', 'b', 'c']):
+                connection.execute(text(f"SELECT * FROM spotilens__tracks WHERE track_id IN ({', '.join(repr(track_id) for track_id in track_ids)})"))
+            connection.execute(text("SELECT COUNT(*) FROM spotilens__albums"))
+    finally:
+        recorder.stop()
+
+    assert recorder.count == 3
+    top_statement = recorder.top_statements(key='count')[0]
+    assert (top_statement['statement'], top_statement['count']) == ('SELECT * FROM spotilens__tracks WHERE track_id IN (...)', 2)
+
+def test_query_recorder_stops_counting_once_stopped(db):
+    recorder = QueryRecorder(db)
+    recorder.start()
+    recorder.stop()
+
+    with db.connect() as connection:
+        connection.execute(text("SELECT 1"))
+
+    assert recorder.count == 0
+
+def test_normalize_statement_collapses_whitespace_and_in_lists():
+    assert normalize_statement("SELECT *\n  FROM t\n  WHERE id IN (?, ?, ?)") == 'SELECT * FROM t WHERE id IN (...)'
+
+def test_sync_metrics_summary(db):
+    metrics = SyncMetrics('recently-played-api')
+    with metrics.recording(db):
+        with metrics.stage('fetch'):
+            metrics.record_http('recently_played', 0.25, 200)
+            metrics.record_http('recently_played', 0.5, 429)
+        with metrics.stage('store'), db.connect() as connection:
+            connection.execute(text("SELECT 1"))
+
+    summary = metrics.summary()
+
+    assert set(summary['stages']) == {'fetch', 'store'}
+    assert summary['http'] == {'recently_played': {'count': 2, 'total_time': 0.75, 'errors': 1}}
+    assert summary['db']['queries'] == 1
+
+def test_prometheus_textfile(tmp_path):
+    metrics = SyncMetrics('recently-played-api')
+    with metrics.stage('fetch'):
+        metrics.record_http('recently_played', 0.25, 200)
+
+    metrics.write_prometheus_textfile(str(tmp_path))
+
+    lines = (tmp_path / 'spotilens_recently_played_api.prom').read_text().splitlines()
+    assert 'spotilens_sync_http_requests{sync_source="recently-played-api",endpoint="recently_played"} 1' in lines
+    assert 'spotilens_sync_db_queries{sync_source="recently-played-api"} 0' in lines
+    assert not list(tmp_path.glob('*.tmp'))
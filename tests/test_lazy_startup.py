@@ -0,0 +1,48 @@
+import os
+import sys
+import json
+import subprocess
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+def _run(code, cwd, **env):
+    # a fresh interpreter without database settings, like `invoke --list` on a new checkout (set but
+    # empty, so a developer's .env cannot fill them in)
+    result = subprocess.run(
+        [sys.executable, '-c', code], env={**os.environ, 'SUPABASE_DB_URL': '', 'SUPABASE_DB_READ_URL': '', **env, 'PYTHONPATH': REPO_DIR},
+        capture_output=True, text=True, check=True, cwd=cwd
+    )
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+def test_building_the_task_collection_needs_no_database_and_no_heavy_imports(tmp_path):
+    loaded = _run(
+        "import sys, json, tasks; print(json.dumps([ name for name in ('sqlalchemy', 'requests', 'httpx', 'db.models.base_model') if name in sys.modules ]))",
+        tmp_path
+    )
+
+    assert loaded == []
+    assert not (tmp_path / 'log').exists()
+
+def test_missing_database_url_fails_only_when_it_is_used(tmp_path):
+    result = _run(
+        "import json, utils.constants as constants, config.postgres\n"
+        "try:\n"
+        "    config.postgres.get_engine()\n"
+        "except RuntimeError as e:\n"
+        "    print(json.dumps(str(e)))",
+        tmp_path
+    )
+
+    assert 'SUPABASE_DB_URL is not set' in result
+
+def test_log_file_is_created_on_the_first_record(tmp_path):
+    _run("import json; from config.logger import logger; logger.info('hello'); print(json.dumps(None))", tmp_path)
+
+    assert len(list((tmp_path / 'log').glob('spotilens.*.log'))) == 1
+
+def test_engines_are_built_once_per_profile(db):
+    from config.postgres import get_engine
+
+    assert get_engine('sync') is get_engine('sync') is db
+    assert get_engine('bulk-load') is get_engine('bulk-load')
+    assert get_engine('bulk-load') is not get_engine('sync')
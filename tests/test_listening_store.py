@@ -0,0 +1,70 @@
+import pytest
+from collections import Counter
+from datetime import datetime
+from utils.listening_store import ListeningStore
+
+def _played_at(item):
+    return datetime.fromisoformat(item['played_at'].replace('Z', '+00:00'))
+
+def _plays(rows, key):
+    return { row[key]: row['plays'] for row in rows }
+
+@pytest.fixture
+def plays(store_plays):
+    # one seed so both accounts play the same catalog, the tables keep one album per track
+    return store_plays(300, seed=1) + store_plays(100, seed=1, user_id='alice')
+
+def test_build_counts_match_the_stored_plays(plays):
+    store = ListeningStore.build()
+
+    assert len(store) == store.count() == 400
+    assert _plays(store.top_tracks(limit=1000), 'track_id') == Counter(item['track']['id'] for item in plays)
+    assert _plays(store.top_albums(limit=1000), 'album_id') == Counter(item['track']['album']['id'] for item in plays)
+    assert _plays(store.top_artists(limit=1000), 'artist_id') == Counter(artist['id'] for item in plays for artist in item['track']['artists'])
+    track = plays[0]['track']
+    assert { row['track_id']: row['name'] for row in store.top_tracks(limit=1000) }[track['id']] == track['name']
+
+def test_time_windows_and_users_filter_the_plays(plays):
+    store = ListeningStore.build()
+    played_at = sorted(_played_at(item) for item in plays)
+    start, end = played_at[50], played_at[250]
+
+    assert store.count(start, end) == sum(1 for value in played_at if start <= value < end)
+    # naive datetimes are UTC
+    assert store.count(start.replace(tzinfo=None), end.replace(tzinfo=None)) == store.count(start, end)
+    assert store.count(user_id='alice') == 100
+    assert store.count(start, end, user_id='alice') == sum(1 for item in plays[300:] if start <= _played_at(item) < end)
+    assert store.count(user_id='nobody') == 0
+    assert _plays(store.top_tracks(limit=1000, user_id='alice'), 'track_id') == Counter(item['track']['id'] for item in plays[300:])
+
+def test_group_by_time_buckets(plays):
+    store = ListeningStore.build()
+
+    assert store.group_by('hour') == Counter(_played_at(item).hour for item in plays)
+    assert store.group_by('weekday') == Counter(_played_at(item).weekday() for item in plays)
+    with pytest.raises(ValueError):
+        store.group_by('month')
+
+def test_snapshot_round_trip(plays, tmp_path):
+    path = str(tmp_path / 'listening.store')
+    built = ListeningStore.build()
+    built.save(path)
+
+    opened = ListeningStore.open(path)
+
+    assert len(opened) == len(built)
+    assert opened.top_tracks(limit=1000) == built.top_tracks(limit=1000)
+    assert opened.top_artists(limit=1000, user_id='alice') == built.top_artists(limit=1000, user_id='alice')
+    assert opened.group_by('day') == built.group_by('day')
+    assert not (tmp_path / 'listening.store.tmp').exists()
+
+def test_unreadable_snapshot_is_rebuilt(plays, tmp_path):
+    path = tmp_path / 'listening.store'
+    path.write_bytes(b'not a snapshot')
+
+    with pytest.raises(ValueError):
+        ListeningStore.open(str(path))
+    store = ListeningStore.load_or_build(str(path))
+
+    assert len(store) == 400
+    assert len(ListeningStore.open(str(path))) == 400
@@ -0,0 +1,57 @@
+import os
+import sys
+import logging
+import subprocess
+import config.logger
+from config.logger import SamplingFilter, _parse_sample_limits
+
+def _record(sample_key=None):
+    record = logging.LogRecord('test', logging.INFO, __file__, 1, 'message', None, None)
+    if sample_key:
+        record.sample_key = sample_key
+    return record
+
+def test_sampling_filter_lets_through_limit_records_per_interval(monkeypatch):
+    now = [100.0]
+    monkeypatch.setattr(config.logger.time, 'monotonic', lambda: now[0])
+    sampling_filter = SamplingFilter(default_limit=2, interval=60)
+
+    assert [ sampling_filter.filter(_record('play.processed')) for _ in range(4) ] == [True, True, False, False]
+    now[0] += 60
+    assert sampling_filter.filter(_record('play.processed'))
+    assert sampling_filter.pop_counts() == {'play.processed': {'seen': 5, 'suppressed': 2}}
+    assert sampling_filter.pop_counts() == {}
+
+def test_sampling_filter_per_key_limits():
+    sampling_filter = SamplingFilter(default_limit=1, interval=60, limits={'artist.found': 0, 'history.created': -1})
+
+    assert not sampling_filter.filter(_record('artist.found'))
+    assert all(sampling_filter.filter(_record('history.created')) for _ in range(100))
+    assert all(sampling_filter.filter(_record()) for _ in range(100))
+
+def test_parse_sample_limits():
+    assert _parse_sample_limits(' artist.found=0, track.found=5 ,') == {'artist.found': 0, 'track.found': 5}
+    assert _parse_sample_limits('') == {}
+    assert _parse_sample_limits(None) == {}
+
+def test_log_batch_summary_reports_and_resets_counts(monkeypatch):
+    lines = []
+    sampling_filter = SamplingFilter(default_limit=1, interval=60)
+    monkeypatch.setattr(config.logger, 'sampling_filter', sampling_filter)
+    monkeypatch.setattr(config.logger.logger, 'log', lambda level, message: lines.append(message))
+    for _ in range(3):
+        sampling_filter.filter(_record('track.found'))
+
+    config.logger.log_batch_summary('Processed 3/3 items')
+    config.logger.log_batch_summary('Processed 3/3 items')
+
+    assert lines == ['Processed 3/3 items: track.found=3 (2 suppressed)']
+
+def test_empty_sampling_settings_fall_back_to_the_defaults():
+    env = {**os.environ, 'LOG_SAMPLE_LIMIT': '', 'LOG_SAMPLE_INTERVAL': ''}
+    output = subprocess.run(
+        [sys.executable, '-c', 'import utils.constants as c; print(c.LOG_SAMPLE_LIMIT, c.LOG_SAMPLE_INTERVAL)'],
+        env=env, capture_output=True, text=True, check=True, cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    ).stdout
+
+    assert output.split() == ['20', '60.0']
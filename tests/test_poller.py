@@ -0,0 +1,77 @@
+import json
+from utils.tasks import poller
+
+class FakeSpotifyService:
+    def __init__(self, pages):
+        self.pages = list(pages)
+
+    def fetch_recently_played(self, limit, cutoff_timestamp=None):
+        return {'items': self.pages.pop(0) if self.pages else []}
+
+class StopAfter:
+    """Stands in for the poller's stop event, records each wait and stops after `polls` polls"""
+    def __init__(self, polls):
+        self.polls = polls
+        self.waits = []
+
+    def is_set(self):
+        return len(self.waits) >= self.polls
+
+    def wait(self, interval):
+        self.waits.append(interval)
+
+def test_poll_once_stores_new_items_and_spools_the_ones_it_cannot_store(db, tmp_path, monkeypatch):
+    from utils.spool import Spool
+    from db.models.sync_logs import SyncLog
+    from config.postgres import execute_query
+    from benchmarks.payload_generator import generate_recently_played
+
+    monkeypatch.setattr(poller.constants, 'SPOOL_DIR', str(tmp_path))
+    items = generate_recently_played(5, seed=1)
+    # plays of one track share the dict, break only this play
+    items[2] = {**items[2], 'track': {**items[2]['track'], 'artists': []}}
+
+    polled = poller._poll_once(FakeSpotifyService([list(reversed(items))]), None)
+
+    assert [ item['played_at'] for item in polled ] == [ item['played_at'] for item in items ]
+    assert execute_query("SELECT COUNT(*) FROM spotilens__listening_history")['rows'] == [(4,)]
+    spooled = [ record['payload'] for segment in Spool(str(tmp_path)).segments() for record in Spool(str(tmp_path)).read_segment(segment) ]
+    assert spooled == [items[2]]
+    sync_log = SyncLog.fetch_records(filters={'sync_source': 'recently-played-poller'})[0]
+    assert json.loads(sync_log.response) == {'items': 5, 'failed': 1, 'cursor': items[-1]['played_at']}
+
+def test_cursor_follows_the_default_account_only(store_plays):
+    assert poller._latest_played_at() is None
+
+    default_items = store_plays(10, seed=1)
+    store_plays(10, seed=2, user_id='other-account')
+
+    assert poller._latest_played_at() == default_items[-1]['played_at']
+
+def test_poller_backs_off_when_idle_and_resets_on_new_plays(db, monkeypatch):
+    import utils.spotify_service
+
+    page = [{'played_at': '2024-03-01T10:00:00.000Z'}]
+    spotify_service = FakeSpotifyService([])
+    polls = iter([page, [], [], [], page, []])
+    stop_event = StopAfter(polls=6)
+    monkeypatch.setattr(utils.spotify_service, 'SpotifyService', lambda: spotify_service)
+    monkeypatch.setattr(poller, '_install_signal_handlers', lambda stop_event: None)
+    monkeypatch.setattr(poller.threading, 'Event', lambda: stop_event)
+    monkeypatch.setattr(poller, '_poll_once', lambda spotify_service, cursor: next(polls))
+
+    poller.poll_recently_played.body(None, min_interval=60, max_interval=200)
+
+    assert stop_event.waits == [60, 120, 200, 200, 60, 120]
+
+def test_poller_never_waits_longer_than_the_recently_played_window(db, monkeypatch):
+    import utils.spotify_service
+
+    stop_event = StopAfter(polls=8)
+    monkeypatch.setattr(utils.spotify_service, 'SpotifyService', lambda: FakeSpotifyService([]))
+    monkeypatch.setattr(poller, '_install_signal_handlers', lambda stop_event: None)
+    monkeypatch.setattr(poller.threading, 'Event', lambda: stop_event)
+
+    poller.poll_recently_played.body(None, min_interval=60, max_interval=3600)
+
+    assert max(stop_event.waits) == poller.MAX_SAFE_INTERVAL < 50 * 30
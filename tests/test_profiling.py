@@ -0,0 +1,49 @@
+import os
+import sys
+import inspect
+import subprocess
+from sqlalchemy import text
+from invoke.tasks import task
+from invoke.collection import Collection
+import utils.profiling as profiling
+
+def test_add_profile_option_exposes_a_profile_flag():
+    @task()
+    def sync(ctx, batch_size=500):
+        return batch_size
+
+    collection = profiling.add_profile_option(Collection(sync, Collection('nested', sync)))
+
+    assert 'profile' in inspect.signature(collection.tasks['sync'].body).parameters
+    assert 'profile' in inspect.signature(collection.collections['nested'].tasks['sync'].body).parameters
+    assert collection.tasks['sync'].body(None, batch_size=3) == 3
+
+def test_profiled_run_reports_n_plus_one_statements(db, tmp_path, monkeypatch):
+    warnings = []
+    monkeypatch.setattr(profiling, 'PROFILE_DIR', str(tmp_path))
+    monkeypatch.setattr(profiling.constants, 'PROFILE_N_PLUS_ONE_THRESHOLD', 5)
+    monkeypatch.setattr(profiling.logger, 'warning', warnings.append)
+
+    @profiling.profileable
+    def n_plus_one(ctx, lookups):
+        with db.connect() as connection:
+            for track_id in range(lookups):
+                connection.execute(text("SELECT name FROM spotilens__tracks WHERE track_id = :track_id"), {'track_id': str(track_id)})
+        return lookups
+
+    assert n_plus_one(None, 10, profile=True) == 10
+    assert len(list(tmp_path.glob('n_plus_one.*.prof'))) == 1
+    assert len(warnings) == 1 and 'ran 10 times (threshold 5)' in warnings[0]
+
+    warnings.clear()
+    n_plus_one(None, 5, profile=True)
+    assert warnings == []
+
+def test_empty_threshold_falls_back_to_the_default():
+    env = {**os.environ, 'PROFILE_N_PLUS_ONE_THRESHOLD': ''}
+    output = subprocess.run(
+        [sys.executable, '-c', 'import utils.constants as c; print(c.PROFILE_N_PLUS_ONE_THRESHOLD)'],
+        env=env, capture_output=True, text=True, check=True, cwd=os.path.dirname(os.path.dirname(__file__))
+    ).stdout
+
+    assert output.strip() == '20'
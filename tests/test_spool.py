@@ -0,0 +1,150 @@
+import os
+import pytest
+from sqlalchemy.exc import OperationalError
+from utils.spool import Spool, MAX_LOAD_ATTEMPTS
+from benchmarks.payload_generator import generate_recently_played
+
+@pytest.fixture
+def spool(tmp_path):
+    return Spool(str(tmp_path / 'spool'))
+
+def _stored_plays():
+    from config.postgres import execute_query
+    return execute_query("SELECT COUNT(*) FROM spotilens__listening_history")['rows'][0][0]
+
+def test_append_writes_segments_in_fetch_order(spool):
+    items = generate_recently_played(4, seed=1)
+
+    first = spool.append(items[:2], 'daily-sync')
+    second = spool.append(items[2:], 'daily-sync', user_id='alice')
+
+    assert spool.segments() == [first, second]
+    assert [ record['payload'] for record in spool.read_segment(first) ] == items[:2]
+    assert { record['user_id'] for record in spool.read_segment(second) } == {'alice'}
+    assert not [ name for name in os.listdir(spool.directory) if name.endswith('.tmp') ]
+    assert spool.append([], 'daily-sync') is None
+
+def test_drain_removes_segments_only_after_they_loaded(spool):
+    for start in range(0, 6, 2):
+        spool.append(generate_recently_played(6, seed=1)[start:start + 2], 'daily-sync')
+    loaded = []
+
+    stats = spool.drain(lambda records: loaded.append(len(records)), batch_size=4)
+
+    assert loaded == [4, 2]
+    assert (stats['segments'], stats['records'], stats['batches']) == (3, 6, 2)
+    assert spool.segments() == []
+
+def test_a_bad_segment_is_retried_then_quarantined_without_blocking_the_others(spool):
+    _, bad, _ = [ spool.append([{'played_at': str(i)}], 'daily-sync') for i in range(3) ]
+    loaded = []
+    def load(records):
+        if any(record['payload']['played_at'] == '1' for record in records):
+            raise ValueError('bad payload')
+        loaded.extend(record['payload']['played_at'] for record in records)
+
+    for attempt in range(1, MAX_LOAD_ATTEMPTS + 1):
+        stats = spool.drain(load)
+        assert stats['failed'] == 1
+        assert stats['quarantined'] == (1 if attempt == MAX_LOAD_ATTEMPTS else 0)
+
+    assert loaded == ['0', '2']
+    assert spool.segments() == []
+    assert os.listdir(spool.quarantine_directory) == [os.path.basename(bad)]
+
+def test_transient_errors_leave_every_segment_for_the_next_run(spool):
+    segment = spool.append([{'played_at': '0'}], 'daily-sync')
+    def load(records):
+        raise OperationalError('INSERT', {}, Exception('could not connect to server'))
+
+    for _ in range(MAX_LOAD_ATTEMPTS + 1):
+        with pytest.raises(OperationalError):
+            spool.drain(load, transient_errors=(OperationalError,))
+
+    assert spool.segments() == [segment]
+    assert not os.path.exists(spool.quarantine_directory)
+
+def test_unreadable_segment_is_quarantined(spool):
+    spool.append([{'played_at': '0'}], 'daily-sync')
+    corrupt = os.path.join(spool.directory, '0-corrupt-daily-sync.jsonl.gz')
+    with open(corrupt, 'wb') as f:
+        f.write(b'not gzip')
+
+    stats = spool.drain(lambda records: None)
+
+    assert stats['segments'] == 1
+    assert os.listdir(spool.quarantine_directory) == [os.path.basename(corrupt)]
+
+def test_concurrent_drain_is_skipped(spool):
+    spool.append([{'played_at': '0'}], 'daily-sync')
+
+    with spool._lock():
+        stats = spool.drain(lambda records: None)
+
+    assert stats['segments'] == 0
+    assert len(spool.segments()) == 1
+
+def test_drain_spool_loads_a_batch_in_one_transaction(db, tmp_path, monkeypatch):
+    import utils.helper
+    from utils.tasks import daily_sync
+
+    spool = Spool(str(tmp_path / 'spool'))
+    monkeypatch.setattr(daily_sync, '_get_spool', lambda: spool)
+    items = generate_recently_played(10, seed=5)
+    spool.append(items[:5], 'daily-sync')
+    spool.append(items[5:], 'daily-sync', user_id='alice')
+
+    # the second group of the batch fails once; the first must not have been committed by then
+    write_bulk_rows, calls, stored_after_failure = utils.helper.write_bulk_rows, [], []
+    def write_failing_once(connection, rows):
+        calls.append(rows['user_id'])
+        if len(calls) == 2:
+            raise ValueError('constraint violated')
+        if len(calls) == 3:
+            stored_after_failure.append(_stored_plays())
+        return write_bulk_rows(connection, rows)
+    monkeypatch.setattr(utils.helper, 'write_bulk_rows', write_failing_once)
+
+    stats = daily_sync._drain_spool()
+
+    assert calls == [None, 'alice', None, 'alice']
+    assert stored_after_failure == [0]
+    assert (stats['segments'], stats['failed']) == (2, 0)
+    assert _stored_plays() == 10
+
+def test_stored_plays_are_matched_by_exact_key(store_plays):
+    from utils.helper import bulk_store_spotify_tracks
+
+    items = store_plays(20)
+    other_track = next(item['track'] for item in items if item['track']['id'] != items[0]['track']['id'])
+    same_time_other_track = {**items[0], 'track': other_track}
+
+    assert bulk_store_spotify_tracks(items, 'daily-sync') == 0
+    assert bulk_store_spotify_tracks([same_time_other_track], 'daily-sync') == 1
+
+def test_sync_that_cannot_load_its_segment_is_logged_as_failed(db, tmp_path, monkeypatch):
+    import json
+    import utils.helper
+    from sqlalchemy.exc import IntegrityError
+    from utils.tasks import daily_sync
+    from utils.instrumentation import SyncMetrics
+    from db.models.sync_logs import SyncLog
+
+    class FakeSpotifyService:
+        def fetch_recently_played(self):
+            return {'items': generate_recently_played(5, seed=5)}
+
+    spool = Spool(str(tmp_path / 'spool'))
+    monkeypatch.setattr(daily_sync, '_get_spool', lambda: spool)
+    def write_failing(connection, rows):
+        raise IntegrityError('INSERT', {}, Exception('duplicate key value'))
+    monkeypatch.setattr(utils.helper, 'write_bulk_rows', write_failing)
+
+    daily_sync._sync_recently_played(FakeSpotifyService(), SyncMetrics('recently-played-api'))
+
+    sync_log, = SyncLog.fetch_records(filters={'sync_source': 'recently-played-api'})
+    response = json.loads(sync_log.response)
+    assert int(sync_log.status) == 0  # status is a text column, sqlite stores False as '0'
+    assert response['error'] and (response['drain']['failed'], response['drain']['segments']) == (1, 0)
+    assert _stored_plays() == 0
+    assert len(spool.segments()) == 1
@@ -0,0 +1,172 @@
+import json
+import zlib
+import hashlib
+from datetime import datetime
+from config.logger import logger
+from typing import Dict, Iterator, List, Optional, Tuple, Any
+from db.models.raw_objects import RawObject
+from db.models.raw_plays import RawPlay
+
+# Raw payload archive. Every recently-played item is split into content-addressed objects: artists,
+# albums (artists replaced by references) and tracks (album and artists replaced by references), so an
+# artist that appears in thousands of plays is stored once. Plays keep their envelope (played_at,
+# context, ...) and a reference to the track object. Objects are canonical JSON, zlib-compressed.
+
+REF_KEY = '$ref'
+COMPRESSION_LEVEL = 6
+
+def canonical_json(obj: Any) -> bytes:
+    return json.dumps(obj, sort_keys=True, separators=(',', ':'), ensure_ascii=False).encode()
+
+def digest_of(body: bytes) -> str:
+    return hashlib.sha256(body).hexdigest()
+
+def decompose_track(track_data: Dict[str, Any], objects: Dict[str, Tuple[str, bytes]]) -> str:
+    """
+    Adds the track and every object nested in it to `objects` (digest -> (kind, canonical JSON)),
+    returns the track's digest
+    """
+    def put(kind: str, obj: Dict[str, Any]) -> Dict[str, str]:
+        body = canonical_json(obj)
+        digest = digest_of(body)
+        objects.setdefault(digest, (kind, body))
+        return {REF_KEY: digest}
+
+    album_data = dict(track_data.get('album') or {})
+    if 'artists' in album_data:
+        album_data['artists'] = [ put('artist', artist) for artist in album_data['artists'] ]
+
+    track = dict(track_data)
+    if 'artists' in track:
+        track['artists'] = [ put('artist', artist) for artist in track['artists'] ]
+    if 'album' in track:
+        track['album'] = put('album', album_data)
+
+    return put('track', track)[REF_KEY]
+
+def archive_rows(items: List[Dict[str, Any]], entry_type: str, user_id: Optional[str] = None) -> Dict[str, List[Dict[str, Any]]]:
+    """
+    Splits recently-played items into raw object and raw play rows, without touching the database
+    """
+    objects, plays = {}, []
+    for item in items:
+        track_data = item.get('track') or {}
+        if not track_data.get('id') or not item.get('played_at'):
+            continue
+
+        plays.append({
+            'user_id': user_id,
+            'track_id': track_data['id'],
+            'played_at': datetime.fromisoformat(item['played_at'].replace('Z', '+00:00')),
+            'entry_type': entry_type,
+            'track_digest': decompose_track(track_data, objects),
+            'envelope': { key: value for key, value in item.items() if key != 'track' }
+        })
+
+    return {
+        'raw_objects': [ {'digest': digest, 'kind': kind, 'body': body} for digest, (kind, body) in objects.items() ],
+        'raw_plays': plays
+    }
+
+def write_archive_rows(connection, rows: Dict[str, List[Dict[str, Any]]]) -> int:
+    """
+    Stores the output of archive_rows on an open connection, the caller owns the transaction.
+    Only objects the archive does not hold yet are compressed and sent. Returns the number of new objects.
+    """
+    from sqlalchemy import select
+    from utils.helper import insert_ignoring_conflicts
+
+    objects = rows['raw_objects']
+    if objects:
+        digests = [ obj['digest'] for obj in objects ]
+        stored = set(connection.execute(select(RawObject.digest).where(RawObject.digest.in_(digests))).scalars())
+        objects = [
+            {'digest': obj['digest'], 'kind': obj['kind'], 'body': zlib.compress(obj['body'], COMPRESSION_LEVEL), 'size': len(obj['body'])}
+            for obj in objects if obj['digest'] not in stored
+        ]
+        insert_ignoring_conflicts(connection, RawObject.__table__, objects)
+
+    insert_ignoring_conflicts(connection, RawPlay.__table__, rows['raw_plays'])
+    return len(objects)
+
+def archive_object(kind: str, obj: Dict[str, Any]) -> str:
+    """
+    Archives a single response object, e.g. a metadata lookup, in its own transaction
+    """
+    from config.postgres import get_engine
+
+    body = canonical_json(obj)
+    digest = digest_of(body)
+    with get_engine().begin() as connection:
+        write_archive_rows(connection, {'raw_objects': [{'digest': digest, 'kind': kind, 'body': body}], 'raw_plays': []})
+    return digest
+
+class ObjectResolver:
+    """
+    Loads archived objects by digest and expands their references, caching the decoded objects
+    """
+
+    def __init__(self, connection):
+        self.connection = connection
+        self.cache = {}
+
+    def load(self, digests: List[str]) -> None:
+        from sqlalchemy import select
+
+        missing = [ digest for digest in set(digests) if digest not in self.cache ]
+        while missing:
+            result = self.connection.execute(select(RawObject.digest, RawObject.body).where(RawObject.digest.in_(missing)))
+            for digest, body in result:
+                self.cache[digest] = json.loads(zlib.decompress(body))
+            # nested references (track -> album -> artists) are fetched a level at a time
+            missing = [ ref for digest in missing for ref in _refs(self.cache.get(digest)) if ref not in self.cache ]
+
+    def resolve(self, digest: str) -> Any:
+        if digest not in self.cache:
+            self.load([digest])
+        return self._expand(self.cache[digest])
+
+    def _expand(self, value: Any) -> Any:
+        if isinstance(value, dict):
+            if REF_KEY in value and len(value) == 1:
+                return self.resolve(value[REF_KEY])
+            return { key: self._expand(nested) for key, nested in value.items() }
+        if isinstance(value, list):
+            return [ self._expand(nested) for nested in value ]
+        return value
+
+def iter_archived_items(connection, start_id: int, end_id: int) -> Iterator[Tuple[str, Optional[str], Dict[str, Any]]]:
+    """
+    Rebuilds the original recently-played items of raw plays with start_id <= id < end_id, in id order,
+    as (entry_type, user_id, item)
+    """
+    from sqlalchemy import select
+
+    plays = connection.execute(
+        select(RawPlay.entry_type, RawPlay.user_id, RawPlay.track_digest, RawPlay.envelope)
+        .where(RawPlay.id >= start_id, RawPlay.id < end_id)
+        .order_by(RawPlay.id)
+    ).all()
+
+    resolver = ObjectResolver(connection)
+    resolver.load([ play.track_digest for play in plays ])
+    for play in plays:
+        yield play.entry_type, play.user_id, {**play.envelope, 'track': resolver.resolve(play.track_digest)}
+
+def _refs(value: Any) -> Iterator[str]:
+    if isinstance(value, dict):
+        if REF_KEY in value and len(value) == 1:
+            yield value[REF_KEY]
+        else:
+            for nested in value.values():
+                yield from _refs(nested)
+    elif isinstance(value, list):
+        for nested in value:
+            yield from _refs(nested)
+
+def log_archive_stats(connection) -> None:
+    from sqlalchemy import select, func
+
+    objects, size, compressed = connection.execute(select(func.count(), func.sum(RawObject.size), func.sum(func.length(RawObject.body)))).one()
+    plays = connection.execute(select(func.count()).select_from(RawPlay)).scalar()
+    logger.info(f"Archive holds {plays} plays and {objects} objects, {(compressed or 0) / 1024 / 1024:.1f} MiB compressed from {(size or 0) / 1024 / 1024:.1f} MiB")
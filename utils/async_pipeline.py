@@ -0,0 +1,97 @@
+import asyncio
+from config.logger import logger
+from typing import AsyncIterable, Dict, List, Optional, Tuple, Any
+from utils.helper import prepare_bulk_rows, write_bulk_rows
+
+_DONE = object()
+
+class IngestPipeline:
+    """
+    Bounded producer/consumer ingest on asyncio. Producers put fetched pages on a queue holding at most
+    `queue_size` pages, so they block (backpressure) whenever the consumer falls behind. The consumer
+    groups pages into batches of about `batch_size` plays and writes each batch in one transaction on the
+    async engine while the producers keep fetching; a partial batch is flushed after `flush_interval`
+    seconds without new pages. Fetches only overlap writes when there is more than one page or source:
+    recently-played serves at most 50 plays, so a single account's sync is usually one page, and its
+    items already carry full track objects, there is no metadata fetch to overlap. A failing source is
+    logged and skipped, a failing write or a cancellation stops the whole pipeline and rolls back the
+    open transaction.
+
+    With a `spool`, every page is spooled before it is queued and its segment is removed once the page
+    is committed, anything left behind is picked up by `invoke daily-sync.drain-spool`.
+    """
+
+    def __init__(self, engine, entry_type: str = 'daily-sync', batch_size: int = 500, queue_size: int = 8, flush_interval: float = 1.0, spool: Optional[Any] = None):
+        self.engine = engine
+        self.entry_type = entry_type
+        self.batch_size = batch_size
+        self.queue_size = queue_size
+        self.flush_interval = flush_interval
+        self.spool = spool
+        self.stats = {'pages': 0, 'fetched': 0, 'inserted': 0, 'batches': 0, 'errors': {}}
+
+    async def run(self, sources: List[Tuple[Optional[str], AsyncIterable[List[Dict[str, Any]]]]]) -> Dict[str, Any]:
+        """
+        `sources` pairs a user_id (None for the default account) with an async iterable of item pages
+        """
+        queue = asyncio.Queue(maxsize=self.queue_size)
+        async with asyncio.TaskGroup() as group:
+            group.create_task(self._consume(queue))
+            async with asyncio.TaskGroup() as producers:
+                for user_id, pages in sources:
+                    producers.create_task(self._produce(queue, user_id, pages))
+            await queue.put(_DONE)
+
+        return self.stats
+
+    async def _produce(self, queue: asyncio.Queue, user_id: Optional[str], pages: AsyncIterable[List[Dict[str, Any]]]) -> None:
+        try:
+            async for items in pages:
+                segment_path = await asyncio.to_thread(self.spool.append, items, self.entry_type, user_id) if self.spool else None
+                await queue.put((user_id, items, segment_path))
+                self.stats['pages'] += 1
+                self.stats['fetched'] += len(items)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error(f"Fetching for {user_id or 'default account'} failed: {str(e)}")
+            self.stats['errors'][user_id or ''] = str(e)
+
+    async def _consume(self, queue: asyncio.Queue) -> None:
+        pending = []
+        pending_plays = 0
+        while True:
+            try:
+                page = await asyncio.wait_for(queue.get(), self.flush_interval) if pending else await queue.get()
+            except TimeoutError:
+                await self._flush(pending)
+                pending, pending_plays = [], 0
+                continue
+
+            if page is _DONE:
+                break
+
+            pending.append(page)
+            pending_plays += len(page[1])
+            if pending_plays >= self.batch_size:
+                await self._flush(pending)
+                pending, pending_plays = [], 0
+
+        if pending:
+            await self._flush(pending)
+
+    async def _flush(self, pages: List[tuple]) -> None:
+        items_by_user = {}
+        for user_id, items, _ in pages:
+            items_by_user.setdefault(user_id, []).extend(items)
+        rows_by_user = { user_id: prepare_bulk_rows(sorted(items, key=lambda x: x['played_at']), self.entry_type, user_id) for user_id, items in items_by_user.items() }
+
+        async with self.engine.begin() as connection:
+            for rows in rows_by_user.values():
+                if rows['plays']:
+                    self.stats['inserted'] += await connection.run_sync(write_bulk_rows, rows)
+
+        self.stats['batches'] += 1
+
+        if self.spool:
+            await asyncio.to_thread(self.spool.remove, [ segment_path for _, _, segment_path in pages if segment_path ])
@@ -0,0 +1,103 @@
+import httpx
+import asyncio
+import time
+from datetime import datetime
+from config.logger import logger
+from utils.spotify_service import RequestBudget, SpotifyClientBase
+from typing import AsyncIterator, Callable, Dict, List, Optional, Any
+
+class AsyncSpotifyService(SpotifyClientBase):
+    """
+    asyncio counterpart of SpotifyService on httpx, sharing its token, retry and budget logic. Pass a
+    shared `client` to reuse one connection pool across accounts; otherwise the service owns its
+    client and `aclose` closes it.
+    """
+
+    def __init__(self, metrics: Optional[Any] = None, refresh_token: Optional[str] = None, request_budget: Optional[RequestBudget] = None, client: Optional[httpx.AsyncClient] = None, on_refresh_token: Optional[Callable[[str], None]] = None):
+        super().__init__(metrics, refresh_token, request_budget, on_refresh_token)
+        self.owns_client = client is None
+        self.http = client or httpx.AsyncClient(timeout=30)
+        self._token_lock = asyncio.Lock()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.aclose()
+
+    async def aclose(self) -> None:
+        if self.owns_client:
+            await self.http.aclose()
+
+    async def _get_access_token(self) -> str:
+        """
+        Generate access token using client credentials and refresh token with retry logic
+        """
+        for attempt in range(self.MAX_TOKEN_ATTEMPTS):
+            try:
+                response = await self._request('token', 'POST', self.TOKEN_URL, **self._token_request_kwargs())
+                response.raise_for_status()
+                return self._accept_token(response.json())
+            except httpx.HTTPError as e:
+                wait_time = self._token_retry_wait(attempt, e)
+                if wait_time is None:
+                    raise
+                await asyncio.sleep(wait_time)
+
+    async def _request(self, name: str, method: str, url: str, **kwargs) -> httpx.Response:
+        """
+        Performs the HTTP call within the request budget, waits out 429 responses and records timings
+        on the attached metrics, if any
+        """
+        for attempt in range(self.MAX_RATE_LIMIT_RETRIES + 1):
+            if self.request_budget:
+                await self.request_budget.acquire_async()
+
+            started_at = time.perf_counter()
+            status_code = None
+            try:
+                response = await self.http.request(method, url, **kwargs)
+                status_code = response.status_code
+            finally:
+                self._record_http(name, started_at, status_code)
+
+            wait_time = self._rate_limit_wait(name, response, attempt)
+            if wait_time is None:
+                return response
+            await asyncio.sleep(wait_time)
+
+    async def _ensure_valid_token(self) -> None:
+        # concurrent callers on the same service refresh the token once
+        async with self._token_lock:
+            if self._token_expired():
+                self.access_token = await self._get_access_token()
+
+    async def fetch_recently_played(self, limit: int = 50, cutoff_timestamp: str = '2025-06-10T00:00:00.000Z') -> Optional[Dict[str, Any]]:
+        """
+        Fetch recently played tracks from Spotify API
+        """
+        cutoff_timestamp_dt = datetime.fromisoformat(cutoff_timestamp.replace('Z', '+00:00'))
+        return await self._fetch_recently_played_page(limit, int(cutoff_timestamp_dt.timestamp() * 1000))
+
+    async def iter_recently_played(self, limit: int = 50, cutoff_timestamp: str = '2025-06-10T00:00:00.000Z') -> AsyncIterator[List[Dict[str, Any]]]:
+        """
+        Yields pages of recently played items after the cutoff, following the `after` cursor
+        """
+        after = int(datetime.fromisoformat(cutoff_timestamp.replace('Z', '+00:00')).timestamp() * 1000)
+        while True:
+            page = await self._fetch_recently_played_page(limit, after)
+            items = page.get('items', [])
+            if items:
+                yield items
+
+            next_after = (page.get('cursors') or {}).get('after')
+            if len(items) < limit or not next_after or int(next_after) <= after:
+                return
+            after = int(next_after)
+
+    async def _fetch_recently_played_page(self, limit: int, after: int) -> Dict[str, Any]:
+        await self._ensure_valid_token()
+        response = await self._request('recently_played', 'GET', f"{self.base_url}/me/player/recently-played", headers=self._auth_headers(), params={"limit": limit, "after": after})
+        response.raise_for_status()
+        logger.info(f"Successfully fetched {limit} recently played tracks")
+        return response.json()
@@ -0,0 +1,130 @@
+import json
+import time
+from config.logger import logger
+from typing import Dict, Optional, Any
+from db.models.sync_logs import SyncLog
+from config.postgres import execute_query
+
+class ChunkedBackfill:
+    """
+    Runs an UPDATE/INSERT statement over a table in primary-key ranges, committing each chunk
+    separately so row locks and WAL stay bounded. `chunk_query` must filter on `:start_id`
+    (inclusive) and `:end_id` (exclusive). Progress is checkpointed to spotilens__sync_logs
+    under `backfill:<name>`, so an interrupted run picks up from the last committed chunk.
+    """
+
+    # runs in these states left a checkpoint behind that the next run resumes from
+    RESUMABLE_STATUSES = ('running', 'error')
+
+    def __init__(self, name: str, table: str, pk_column: str, chunk_query: str, chunk_size: int = 5000, rows_per_second: Optional[float] = None):
+        if chunk_size <= 0:
+            raise ValueError("chunk_size must be greater than 0")
+
+        self.name = name
+        self.table = table
+        self.pk_column = pk_column
+        self.chunk_query = chunk_query
+        self.chunk_size = chunk_size
+        self.rows_per_second = rows_per_second or None
+        self.sync_source = f"backfill:{name}"
+
+    def run(self, resume: bool = True) -> Dict[str, Any]:
+        min_id, max_id = self._get_pk_bounds()
+        if min_id is None:
+            logger.info(f"[{self.name}] {self.table} is empty, nothing to backfill")
+            return {'rows_affected': 0, 'chunks': 0}
+
+        checkpoint = self._get_checkpoint() if resume else None
+        start_id = checkpoint['next_id'] if checkpoint else min_id
+        rows_affected = checkpoint['rows_affected'] if checkpoint else 0
+        if checkpoint:
+            logger.info(f"[{self.name}] Resuming from {self.pk_column} >= {start_id}")
+
+        sync_log = SyncLog.create_record({
+            'sync_source': self.sync_source,
+            'status': 'running',
+            'response': self._checkpoint_payload(start_id, rows_affected, max_id)
+        })
+
+        chunks = 0
+        run_start_id = start_id
+        started_at = time.monotonic()
+        try:
+            while start_id <= max_id:
+                end_id = start_id + self.chunk_size
+                chunk_started_at = time.monotonic()
+
+                result = execute_query(self.chunk_query, {'start_id': start_id, 'end_id': end_id}, commit=True, profile='bulk-load')
+                chunk_rows = max(result.get('rows_affected') or 0, 0)
+                rows_affected += chunk_rows
+                chunks += 1
+                start_id = end_id
+
+                if sync_log:
+                    sync_log.update_attributes({'response': self._checkpoint_payload(start_id, rows_affected, max_id)})
+
+                self._log_progress(start_id, run_start_id, min_id, max_id, rows_affected, started_at)
+                self._throttle(chunk_rows, chunk_started_at)
+
+            if sync_log:
+                sync_log.update_attributes({'status': 'success'})
+            logger.info(f"[{self.name}] Backfill completed. {rows_affected} rows affected in {chunks} chunks.")
+            return {'rows_affected': rows_affected, 'chunks': chunks}
+        except Exception:
+            if sync_log:
+                sync_log.update_attributes({'status': 'error'})
+            raise
+
+    def _get_pk_bounds(self):
+        result = execute_query(f"SELECT MIN({self.pk_column}), MAX({self.pk_column}) FROM {self.table}", profile='bulk-load')
+        return result['rows'][0]
+
+    def _get_checkpoint(self) -> Optional[Dict[str, Any]]:
+        """
+        Returns the checkpoint of the latest unfinished run, if any
+        """
+        latest_runs = SyncLog.fetch_records(filters={'sync_source': self.sync_source}) or []
+        latest_run = max(latest_runs, key=lambda log: log.id, default=None)
+        if not latest_run or latest_run.status not in self.RESUMABLE_STATUSES or not latest_run.response:
+            return None
+        return json.loads(latest_run.response)
+
+    def _checkpoint_payload(self, next_id: int, rows_affected: int, max_id: int) -> str:
+        return json.dumps({'table': self.table, 'next_id': next_id, 'rows_affected': rows_affected, 'max_id': max_id})
+
+    def _log_progress(self, next_id: int, run_start_id: int, min_id: int, max_id: int, rows_affected: int, started_at: float) -> None:
+        next_id = min(next_id, max_id + 1)
+        total = max_id + 1 - min_id
+        done_this_run = next_id - run_start_id
+        elapsed = time.monotonic() - started_at
+        eta = (elapsed / done_this_run) * (max_id + 1 - next_id) if done_this_run else 0
+        logger.info(f"[{self.name}] {(next_id - min_id) / total:.1%} of id range done, {rows_affected} rows affected, elapsed {elapsed:.1f}s, ETA {eta:.1f}s")
+
+    def _throttle(self, chunk_rows: int, chunk_started_at: float) -> None:
+        if not self.rows_per_second or not chunk_rows:
+            return
+        wait_time = (chunk_rows / self.rows_per_second) - (time.monotonic() - chunk_started_at)
+        if wait_time > 0:
+            time.sleep(wait_time)
+
+def reset_checkpoints(table: str) -> int:
+    """
+    Marks the unfinished backfills over `table` as reset, so they start over instead of resuming.
+    Needed whenever the table's primary keys are renumbered, e.g. by TRUNCATE ... RESTART IDENTITY.
+    Checkpoints written before they recorded their table are reset too. Returns the number reset.
+    """
+    from sqlalchemy import select, update
+    from config.postgres import get_engine
+
+    with get_engine('bulk-load').begin() as connection:
+        unfinished = connection.execute(
+            select(SyncLog.id, SyncLog.response)
+            .where(SyncLog.sync_source.like('backfill:%'), SyncLog.status.in_(ChunkedBackfill.RESUMABLE_STATUSES))
+        ).all()
+        log_ids = [ log_id for log_id, response in unfinished if json.loads(response or '{}').get('table', table) == table ]
+        if log_ids:
+            connection.execute(update(SyncLog).where(SyncLog.id.in_(log_ids)).values(status='reset'))
+
+    if log_ids:
+        logger.info(f"Reset {len(log_ids)} backfill checkpoint(s) on {table}")
+    return len(log_ids)
@@ -0,0 +1,255 @@
+import zlib
+import heapq
+import struct
+from config.logger import logger
+from datetime import date, datetime, timedelta, timezone
+from typing import Dict, Iterable, Iterator, List, Optional, Set, Tuple, Any
+from db.models.listening_history import ListeningHistory
+from db.models.listening_history_cold import ListeningHistoryCold
+from db.models.track_keys import TrackKey
+
+# Hot/cold tiering of listening history. Recent plays stay row per play in spotilens__listening_history;
+# older days are moved to spotilens__listening_history_cold, one row per user and UTC day holding the
+# day's plays as zlib-compressed int32 columns (see encode_day). Postgres only compresses rows above its
+# ~2KB TOAST threshold, which most days stay under, so the compression is done here. Context, track
+# name, entry type and the export extras are dropped on the way, the raw archive still has them.
+# iter_plays reads both tiers as one.
+
+MS_PER_DAY = 86_400_000
+EPOCH_DAY = date(1970, 1, 1)
+IN_CHUNK_SIZE = 1000
+
+Play = Tuple[int, str, Optional[str], Optional[int]]  # (played_at epoch ms, track_id, user_id, ms_played)
+DayPlay = Tuple[int, int, Optional[int]]  # (ms offset into the day, track_key, ms_played)
+
+def move_to_cold(connection, start: datetime, end: datetime) -> Dict[str, int]:
+    """
+    Moves the hot plays with start <= played_at < end into the cold table, merging them into cold rows
+    that already exist for their day (plays already held there are not duplicated). `start` and `end`
+    must be UTC midnights. Runs on the caller's connection, the caller owns the transaction.
+    """
+    from sqlalchemy import select, delete
+
+    plays = connection.execute(
+        select(ListeningHistory.play_id, ListeningHistory.user_id, ListeningHistory.track_id, ListeningHistory.played_at, ListeningHistory.ms_played)
+        .where(ListeningHistory.played_at >= start, ListeningHistory.played_at < end)
+    ).all()
+    if not plays:
+        return {'plays': 0, 'days': 0, 'cold_rows': 0}
+
+    track_keys = ensure_track_keys(connection, { play.track_id for play in plays })
+
+    days = {}
+    for play in plays:
+        day_number, offset_ms = divmod(epoch_ms(play.played_at), MS_PER_DAY)
+        days.setdefault((play.user_id, day_number), {})[(offset_ms, track_keys[play.track_id])] = play.ms_played
+
+    existing = connection.execute(
+        select(ListeningHistoryCold.id, ListeningHistoryCold.user_id, ListeningHistoryCold.day, ListeningHistoryCold.plays)
+        .where(ListeningHistoryCold.day >= start.date(), ListeningHistoryCold.day < end.date())
+    ).all()
+    existing_rows = { (row.user_id, (_to_date(row.day) - EPOCH_DAY).days): row for row in existing }
+
+    updates, inserts = [], []
+    for (user_id, day_number), day_plays in days.items():
+        cold = existing_rows.get((user_id, day_number))
+        if cold:
+            # plays re-ingested into the hot table after their day was moved are merged back, not duplicated
+            for offset_ms, track_key, ms_played in decode_day(cold.plays):
+                if ms_played is not None or (offset_ms, track_key) not in day_plays:
+                    day_plays[(offset_ms, track_key)] = ms_played
+
+        row = {
+            'user_id': user_id,
+            'day': EPOCH_DAY + timedelta(days=day_number),
+            'play_count': len(day_plays),
+            'plays': encode_day([ (offset_ms, track_key, ms_played) for (offset_ms, track_key), ms_played in day_plays.items() ])
+        }
+        if cold:
+            updates.append((cold.id, row))
+        else:
+            inserts.append(row)
+
+    if inserts:
+        connection.execute(ListeningHistoryCold.__table__.insert(), inserts)
+    for cold_id, row in updates:
+        connection.execute(ListeningHistoryCold.__table__.update().where(ListeningHistoryCold.id == cold_id).values(**row))
+
+    # delete by id, a play that lands in the range while this runs stays hot until the next run
+    play_ids = [ play.play_id for play in plays ]
+    for chunk_start in range(0, len(play_ids), IN_CHUNK_SIZE):
+        connection.execute(delete(ListeningHistory).where(ListeningHistory.play_id.in_(play_ids[chunk_start:chunk_start + IN_CHUNK_SIZE])))
+
+    return {'plays': len(plays), 'days': len({ day_number for _, day_number in days }), 'cold_rows': len(days)}
+
+def encode_day(plays: Iterable[DayPlay]) -> bytes:
+    """
+    Packs a day's plays, sorted by offset, as little-endian int32 columns: the play count, the offsets
+    delta-encoded (small, repetitive values compress well), the track keys and ms_played (-1 when
+    unknown), then compresses the lot with zlib
+    """
+    plays = sorted(plays)
+    offsets = [ offset_ms for offset_ms, _, _ in plays ]
+    deltas = [ offset_ms - previous for previous, offset_ms in zip([0] + offsets, offsets) ]
+    track_keys = [ track_key for _, track_key, _ in plays ]
+    ms_played = [ -1 if value is None else value for _, _, value in plays ]
+    count = len(plays)
+    return zlib.compress(struct.pack(f'<i{count}i{count}i{count}i', count, *deltas, *track_keys, *ms_played))
+
+def decode_day(data: bytes) -> List[DayPlay]:
+    raw = zlib.decompress(data)
+    values = struct.unpack(f'<{len(raw) // 4}i', raw)
+    count = values[0]
+    offsets, offset_ms = [], 0
+    for delta in values[1:count + 1]:
+        offset_ms += delta
+        offsets.append(offset_ms)
+    track_keys, ms_played = values[count + 1:2 * count + 1], values[2 * count + 1:3 * count + 1]
+    return [ (offset_ms, track_key, None if played < 0 else played) for offset_ms, track_key, played in zip(offsets, track_keys, ms_played) ]
+
+def ensure_track_keys(connection, track_ids) -> Dict[str, int]:
+    """
+    Returns track_id -> track_key, assigning keys to tracks that have none yet
+    """
+    from sqlalchemy import select
+    from utils.helper import insert_ignoring_conflicts
+
+    track_ids = sorted(track_ids)
+    track_keys = {}
+    for chunk_start in range(0, len(track_ids), IN_CHUNK_SIZE):
+        chunk = track_ids[chunk_start:chunk_start + IN_CHUNK_SIZE]
+        stored = dict(connection.execute(select(TrackKey.track_id, TrackKey.track_key).where(TrackKey.track_id.in_(chunk))).all())
+        missing = [ track_id for track_id in chunk if track_id not in stored ]
+        if missing:
+            insert_ignoring_conflicts(connection, TrackKey.__table__, [ {'track_id': track_id} for track_id in missing ])
+            stored.update(connection.execute(select(TrackKey.track_id, TrackKey.track_key).where(TrackKey.track_id.in_(missing))).all())
+        track_keys.update(stored)
+
+    return track_keys
+
+def cold_play_keys(connection, user_id: Optional[str], plays: Iterable[Dict[str, Any]]) -> Set[Tuple[str, int]]:
+    """
+    (track_id, played_at epoch ms) of the plays the cold tier holds for `user_id` on the days of `plays`,
+    so ingest can skip plays whose day has already been moved out of the hot table
+    """
+    from sqlalchemy import select
+
+    days = sorted({ EPOCH_DAY + timedelta(days=epoch_ms(play['played_at']) // MS_PER_DAY) for play in plays })
+    rows = []
+    for chunk_start in range(0, len(days), IN_CHUNK_SIZE):
+        rows += connection.execute(
+            select(ListeningHistoryCold.day, ListeningHistoryCold.plays)
+            .where(ListeningHistoryCold.user_id.is_not_distinct_from(user_id), ListeningHistoryCold.day.in_(days[chunk_start:chunk_start + IN_CHUNK_SIZE]))
+        ).all()
+
+    day_plays = [ ((_to_date(row.day) - EPOCH_DAY).days * MS_PER_DAY, decode_day(row.plays)) for row in rows ]
+    track_ids = _track_ids(connection, { track_key for _, plays in day_plays for _, track_key, _ in plays })
+    return { (track_ids[track_key], day_ms + offset_ms) for day_ms, plays in day_plays for offset_ms, track_key, _ in plays }
+
+def iter_plays(connection, start: Optional[datetime] = None, end: Optional[datetime] = None, batch_size: int = 10_000) -> Iterator[Play]:
+    """
+    Plays of both tiers with start <= played_at < end (naive means UTC), merged in played_at order.
+    Streams the hot table and decodes the cold one a batch of days at a time, so memory stays flat.
+    The tiers are read by separate queries; on Postgres, when `connection` has no open transaction,
+    they are read in one REPEATABLE READ transaction on a connection of its own, so a concurrent move
+    to cold storage cannot show plays twice or not at all.
+    """
+    if connection.dialect.name == 'postgresql' and not connection.in_transaction():
+        with connection.engine.connect() as snapshot_connection:
+            snapshot_connection.execution_options(isolation_level='REPEATABLE READ')
+            yield from _iter_both_tiers(snapshot_connection, start, end, batch_size)
+        return
+
+    yield from _iter_both_tiers(connection, start, end, batch_size)
+
+def _iter_both_tiers(connection, start: Optional[datetime], end: Optional[datetime], batch_size: int) -> Iterator[Play]:
+    start_ms = epoch_ms(start) if start else None
+    end_ms = epoch_ms(end) if end else None
+    return heapq.merge(
+        _iter_cold_plays(connection, start_ms, end_ms, batch_size),
+        _iter_hot_plays(connection, start, end, batch_size),
+        key=lambda play: play[0]
+    )
+
+def _iter_hot_plays(connection, start: Optional[datetime], end: Optional[datetime], batch_size: int) -> Iterator[Play]:
+    from sqlalchemy import select
+
+    query = select(ListeningHistory.played_at, ListeningHistory.track_id, ListeningHistory.user_id, ListeningHistory.ms_played).order_by(ListeningHistory.played_at, ListeningHistory.play_id)
+    if start:
+        query = query.where(ListeningHistory.played_at >= start)
+    if end:
+        query = query.where(ListeningHistory.played_at < end)
+
+    for played_at, track_id, user_id, ms_played in connection.execute(query.execution_options(stream_results=True, yield_per=batch_size)):
+        yield epoch_ms(played_at), track_id, user_id, ms_played
+
+def _iter_cold_plays(connection, start_ms: Optional[int], end_ms: Optional[int], batch_size: int) -> Iterator[Play]:
+    from sqlalchemy import select
+
+    query = select(ListeningHistoryCold.day, ListeningHistoryCold.user_id, ListeningHistoryCold.plays).order_by(ListeningHistoryCold.day)
+    if start_ms is not None:
+        query = query.where(ListeningHistoryCold.day >= EPOCH_DAY + timedelta(days=start_ms // MS_PER_DAY))
+    if end_ms is not None:
+        query = query.where(ListeningHistoryCold.day <= EPOCH_DAY + timedelta(days=end_ms // MS_PER_DAY))
+
+    # a day row holds many plays, fetch fewer rows per batch than plays
+    rows_per_batch = max(batch_size // 100, 1)
+    # each user has their own row per day, a day's rows are merged before they are handed out
+    current_day, day_plays = None, []
+    for rows in connection.execute(query.execution_options(stream_results=True, yield_per=rows_per_batch)).partitions():
+        decoded = [ (day, user_id, decode_day(plays)) for day, user_id, plays in rows ]
+        # track ids are looked up per batch rather than loading the whole key table
+        track_ids = _track_ids(connection, { track_key for _, _, plays in decoded for _, track_key, _ in plays })
+        for day, user_id, plays in decoded:
+            if day != current_day:
+                yield from sorted(day_plays, key=lambda play: play[0])
+                current_day, day_plays = day, []
+
+            day_ms = (_to_date(day) - EPOCH_DAY).days * MS_PER_DAY
+            for offset_ms, track_key, played in plays:
+                played_at_ms = day_ms + offset_ms
+                if (start_ms is None or played_at_ms >= start_ms) and (end_ms is None or played_at_ms < end_ms):
+                    day_plays.append((played_at_ms, track_ids[track_key], user_id, played))
+
+    yield from sorted(day_plays, key=lambda play: play[0])
+
+def _track_ids(connection, track_keys: Set[int]) -> Dict[int, str]:
+    from sqlalchemy import select
+
+    track_keys = sorted(track_keys)
+    track_ids = {}
+    for chunk_start in range(0, len(track_keys), IN_CHUNK_SIZE):
+        track_ids.update(connection.execute(select(TrackKey.track_key, TrackKey.track_id).where(TrackKey.track_key.in_(track_keys[chunk_start:chunk_start + IN_CHUNK_SIZE]))).all())
+    return track_ids
+
+def log_tier_sizes(connection) -> None:
+    """
+    Logs row counts and, on Postgres, the on-disk size of both tiers
+    """
+    from sqlalchemy import select, func
+
+    hot_plays = connection.execute(select(func.count()).select_from(ListeningHistory)).scalar()
+    cold_rows, cold_plays = connection.execute(select(func.count(), func.coalesce(func.sum(ListeningHistoryCold.play_count), 0))).one()
+    message = f"Hot tier holds {hot_plays} plays, cold tier {cold_plays} plays in {cold_rows} day rows"
+    if connection.dialect.name == 'postgresql':
+        hot_size, cold_size = connection.exec_driver_sql(
+            "SELECT pg_total_relation_size('spotilens__listening_history'), pg_total_relation_size('spotilens__listening_history_cold') + pg_total_relation_size('spotilens__track_keys')"
+        ).one()
+        message += f", {hot_size / 1024 / 1024:.1f} MiB hot and {cold_size / 1024 / 1024:.1f} MiB cold"
+    logger.info(message)
+
+def utc_midnight(value: datetime) -> datetime:
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return datetime.combine(value.astimezone(timezone.utc).date(), datetime.min.time(), tzinfo=timezone.utc)
+
+def _to_date(value: Any) -> date:
+    # sqlite hands dates back as strings
+    return date.fromisoformat(value) if isinstance(value, str) else value
+
+def epoch_ms(value: Any) -> int:
+    if isinstance(value, str):
+        value = datetime.fromisoformat(value)
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return int(value.timestamp() * 1000)
@@ -8,10 +8,70 @@ APP_ENV = os.getenv('APP_ENV', 'production')
 PROJECT_NAME = 'spotilens'
 
 SUPABASE_DB_PASSWORD = os.getenv('SUPABASE_DB_PASSWORD')
-SUPABASE_DB_URL = os.getenv('SUPABASE_DB_URL').replace('[YOUR-PASSWORD]', quote_plus(SUPABASE_DB_PASSWORD))
 
 SPOTIFY_SCOPE = os.getenv('SPOTIFY_SCOPE')
 SPOTIFY_REDIRECT_URI = os.getenv('SPOTIFY_REDIRECT_URI')
 SPOTIFY_CLIENT_ID = os.getenv('SPOTIFY_CLIENT_ID')
 SPOTIFY_CLIENT_SECRET = os.getenv('SPOTIFY_CLIENT_SECRET')
 SPOTIFY_REFRESH_TOKEN = os.getenv('SPOTIFY_REFRESH_TOKEN')
+
+# fetched payloads are spooled here before they are loaded into the database
+SPOOL_DIR = os.getenv('SPOOL_DIR') or os.path.join(os.getcwd(), 'spool')
+
+# memory-mapped columnar snapshot of listening history used by the explore tasks
+LISTENING_SNAPSHOT_PATH = os.getenv('LISTENING_SNAPSHOT_PATH') or os.path.join(os.getcwd(), 'snapshots', 'listening_history.bin')
+
+# plays older than this many days are moved to the cold listening history tier
+HOT_RETENTION_DAYS = int(os.getenv('HOT_RETENTION_DAYS') or 365)
+
+PROMETHEUS_TEXTFILE_DIR = os.getenv('PROMETHEUS_TEXTFILE_DIR')
+PROFILE_N_PLUS_ONE_THRESHOLD = int(os.getenv('PROFILE_N_PLUS_ONE_THRESHOLD') or 20)
+
+# per message type log sampling, e.g. LOG_SAMPLE_LIMITS='artist.found=0,history.created=-1'
+LOG_SAMPLE_LIMIT = int(os.getenv('LOG_SAMPLE_LIMIT') or 20)
+LOG_SAMPLE_INTERVAL = float(os.getenv('LOG_SAMPLE_INTERVAL') or 60)
+LOG_SAMPLE_LIMITS = os.getenv('LOG_SAMPLE_LIMITS', '')
+
+# 'session' for direct connections, 'transaction' behind PgBouncer / the Supabase transaction pooler
+DB_POOLER_MODE = os.getenv('DB_POOLER_MODE') or 'session'
+
+def get_engine_setting(profile: str, name: str, default):
+    """
+    Reads a per-profile engine override such as DB_BULK_LOAD_POOL_SIZE, cast to the default's type
+    """
+    raw = os.getenv(f"DB_{profile.upper().replace('-', '_')}_{name.upper()}")
+    if raw is None or raw == '':
+        return default
+    if isinstance(default, bool):
+        return raw.lower() in ('1', 'true', 'yes')
+    return type(default)(raw) if default is not None else raw
+
+def _build_db_url(env_name: str) -> str:
+    db_url = os.getenv(env_name)
+    if '[YOUR-PASSWORD]' in db_url:
+        if SUPABASE_DB_PASSWORD is None:
+            raise RuntimeError(f"{env_name} contains [YOUR-PASSWORD] but SUPABASE_DB_PASSWORD is not set")
+        db_url = db_url.replace('[YOUR-PASSWORD]', quote_plus(SUPABASE_DB_PASSWORD))
+    return db_url
+
+def _build_supabase_db_url() -> str:
+    if not os.getenv('SUPABASE_DB_URL'):
+        raise RuntimeError("SUPABASE_DB_URL is not set, add it to the environment or .env")
+    return _build_db_url('SUPABASE_DB_URL')
+
+def _build_supabase_db_read_url() -> str:
+    # optional read replica for analytics, None means the primary is used
+    return _build_db_url('SUPABASE_DB_READ_URL') if os.getenv('SUPABASE_DB_READ_URL') else None
+
+# settings that need validation are resolved on first access, so importing this module never fails
+_LAZY_SETTINGS = {
+    'SUPABASE_DB_URL': _build_supabase_db_url,
+    'SUPABASE_DB_READ_URL': _build_supabase_db_read_url
+}
+
+def __getattr__(name):
+    if name in _LAZY_SETTINGS:
+        value = _LAZY_SETTINGS[name]()
+        globals()[name] = value
+        return value
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -0,0 +1,140 @@
+import json
+import bisect
+from config.logger import logger
+from datetime import datetime, timedelta
+from typing import Dict, Iterable, List, Optional, Tuple, Any
+
+# Spotify's extended streaming history export (Streaming_History_Audio_*.json) only carries a track
+# URI and ms_played per play. Files are parsed into compact tuples, the distinct track ids are resolved
+# to full track objects, from the raw archive first and through batched /tracks calls otherwise, and
+# the plays are then shaped like recently-played items so they go through the regular ingest path.
+
+TRACK_URI_PREFIX = 'spotify:track:'
+# 30s is also what Spotify counts as a play for recently-played
+DEFAULT_MIN_MS_PLAYED = 30000
+# export timestamps are whole seconds and can be a few seconds off recently-played's millisecond ones
+MATCH_TOLERANCE_MS = 5000
+# personal data in the export that has no use here and should not end up in the database
+DROPPED_FIELDS = {'ip_addr', 'ip_addr_decrypted', 'user_agent_decrypted', 'username'}
+# fields that become columns or are implied by the track object
+CONSUMED_FIELDS = {
+    'ts', 'ms_played', 'spotify_track_uri', 'master_metadata_track_name', 'master_metadata_album_artist_name',
+    'master_metadata_album_album_name', 'episode_name', 'episode_show_name', 'spotify_episode_uri',
+    'audiobook_title', 'audiobook_uri', 'audiobook_chapter_uri', 'audiobook_chapter_title'
+}
+
+Play = Tuple[str, str, int, Dict[str, Any]]  # (track_id, played_at, ms_played, extra)
+
+def parse_export_file(path: str, min_ms_played: int = DEFAULT_MIN_MS_PLAYED) -> Tuple[List[Play], Dict[str, int]]:
+    """
+    Runs in a worker process. Returns the file's track plays of at least `min_ms_played` and counts
+    of what was skipped; podcast episodes and audiobooks have no track URI and are dropped.
+    """
+    with open(path, 'r', encoding='utf-8') as f:
+        entries = json.load(f)
+
+    plays, stats = [], {'entries': len(entries), 'not_a_track': 0, 'too_short': 0}
+    for entry in entries:
+        track_uri = entry.get('spotify_track_uri')
+        if not track_uri or not track_uri.startswith(TRACK_URI_PREFIX):
+            stats['not_a_track'] += 1
+            continue
+        if (entry.get('ms_played') or 0) < min_ms_played:
+            stats['too_short'] += 1
+            continue
+
+        extra = { key: value for key, value in entry.items() if key not in DROPPED_FIELDS and key not in CONSUMED_FIELDS and value is not None }
+        plays.append((track_uri[len(TRACK_URI_PREFIX):], entry['ts'], entry['ms_played'], extra))
+
+    return plays, stats
+
+def resolve_tracks(track_ids: Iterable[str], spotify_service: Optional[Any] = None) -> Tuple[Dict[str, Dict[str, Any]], Dict[str, int]]:
+    """
+    Maps track ids to full track objects. Tracks the raw archive already holds are rebuilt from it,
+    only the rest is fetched from the API, 50 per call. Ids Spotify cannot resolve are left out.
+    """
+    track_ids = list(dict.fromkeys(track_ids))
+    tracks = _tracks_from_archive(track_ids)
+    missing = [ track_id for track_id in track_ids if track_id not in tracks ]
+    stats = {'from_archive': len(tracks), 'from_api': 0, 'unresolved': 0, 'api_calls': 0}
+
+    if missing:
+        if spotify_service is None:
+            from utils.spotify_service import SpotifyService
+            spotify_service = SpotifyService()
+
+        for track_id, track in spotify_service.fetch_tracks(missing).items():
+            if track and track.get('id'):
+                # relinked tracks come back under a different id, keep the one the export refers to
+                tracks[track_id] = {**track, 'id': track_id}
+                stats['from_api'] += 1
+            else:
+                stats['unresolved'] += 1
+        stats['api_calls'] = -(-len(missing) // spotify_service.TRACKS_BATCH_SIZE)
+
+    logger.info(f"Resolved {len(track_ids)} distinct tracks: {json.dumps(stats)}")
+    return tracks, stats
+
+def build_items(plays: Iterable[Play], tracks: Dict[str, Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """
+    Shapes plays like recently-played items, skipping those whose track could not be resolved
+    """
+    return [
+        {'track': tracks[track_id], 'played_at': played_at, 'ms_played': ms_played, 'extra': extra or None, 'context': None}
+        for track_id, played_at, ms_played, extra in plays if track_id in tracks
+    ]
+
+def without_stored_plays(items: List[Dict[str, Any]], user_id: Optional[str] = None, tolerance_ms: int = MATCH_TOLERANCE_MS) -> Tuple[List[Dict[str, Any]], int]:
+    """
+    Drops items (sorted by played_at) that match a stored play of the same user and track within
+    `tolerance_ms`, in either tier. The bulk load only skips exact matches, so periods the export shares
+    with recently-played would otherwise be stored twice. Returns the remaining items and the drop count.
+    """
+    from config.postgres import get_engine
+    from utils.cold_storage import iter_plays
+
+    if not items:
+        return items, 0
+
+    start, end = _parse_played_at(items[0]['played_at']), _parse_played_at(items[-1]['played_at'])
+    stored = {}
+    with get_engine('bulk-load').connect() as connection:
+        for played_at_ms, track_id, play_user_id, _ in iter_plays(connection, start - timedelta(milliseconds=tolerance_ms), end + timedelta(milliseconds=tolerance_ms + 1)):
+            if play_user_id == user_id:
+                stored.setdefault(track_id, []).append(played_at_ms)
+
+    remaining = []
+    for item in items:
+        played_at_ms = int(_parse_played_at(item['played_at']).timestamp() * 1000)
+        # iter_plays hands plays out in played_at order, so each track's list is sorted
+        track_plays = stored.get(item['track']['id'], [])
+        index = bisect.bisect_left(track_plays, played_at_ms - tolerance_ms)
+        if index < len(track_plays) and track_plays[index] <= played_at_ms + tolerance_ms:
+            continue
+        remaining.append(item)
+
+    return remaining, len(items) - len(remaining)
+
+def _parse_played_at(played_at: str) -> datetime:
+    return datetime.fromisoformat(played_at.replace('Z', '+00:00'))
+
+def _tracks_from_archive(track_ids: List[str], chunk_size: int = 1000) -> Dict[str, Dict[str, Any]]:
+    from sqlalchemy import select, func
+    from config.postgres import get_engine
+    from db.models.raw_plays import RawPlay
+    from utils.archive import ObjectResolver
+
+    tracks = {}
+    with get_engine('bulk-load').connect() as connection:
+        resolver = ObjectResolver(connection)
+        for start in range(0, len(track_ids), chunk_size):
+            # any archived version of the track will do, max() just picks one deterministically
+            digests = dict(connection.execute(
+                select(RawPlay.track_id, func.max(RawPlay.track_digest))
+                .where(RawPlay.track_id.in_(track_ids[start:start + chunk_size]))
+                .group_by(RawPlay.track_id)
+            ).all())
+            resolver.load(list(digests.values()))
+            tracks.update({ track_id: resolver.resolve(digest) for track_id, digest in digests.items() })
+
+    return tracks
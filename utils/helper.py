@@ -1,6 +1,6 @@
 from config.logger import logger
 from typing import Dict, List, Optional, Any
-from datetime import datetime
+from datetime import datetime, timezone
 
 from db.models.artists import Artist
 from db.models.albums import Album
@@ -8,8 +8,12 @@ from db.models.tracks import Track
 from db.models.album_artists import AlbumArtist
 from db.models.track_artists import TrackArtist
 from db.models.listening_history import ListeningHistory
+from utils.archive import archive_rows, write_archive_rows
 
-def store_spotify_track_in_db(payload: Dict[str, Any], entry_type: Optional[str] = 'daily-sync') -> ListeningHistory:
+# (track_id, played_at) keys per duplicate probe, keeps the IN list well under driver parameter limits
+PROBE_CHUNK_SIZE = 500
+
+def store_spotify_track_in_db(payload: Dict[str, Any], entry_type: Optional[str] = 'daily-sync', user_id: Optional[str] = None) -> Optional[ListeningHistory]:
     # Extract track.id and played_at timestamp
     track_data = payload.get('track', {})
     track_id = track_data.get('id')
@@ -21,12 +25,14 @@ def store_spotify_track_in_db(payload: Dict[str, Any], entry_type: Optional[str]
     # Parse played_at timestamp
     played_at_dt = datetime.fromisoformat(played_at_str.replace('Z', '+00:00'))
 
-    # Check if listening_history already has this record using track_id + timestamp
-    existing_history = ListeningHistory.fetch_records(filters={'track_id': track_id, 'played_at': played_at_dt})
+    # Check if listening_history already has this record using user_id + track_id + timestamp
+    existing_history = ListeningHistory.fetch_records(filters={'user_id': user_id, 'track_id': track_id, 'played_at': played_at_dt})
 
-    if existing_history:
-        logger.info(f"Skipping existing listening history for track {track_id} at {played_at_str}")
-        return existing_history[0]
+    if existing_history or _is_cold_play(track_id, played_at_dt, user_id):
+        logger.info(f"Skipping existing listening history for track {track_id} at {played_at_str}", extra={'sample_key': 'history.skipped'})
+        # the play may have been committed by a run that died before archiving it, archiving is idempotent
+        _archive_payload(payload, entry_type, user_id)
+        return existing_history[0] if existing_history else None
 
     # 1. Track Artists Processing (track.artists[])
     track_artists_data = track_data.get('artists', [])
@@ -76,13 +82,34 @@ def store_spotify_track_in_db(payload: Dict[str, Any], entry_type: Optional[str]
         track_name=track.name,
         played_at=played_at_dt,
         entry_type=entry_type,
-        context=context_data
+        context=context_data,
+        user_id=user_id
     )
-    logger.info(f"Successfully processed track {track_id} played at {played_at_str}")
+    _archive_payload(payload, entry_type, user_id)
+    logger.info(f"Successfully processed track {track_id} played at {played_at_str}", extra={'sample_key': 'play.processed'})
 
     return listening_history
 
 
+def _is_cold_play(track_id: str, played_at: datetime, user_id: Optional[str] = None) -> bool:
+    from config.postgres import get_engine
+    from utils.cold_storage import cold_play_keys
+
+    with get_engine().connect() as connection:
+        return (track_id, int(played_at.timestamp() * 1000)) in cold_play_keys(connection, user_id, [{'played_at': played_at}])
+
+
+def _archive_payload(payload: Dict[str, Any], entry_type: str, user_id: Optional[str] = None) -> None:
+    from config.postgres import get_engine
+    from db.models.raw_plays import RawPlay
+
+    rows = archive_rows([payload], entry_type, user_id)
+    with get_engine().begin() as connection:
+        rows['raw_plays'] = _without_stored_plays(connection, rows['raw_plays'], user_id, RawPlay)
+        if rows['raw_plays']:
+            write_archive_rows(connection, rows)
+
+
 def get_or_create_artist(artist_data: Dict[str, Any]) -> Artist:
     """
     Check if artist exists by spotify_id, if not create new artist record
@@ -95,25 +122,13 @@ def get_or_create_artist(artist_data: Dict[str, Any]) -> Artist:
     # Check if artist exists by spotify_id
     existing_artist = Artist.fetch_record_by_id(artist_id)
     if existing_artist:
-        logger.info(f"Found existing artist: {existing_artist.name} ({artist_id})")
+        logger.info(f"Found existing artist: {existing_artist.name} ({artist_id})", extra={'sample_key': 'artist.found'})
         return existing_artist
 
     # Create new artist record
-    artist_record_data = {
-        'artist_id': artist_id,
-        'name': artist_data.get('name', 'Unknown Artist'),
-        'popularity': artist_data.get('popularity'),
-        'followers': artist_data.get('followers', {}).get('total') if artist_data.get('followers') else None,
-        'genres': artist_data.get('genres', []),
-        'images': artist_data.get('images', []),
-        'external_url': artist_data.get('external_urls', {}).get('spotify'),
-        'href': artist_data.get('href'),
-        'uri': artist_data.get('uri'),
-        'type': artist_data.get('type')
-    }
-
-    artist = Artist.create_record(artist_record_data)
-    logger.info(f"Created new artist: {artist_data.get('name')} ({artist_id})")
+    # another account's sync may have created it since the lookup, fall back to that row
+    artist = Artist.create_record(_artist_record(artist_data)) or Artist.fetch_record_by_id(artist_id)
+    logger.info(f"Created new artist: {artist_data.get('name')} ({artist_id})", extra={'sample_key': 'artist.created'})
 
     return artist
 
@@ -130,7 +145,7 @@ def get_or_create_album(album_data: Dict[str, Any], album_artist_ids: List[str])
         }
 
         album_artist = AlbumArtist.create_record(album_artist_data)
-        logger.info(f"Associated artist {artist_id} with album {album_id}")
+        logger.info(f"Associated artist {artist_id} with album {album_id}", extra={'sample_key': 'album_artist.created'})
 
         return album_artist
 
@@ -141,7 +156,7 @@ def get_or_create_album(album_data: Dict[str, Any], album_artist_ids: List[str])
     # Check if album exists by spotify_id
     existing_album = Album.fetch_record_by_id(album_id)
     if existing_album:
-        logger.info(f"Found existing album: {existing_album.name} ({album_id})")
+        logger.info(f"Found existing album: {existing_album.name} ({album_id})", extra={'sample_key': 'album.found'})
 
         # Check if all artists are already associated with this album
         existing_associations = AlbumArtist.fetch_records(filters={'album_id': album_id})
@@ -154,25 +169,8 @@ def get_or_create_album(album_data: Dict[str, Any], album_artist_ids: List[str])
         return existing_album
 
     # Create new album record
-    album_record_data = {
-        'album_id': album_id,
-        'name': album_data.get('name', 'Unknown Album'),
-        'album_type': album_data.get('album_type'),
-        'release_date': album_data.get('release_date'),
-        'release_precision': album_data.get('release_date_precision'),
-        'total_tracks': album_data.get('total_tracks'),
-        'genres': album_data.get('genres', []),
-        'label': album_data.get('label'),
-        'popularity': album_data.get('popularity'),
-        'images': album_data.get('images', []),
-        'external_url': album_data.get('external_urls', {}).get('spotify'),
-        'href': album_data.get('href'),
-        'uri': album_data.get('uri'),
-        'type': album_data.get('type')
-    }
-
-    album = Album.create_record(album_record_data)
-    logger.info(f"Created new album: {album_data.get('name')} ({album_id})")
+    album = Album.create_record(_album_record(album_data)) or Album.fetch_record_by_id(album_id)
+    logger.info(f"Created new album: {album_data.get('name')} ({album_id})", extra={'sample_key': 'album.created'})
 
     # Associate with album artists using spotilens__album_artists table
     [ associate_album_with_artist(album_id, artist_id) for artist_id in album_artist_ids ]
@@ -192,7 +190,7 @@ def get_or_create_track(track_data: Dict[str, Any], album_id: str, track_artist_
         }
 
         track_artist = TrackArtist.create_record(track_artist_data)
-        logger.info(f"Associated artist {artist_id} with track {track_id}")
+        logger.info(f"Associated artist {artist_id} with track {track_id}", extra={'sample_key': 'track_artist.created'})
 
         return track_artist
 
@@ -203,7 +201,7 @@ def get_or_create_track(track_data: Dict[str, Any], album_id: str, track_artist_
     # Check if track exists by spotify_id
     existing_track = Track.fetch_record_by_id(track_id)
     if existing_track:
-        logger.info(f"Found existing track: {existing_track.name} ({track_id})")
+        logger.info(f"Found existing track: {existing_track.name} ({track_id})", extra={'sample_key': 'track.found'})
 
         # Check if all artists are already associated with this track
         existing_associations = TrackArtist.fetch_records(filters={'track_id': track_id})
@@ -216,25 +214,8 @@ def get_or_create_track(track_data: Dict[str, Any], album_id: str, track_artist_
         return existing_track
 
     # Create new track record
-    track_record_data = {
-        'track_id': track_id,
-        'album_id': album_id,
-        'name': track_data.get('name', 'Unknown Track'),
-        'duration_ms': track_data.get('duration_ms'),
-        'explicit': track_data.get('explicit'),
-        'popularity': track_data.get('popularity'),
-        'disc_number': track_data.get('disc_number'),
-        'track_number': track_data.get('track_number'),
-        'is_playable': track_data.get('is_playable'),
-        'preview_url': track_data.get('preview_url'),
-        'external_url': track_data.get('external_urls', {}).get('spotify'),
-        'href': track_data.get('href'),
-        'uri': track_data.get('uri'),
-        'type': track_data.get('type')
-    }
-
-    track = Track.create_record(track_record_data)
-    logger.info(f"Created new track: {track_data.get('name')} ({track_id})")
+    track = Track.create_record(_track_record(track_data, album_id)) or Track.fetch_record_by_id(track_id)
+    logger.info(f"Created new track: {track_data.get('name')} ({track_id})", extra={'sample_key': 'track.created'})
 
     # Associate with track artists using spotilens__track_artists table
     [ associate_track_with_artist(track_id, artist_id) for artist_id in track_artist_ids ]
@@ -242,10 +223,11 @@ def get_or_create_track(track_data: Dict[str, Any], album_id: str, track_artist_
     return track
 
 
-def create_listening_history(track_id: str, played_at: datetime, entry_type: str, track_name: Optional[str] = None, context: Optional[dict] = None) -> ListeningHistory:
+def create_listening_history(track_id: str, played_at: datetime, entry_type: str, track_name: Optional[str] = None, context: Optional[dict] = None, user_id: Optional[str] = None) -> ListeningHistory:
     context_type = context.get('type') if context else None
     context_uri = context.get('uri') if context else None
     listening_history_data = {
+        'user_id': user_id,
         'track_id': track_id,
         'track_name': track_name,
         'context_type': context_type,
@@ -255,6 +237,234 @@ def create_listening_history(track_id: str, played_at: datetime, entry_type: str
     }
 
     listening_history = ListeningHistory.create_record(listening_history_data)
-    logger.info(f"Created listening history for track {track_id} at {played_at}")
+    logger.info(f"Created listening history for track {track_id} at {played_at}", extra={'sample_key': 'history.created'})
+
+    return listening_history
+
 
-    return listening_history
\ No newline at end of file
+def bulk_store_spotify_tracks(items: List[Dict[str, Any]], entry_type: Optional[str] = 'daily-sync', user_id: Optional[str] = None) -> int:
+    """
+    Set-based counterpart of store_spotify_track_in_db for batches: one INSERT ... ON CONFLICT DO NOTHING
+    per table, all in a single transaction on the bulk-load engine. Existing rows are left untouched,
+    same as the get_or_create path. Returns the number of plays inserted.
+    """
+    from config.postgres import get_engine
+
+    rows = prepare_bulk_rows(items, entry_type, user_id)
+    if not rows['plays']:
+        return 0
+
+    with get_engine('bulk-load').begin() as connection:
+        return write_bulk_rows(connection, rows)
+
+
+def prepare_bulk_rows(items: List[Dict[str, Any]], entry_type: Optional[str] = 'daily-sync', user_id: Optional[str] = None, archive: bool = True) -> Dict[str, Any]:
+    """
+    Turns recently-played items into de-duplicated rows per table, without touching the database.
+    With `archive`, also the raw archive rows for the items.
+    """
+    rows = _empty_bulk_rows(user_id)
+    dimensions, plays, valid_items = {}, [], []
+    for item in items:
+        track_data = item.get('track', {})
+        played_at_str = item.get('played_at')
+        if not played_at_str or not _collect_dimensions(track_data, dimensions):
+            logger.error(f"Skipping incomplete payload for track {track_data.get('id')} played at {played_at_str}")
+            continue
+
+        context = item.get('context') or {}
+        plays.append({
+            'user_id': user_id,
+            'track_id': track_data['id'],
+            'context_type': context.get('type'),
+            'context_uri': context.get('uri'),
+            'entry_type': entry_type,
+            'played_at': datetime.fromisoformat(played_at_str.replace('Z', '+00:00')),
+            'ms_played': item.get('ms_played'),
+            'extra': item.get('extra')
+        })
+        valid_items.append(item)
+
+    rows.update({ table: list(records.values()) for table, records in dimensions.items() })
+    rows['plays'] = plays
+    if archive:
+        rows.update(archive_rows(valid_items, entry_type, user_id))
+    return rows
+
+
+def prepare_dimension_rows(tracks_data: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """
+    Rows for the artist, album and track tables only, from full track objects
+    """
+    rows = _empty_bulk_rows()
+    dimensions = {}
+    for track_data in tracks_data:
+        if not _collect_dimensions(track_data, dimensions):
+            logger.error(f"Skipping incomplete track {track_data.get('id')}")
+
+    rows.update({ table: list(records.values()) for table, records in dimensions.items() })
+    return rows
+
+
+def write_bulk_rows(connection, rows: Dict[str, Any]) -> int:
+    """
+    Writes the output of prepare_bulk_rows on an open connection, the caller owns the transaction.
+    Also works inside AsyncConnection.run_sync.
+    """
+    from sqlalchemy import select
+    from db.models.raw_plays import RawPlay
+
+    # archived plays are probed like the plays below, a play stored before its archive row still gets one
+    raw_plays = _without_stored_plays(connection, rows['raw_plays'], rows['user_id'], RawPlay)
+    if raw_plays:
+        write_archive_rows(connection, {**rows, 'raw_plays': raw_plays})
+
+    insert_ignoring_conflicts(connection, Artist.__table__, rows['artists'])
+    insert_ignoring_conflicts(connection, Album.__table__, rows['albums'])
+    insert_ignoring_conflicts(connection, Track.__table__, rows['tracks'])
+    insert_ignoring_conflicts(connection, AlbumArtist.__table__, rows['album_artists'])
+    insert_ignoring_conflicts(connection, TrackArtist.__table__, rows['track_artists'])
+
+    # overlapping fetches spool the same play twice, and NULL user_ids slip past the unique
+    # constraint before Postgres 15, so skip plays already stored instead of relying on it
+    plays = _without_stored_plays(connection, rows['plays'], rows['user_id'])
+
+    # track_name comes from the stored track, like the per-item path, not from the payload
+    track_ids = list({ play['track_id'] for play in plays })
+    track_names = dict(connection.execute(select(Track.track_id, Track.name).where(Track.track_id.in_(track_ids))).all()) if track_ids else {}
+    plays = [ {**play, 'track_name': track_names.get(play['track_id'])} for play in plays ]
+    inserted = insert_ignoring_conflicts(connection, ListeningHistory.__table__, plays)
+
+    logger.info(f"Bulk stored {inserted} new plays ({len(rows['plays']) - inserted} skipped), {len(rows['tracks'])} tracks, {len(rows['albums'])} albums, {len(rows['artists'])} artists")
+    return inserted
+
+
+def _without_stored_plays(connection, plays: List[Dict[str, Any]], user_id: Optional[str], model=ListeningHistory) -> List[Dict[str, Any]]:
+    from sqlalchemy import select, tuple_
+    from utils.cold_storage import cold_play_keys
+
+    def play_key(track_id, played_at):
+        if played_at.tzinfo is None:
+            played_at = played_at.replace(tzinfo=timezone.utc)
+        return track_id, int(played_at.timestamp() * 1000)
+
+    if not plays:
+        return plays
+
+    # probe the exact keys, a played_at range would scan years of history for a historical batch
+    keys = list({ (play['track_id'], play['played_at']) for play in plays })
+    seen = set()
+    for start in range(0, len(keys), PROBE_CHUNK_SIZE):
+        stored = connection.execute(
+            select(model.track_id, model.played_at)
+            .where(model.user_id.is_not_distinct_from(user_id))
+            .where(tuple_(model.track_id, model.played_at).in_(keys[start:start + PROBE_CHUNK_SIZE]))
+        ).all()
+        seen.update(play_key(track_id, played_at) for track_id, played_at in stored)
+    if model is ListeningHistory:
+        # days moved to cold storage are no longer in the hot table, their plays must not come back
+        seen.update(cold_play_keys(connection, user_id, plays))
+
+    new_plays = []
+    for play in plays:
+        key = play_key(play['track_id'], play['played_at'])
+        if key not in seen:
+            seen.add(key)
+            new_plays.append(play)
+    return new_plays
+
+
+def insert_ignoring_conflicts(connection, table, rows: List[Dict[str, Any]]) -> int:
+    if not rows:
+        return 0
+
+    if connection.dialect.name == 'postgresql':
+        from sqlalchemy.dialects.postgresql import insert
+    else:
+        from sqlalchemy.dialects.sqlite import insert
+
+    result = connection.execute(insert(table).on_conflict_do_nothing(), rows)
+    return max(result.rowcount, 0)
+
+
+def _empty_bulk_rows(user_id: Optional[str] = None) -> Dict[str, Any]:
+    tables = ('artists', 'albums', 'tracks', 'album_artists', 'track_artists', 'plays', 'raw_objects', 'raw_plays')
+    return {'user_id': user_id, **{ table: [] for table in tables }}
+
+
+def _collect_dimensions(track_data: Dict[str, Any], dimensions: Dict[str, Dict]) -> bool:
+    """
+    Adds the track's artist, album, track and junction rows to `dimensions` (first occurrence wins,
+    like get_or_create), returns False when the track is missing a required part
+    """
+    album_data = track_data.get('album', {})
+    track_id, album_id = track_data.get('id'), album_data.get('id')
+    track_artists_data = [ artist for artist in track_data.get('artists', []) if artist.get('id') ]
+    album_artists_data = [ artist for artist in album_data.get('artists', []) if artist.get('id') ]
+    if not track_id or not album_id or not track_artists_data or not album_artists_data:
+        return False
+
+    for table in ('artists', 'albums', 'tracks', 'album_artists', 'track_artists'):
+        dimensions.setdefault(table, {})
+    for artist_data in track_artists_data + album_artists_data:
+        dimensions['artists'].setdefault(artist_data['id'], _artist_record(artist_data))
+    dimensions['albums'].setdefault(album_id, _album_record(album_data))
+    dimensions['tracks'].setdefault(track_id, _track_record(track_data, album_id))
+    for artist_data in album_artists_data:
+        dimensions['album_artists'].setdefault((album_id, artist_data['id']), {'album_id': album_id, 'artist_id': artist_data['id']})
+    for artist_data in track_artists_data:
+        dimensions['track_artists'].setdefault((track_id, artist_data['id']), {'track_id': track_id, 'artist_id': artist_data['id']})
+    return True
+
+
+def _artist_record(artist_data: Dict[str, Any]) -> Dict[str, Any]:
+    return {
+        'artist_id': artist_data.get('id'),
+        'name': artist_data.get('name', 'Unknown Artist'),
+        'popularity': artist_data.get('popularity'),
+        'followers': artist_data.get('followers', {}).get('total') if artist_data.get('followers') else None,
+        'genres': artist_data.get('genres', []),
+        'images': artist_data.get('images', []),
+        'external_url': artist_data.get('external_urls', {}).get('spotify'),
+        'href': artist_data.get('href'),
+        'uri': artist_data.get('uri'),
+        'type': artist_data.get('type')
+    }
+
+
+def _album_record(album_data: Dict[str, Any]) -> Dict[str, Any]:
+    return {
+        'album_id': album_data.get('id'),
+        'name': album_data.get('name', 'Unknown Album'),
+        'album_type': album_data.get('album_type'),
+        'release_date': album_data.get('release_date'),
+        'release_precision': album_data.get('release_date_precision'),
+        'total_tracks': album_data.get('total_tracks'),
+        'genres': album_data.get('genres', []),
+        'label': album_data.get('label'),
+        'popularity': album_data.get('popularity'),
+        'images': album_data.get('images', []),
+        'external_url': album_data.get('external_urls', {}).get('spotify'),
+        'href': album_data.get('href'),
+        'uri': album_data.get('uri'),
+        'type': album_data.get('type')
+    }
+
+
+def _track_record(track_data: Dict[str, Any], album_id: str) -> Dict[str, Any]:
+    return {
+        'track_id': track_data.get('id'),
+        'album_id': album_id,
+        'name': track_data.get('name', 'Unknown Track'),
+        'duration_ms': track_data.get('duration_ms'),
+        'explicit': track_data.get('explicit'),
+        'popularity': track_data.get('popularity'),
+        'disc_number': track_data.get('disc_number'),
+        'track_number': track_data.get('track_number'),
+        'is_playable': track_data.get('is_playable'),
+        'preview_url': track_data.get('preview_url'),
+        'external_url': track_data.get('external_urls', {}).get('spotify'),
+        'href': track_data.get('href'),
+        'uri': track_data.get('uri'),
+        'type': track_data.get('type')
+    }
@@ -0,0 +1,134 @@
+import os
+import re
+import time
+from sqlalchemy import event
+from config.logger import logger
+from contextlib import contextmanager
+from typing import Dict, List, Optional, Any
+
+class QueryRecorder:
+    """
+    Counts and times every statement executed on an engine (or on every engine, when given the
+    Engine class) using the cursor execute hooks. Statements are grouped by their SQL text,
+    which is already parameterised by SQLAlchemy.
+    """
+
+    def __init__(self, engine):
+        self.engine = engine
+        self.count = 0
+        self.total_time = 0.0
+        self.statements: Dict[str, Dict[str, Any]] = {}
+        self._info_key = f'query_start_time_{id(self)}'
+
+    def start(self) -> None:
+        event.listen(self.engine, 'before_cursor_execute', self._before_cursor_execute)
+        event.listen(self.engine, 'after_cursor_execute', self._after_cursor_execute)
+
+    def stop(self) -> None:
+        event.remove(self.engine, 'before_cursor_execute', self._before_cursor_execute)
+        event.remove(self.engine, 'after_cursor_execute', self._after_cursor_execute)
+
+    def _before_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault(self._info_key, []).append(time.perf_counter())
+
+    def _after_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        elapsed = time.perf_counter() - conn.info[self._info_key].pop()
+        shape = normalize_statement(statement)
+
+        self.count += 1
+        self.total_time += elapsed
+        stats = self.statements.setdefault(shape, {'count': 0, 'total_time': 0.0})
+        stats['count'] += 1
+        stats['total_time'] += elapsed
+
+    def top_statements(self, limit: int = 10, key: str = 'total_time') -> List[Dict[str, Any]]:
+        ranked = sorted(self.statements.items(), key=lambda item: item[1][key], reverse=True)
+        return [ {'statement': shape, **stats} for shape, stats in ranked[:limit] ]
+
+
+class SyncMetrics:
+    """
+    Collects per-stage wall time, DB round-trips and Spotify HTTP timings for one sync run
+    """
+
+    def __init__(self, sync_source: str):
+        self.sync_source = sync_source
+        self.stages: Dict[str, float] = {}
+        self.http_requests: Dict[str, Dict[str, Any]] = {}
+        self.queries: Optional[QueryRecorder] = None
+        self._started_at = time.perf_counter()
+
+    @contextmanager
+    def recording(self, engine):
+        self.queries = QueryRecorder(engine)
+        self.queries.start()
+        try:
+            yield self
+        finally:
+            self.queries.stop()
+
+    @contextmanager
+    def stage(self, name: str):
+        started_at = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.stages[name] = self.stages.get(name, 0.0) + (time.perf_counter() - started_at)
+
+    def record_http(self, name: str, elapsed: float, status_code: Optional[int] = None) -> None:
+        stats = self.http_requests.setdefault(name, {'count': 0, 'total_time': 0.0, 'errors': 0})
+        stats['count'] += 1
+        stats['total_time'] += elapsed
+        if status_code is None or status_code >= 400:
+            stats['errors'] += 1
+
+    def summary(self) -> Dict[str, Any]:
+        return {
+            'total_time': round(time.perf_counter() - self._started_at, 4),
+            'stages': { name: round(elapsed, 4) for name, elapsed in self.stages.items() },
+            'http': { name: {**stats, 'total_time': round(stats['total_time'], 4)} for name, stats in self.http_requests.items() },
+            'db': {
+                'queries': self.queries.count if self.queries else 0,
+                'total_time': round(self.queries.total_time, 4) if self.queries else 0.0
+            }
+        }
+
+    def write_prometheus_textfile(self, directory: str) -> None:
+        """
+        Writes the summary in the node_exporter textfile collector format. The file is
+        written to a temp path and renamed so the collector never reads a partial file.
+        """
+        summary = self.summary()
+        labels = f'sync_source="{self.sync_source}"'
+        lines = [
+            '# TYPE spotilens_sync_duration_seconds gauge',
+            f'spotilens_sync_duration_seconds{{{labels}}} {summary["total_time"]}',
+            '# TYPE spotilens_sync_stage_duration_seconds gauge',
+            *[ f'spotilens_sync_stage_duration_seconds{{{labels},stage="{name}"}} {elapsed}' for name, elapsed in summary['stages'].items() ],
+            '# TYPE spotilens_sync_http_requests gauge',
+            *[ f'spotilens_sync_http_requests{{{labels},endpoint="{name}"}} {stats["count"]}' for name, stats in summary['http'].items() ],
+            '# TYPE spotilens_sync_http_duration_seconds gauge',
+            *[ f'spotilens_sync_http_duration_seconds{{{labels},endpoint="{name}"}} {stats["total_time"]}' for name, stats in summary['http'].items() ],
+            '# TYPE spotilens_sync_db_queries gauge',
+            f'spotilens_sync_db_queries{{{labels}}} {summary["db"]["queries"]}',
+            '# TYPE spotilens_sync_db_duration_seconds gauge',
+            f'spotilens_sync_db_duration_seconds{{{labels}}} {summary["db"]["total_time"]}',
+            '# TYPE spotilens_sync_last_run_timestamp_seconds gauge',
+            f'spotilens_sync_last_run_timestamp_seconds{{{labels}}} {int(time.time())}'
+        ]
+
+        os.makedirs(directory, exist_ok=True)
+        file_path = os.path.join(directory, f"spotilens_{self.sync_source.replace('-', '_')}.prom")
+        tmp_path = f"{file_path}.tmp"
+        with open(tmp_path, 'w') as f:
+            f.write('\n'.join(lines) + '\n')
+        os.replace(tmp_path, file_path)
+        logger.info(f"Wrote sync metrics to {file_path}")
+
+
+def normalize_statement(statement: str) -> str:
+    """
+    Collapses whitespace and expanded IN lists so the same query shape groups together
+    """
+    shape = re.sub(r'\s+', ' ', statement).strip()
+    return re.sub(r'IN \((?:[^()]*)\)', 'IN (...)', shape)
@@ -0,0 +1,308 @@
+import os
+import sys
+import json
+import mmap
+import array
+import bisect
+from collections import Counter
+from itertools import compress
+from config.logger import logger
+from utils.cold_storage import epoch_ms
+from datetime import datetime, timezone
+from typing import Dict, List, Optional, Tuple, Any
+
+MAGIC = b'SPOTILENS-STORE\n'
+FORMAT_VERSION = 1
+STREAM_BATCH_SIZE = 10_000
+MS_PER_HOUR = 3_600_000
+MS_PER_DAY = 86_400_000
+
+# column name -> array typecode; plays are sorted by played_at so time windows are two bisects
+PLAY_COLUMNS = {'played_at': 'q', 'track': 'i', 'user': 'i'}
+# per-track dimension columns, artists as CSR (offsets into a flat list of artist indices)
+DIMENSION_COLUMNS = {
+    'track_id': 'i', 'track_name': 'i', 'track_album': 'i', 'track_artist_offsets': 'i', 'track_artists': 'i',
+    'album_id': 'i', 'album_name': 'i', 'artist_id': 'i', 'artist_name': 'i', 'user_id': 'i',
+    'string_offsets': 'q'
+}
+
+class ListeningStore:
+    """
+    Read-only columnar copy of listening history for interactive exploration. Plays are three parallel
+    arrays (int64 epoch ms, int32 track index, int32 user index) sorted by played_at; tracks, albums and
+    artists are dictionary-encoded against an interned string table. Queries slice the arrays and count
+    with Counter, no ORM objects are created. `save` writes a snapshot that `open` memory-maps, so a
+    restart does not reread the table.
+    """
+
+    def __init__(self, columns: Dict[str, Any], strings: bytes, meta: Dict[str, Any]):
+        self.columns = columns
+        self.strings = strings
+        self.meta = meta
+        self._string_cache = {}
+
+    def __len__(self) -> int:
+        return len(self.columns['played_at'])
+
+    # building
+    @classmethod
+    def build(cls, engine=None) -> 'ListeningStore':
+        """
+        Streams the plays of both listening history tiers (server-side cursors on Postgres) into columns
+        """
+        from config.postgres import get_engine
+        from utils.cold_storage import iter_plays
+
+        builder = _Builder()
+        engine = engine or get_engine('analytics')
+        with engine.connect() as connection:
+            for played_at_ms, track_id, user_id, _ in iter_plays(connection, batch_size=STREAM_BATCH_SIZE):
+                builder.add_play(played_at_ms, track_id, user_id)
+            builder.add_dimensions(connection)
+
+        store = builder.finish()
+        logger.info(f"Built listening store with {len(store)} plays, {store.meta['tracks']} tracks, {store.meta['albums']} albums, {store.meta['artists']} artists")
+        return store
+
+    @classmethod
+    def open(cls, path: str) -> 'ListeningStore':
+        """
+        Memory-maps a snapshot written by `save`, columns are zero-copy views into the file
+        """
+        with open(path, 'rb') as f:
+            mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        if mapped[:len(MAGIC)] != MAGIC:
+            raise ValueError(f"{path} is not a listening store snapshot")
+        header_size = int.from_bytes(mapped[len(MAGIC):len(MAGIC) + 8], 'little')
+        header_start = len(MAGIC) + 8
+        meta = json.loads(mapped[header_start:header_start + header_size])
+        if meta['version'] != FORMAT_VERSION or meta['byteorder'] != sys.byteorder:
+            raise ValueError(f"{path} was written by an incompatible version or platform, rebuild it")
+
+        data = memoryview(mapped)[_aligned(header_start + header_size):]
+        columns = { name: data[offset:offset + size].cast(typecode) for name, (typecode, offset, size) in meta['columns'].items() }
+        strings_offset, strings_size = meta['strings']
+        return cls(columns, data[strings_offset:strings_offset + strings_size], meta)
+
+    @classmethod
+    def load_or_build(cls, path: str, rebuild: bool = False) -> 'ListeningStore':
+        if not rebuild and os.path.exists(path):
+            try:
+                return cls.open(path)
+            except ValueError as e:
+                logger.warning(f"Ignoring snapshot: {str(e)}")
+
+        store = cls.build()
+        store.save(path)
+        return store
+
+    def save(self, path: str) -> None:
+        """
+        Writes the snapshot atomically: a temp file renamed into place. Layout: magic, header length,
+        JSON header, then the 8-byte aligned columns and the string blob (offsets relative to the data)
+        """
+        layout, offset = {}, 0
+        for name, column in self.columns.items():
+            layout[name] = (column.format, offset, column.nbytes)
+            offset = _aligned(offset + column.nbytes)
+
+        meta = {key: value for key, value in self.meta.items() if key not in ('columns', 'strings')}
+        meta.update({'version': FORMAT_VERSION, 'byteorder': sys.byteorder, 'columns': layout, 'strings': (offset, len(self.strings))})
+        header = json.dumps(meta).encode()
+        data_start = _aligned(len(MAGIC) + 8 + len(header))
+
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, 'wb') as f:
+            f.write(MAGIC + len(header).to_bytes(8, 'little') + header)
+            for name, column in self.columns.items():
+                f.seek(data_start + layout[name][1])
+                f.write(column)
+            f.seek(data_start + offset)
+            f.write(self.strings)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+        logger.info(f"Saved listening store snapshot to {path} ({os.path.getsize(path) / 1024 / 1024:.1f} MiB)")
+
+    # queries, `start`/`end` are datetimes (naive means UTC), `end` is exclusive
+    def window(self, start: Optional[datetime] = None, end: Optional[datetime] = None) -> Tuple[int, int]:
+        played_at = self.columns['played_at']
+        lo = bisect.bisect_left(played_at, epoch_ms(start)) if start else 0
+        hi = bisect.bisect_left(played_at, epoch_ms(end)) if end else len(played_at)
+        return lo, hi
+
+    def count(self, start: Optional[datetime] = None, end: Optional[datetime] = None, user_id: Optional[str] = None) -> int:
+        if user_id is None:
+            lo, hi = self.window(start, end)
+            return hi - lo
+        return sum(self._track_counts(start, end, user_id).values())
+
+    def top_tracks(self, limit: int = 10, start: Optional[datetime] = None, end: Optional[datetime] = None, user_id: Optional[str] = None) -> List[Dict[str, Any]]:
+        return [
+            {'track_id': self._label('track_id', track), 'name': self._label('track_name', track), 'plays': plays}
+            for track, plays in self._track_counts(start, end, user_id).most_common(limit)
+        ]
+
+    def top_albums(self, limit: int = 10, start: Optional[datetime] = None, end: Optional[datetime] = None, user_id: Optional[str] = None) -> List[Dict[str, Any]]:
+        counts = self.group_by('album', start, end, user_id)
+        return [
+            {'album_id': self._label('album_id', album), 'name': self._label('album_name', album), 'plays': plays}
+            for album, plays in counts.most_common(limit)
+        ]
+
+    def top_artists(self, limit: int = 10, start: Optional[datetime] = None, end: Optional[datetime] = None, user_id: Optional[str] = None) -> List[Dict[str, Any]]:
+        counts = self.group_by('artist', start, end, user_id)
+        return [
+            {'artist_id': self._label('artist_id', artist), 'name': self._label('artist_name', artist), 'plays': plays}
+            for artist, plays in counts.most_common(limit)
+        ]
+
+    def group_by(self, key: str, start: Optional[datetime] = None, end: Optional[datetime] = None, user_id: Optional[str] = None) -> Counter:
+        """
+        Play counts per 'track', 'album' or 'artist' index, or per UTC 'hour' (0-23), 'weekday' (0 = Monday) or 'day' (epoch day)
+        """
+        if key in ('track', 'album', 'artist'):
+            # count tracks once, then fold the (much smaller) per-track counts into albums/artists
+            track_counts = self._track_counts(start, end, user_id)
+            if key == 'track':
+                return track_counts
+
+            counts = Counter()
+            if key == 'album':
+                albums = self.columns['track_album']
+                for track, plays in track_counts.items():
+                    counts[albums[track]] += plays
+            else:
+                offsets, artists = self.columns['track_artist_offsets'], self.columns['track_artists']
+                for track, plays in track_counts.items():
+                    for artist in artists[offsets[track]:offsets[track + 1]]:
+                        counts[artist] += plays
+            return counts
+
+        played_at = self._slice('played_at', start, end, user_id)
+        if key == 'hour':
+            return Counter(ms // MS_PER_HOUR % 24 for ms in played_at)
+        if key == 'weekday':
+            # 1970-01-01 was a Thursday
+            return Counter((ms // MS_PER_DAY + 3) % 7 for ms in played_at)
+        if key == 'day':
+            return Counter(ms // MS_PER_DAY for ms in played_at)
+        raise ValueError(f"Unknown group_by key '{key}'")
+
+    def string(self, index: int) -> str:
+        if index not in self._string_cache:
+            offsets = self.columns['string_offsets']
+            self._string_cache[index] = bytes(self.strings[offsets[index]:offsets[index + 1]]).decode()
+        return self._string_cache[index]
+
+    def _track_counts(self, start, end, user_id) -> Counter:
+        return Counter(self._slice('track', start, end, user_id))
+
+    def _slice(self, column: str, start, end, user_id):
+        lo, hi = self.window(start, end)
+        values = self.columns[column][lo:hi]
+        if user_id is None:
+            return values
+
+        user = self._user_index(user_id)
+        if user is None:
+            return []
+        return compress(values, (play_user == user for play_user in self.columns['user'][lo:hi]))
+
+    def _user_index(self, user_id: str) -> Optional[int]:
+        user_ids = self.columns['user_id']
+        for index in range(len(user_ids)):
+            if self.string(user_ids[index]) == user_id:
+                return index
+        return None
+
+    def _label(self, column: str, index: int) -> str:
+        return self.string(self.columns[column][index])
+
+class _Builder:
+    def __init__(self):
+        self.strings = {}
+        self.string_list = []
+        self.columns = { name: array.array(typecode) for name, typecode in {**PLAY_COLUMNS, **DIMENSION_COLUMNS}.items() }
+        self.track_index = {}
+        self.user_index = {}
+        self.album_count = 0
+        self.artist_count = 0
+
+    def intern(self, value: Optional[str]) -> int:
+        value = value or ''
+        if value not in self.strings:
+            self.strings[value] = len(self.string_list)
+            self.string_list.append(value)
+        return self.strings[value]
+
+    def add_play(self, played_at_ms: int, track_id: str, user_id: Optional[str]) -> None:
+        if track_id not in self.track_index:
+            self.track_index[track_id] = len(self.track_index)
+        if user_id not in self.user_index:
+            self.user_index[user_id] = len(self.user_index)
+            self.columns['user_id'].append(self.intern(user_id))
+
+        self.columns['played_at'].append(played_at_ms)
+        self.columns['track'].append(self.track_index[track_id])
+        self.columns['user'].append(self.user_index[user_id])
+
+    def add_dimensions(self, connection) -> None:
+        """
+        Reads the dimensions of the tracks that were played, the catalog is small next to the plays
+        """
+        from sqlalchemy import select
+        from db.models.tracks import Track
+        from db.models.albums import Album
+        from db.models.artists import Artist
+        from db.models.track_artists import TrackArtist
+
+        tracks = { track_id: (name, album_id) for track_id, name, album_id in connection.execute(select(Track.track_id, Track.name, Track.album_id)) }
+        albums = dict(connection.execute(select(Album.album_id, Album.name)).all())
+        artists = dict(connection.execute(select(Artist.artist_id, Artist.name)).all())
+        artists_by_track = {}
+        for track_id, artist_id in connection.execute(select(TrackArtist.track_id, TrackArtist.artist_id).order_by(TrackArtist.track_id, TrackArtist.artist_id)):
+            artists_by_track.setdefault(track_id, []).append(artist_id)
+
+        album_index, artist_index = {}, {}
+        def index_of(key, index, id_column, name_column, names):
+            if key not in index:
+                index[key] = len(index)
+                self.columns[id_column].append(self.intern(key))
+                self.columns[name_column].append(self.intern(names.get(key)))
+            return index[key]
+
+        self.columns['track_artist_offsets'].append(0)
+        # self.track_index is in first-play order, which is also the order of the track columns
+        for track_id in self.track_index:
+            name, album_id = tracks.get(track_id, (None, None))
+            self.columns['track_id'].append(self.intern(track_id))
+            self.columns['track_name'].append(self.intern(name))
+            self.columns['track_album'].append(index_of(album_id, album_index, 'album_id', 'album_name', albums))
+            for artist_id in artists_by_track.get(track_id, []):
+                self.columns['track_artists'].append(index_of(artist_id, artist_index, 'artist_id', 'artist_name', artists))
+            self.columns['track_artist_offsets'].append(len(self.columns['track_artists']))
+
+        self.album_count, self.artist_count = len(album_index), len(artist_index)
+
+    def finish(self) -> ListeningStore:
+        encoded = [ value.encode() for value in self.string_list ]
+        offsets = self.columns['string_offsets']
+        offsets.append(0)
+        for value in encoded:
+            offsets.append(offsets[-1] + len(value))
+
+        meta = {
+            'built_at': datetime.now(timezone.utc).isoformat(),
+            'plays': len(self.columns['played_at']),
+            'tracks': len(self.track_index),
+            'albums': self.album_count,
+            'artists': self.artist_count
+        }
+        columns = { name: memoryview(column) for name, column in self.columns.items() }
+        return ListeningStore(columns, b''.join(encoded), meta)
+
+def _aligned(offset: int) -> int:
+    return (offset + 7) // 8 * 8
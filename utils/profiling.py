@@ -0,0 +1,83 @@
+import io
+import os
+import pstats
+import inspect
+import cProfile
+import functools
+from datetime import datetime
+from config.logger import logger
+import utils.constants as constants
+from invoke.collection import Collection
+
+PROFILE_DIR = os.path.join(os.getcwd(), 'log', 'profiles')
+TOP_N = 15
+
+def add_profile_option(collection: Collection) -> Collection:
+    """
+    Adds a `--profile` flag to every task in the collection (and its sub-collections)
+    """
+    for task in collection.tasks.values():
+        if not getattr(task.body, 'profileable', False):
+            task.body = profileable(task.body)
+            task.help['profile'] = 'Run under cProfile and report SQL statement counts and timings'
+
+    for sub_collection in collection.collections.values():
+        add_profile_option(sub_collection)
+
+    return collection
+
+def profileable(func):
+    @functools.wraps(func)
+    def wrapper(ctx, *args, profile=False, **kwargs):
+        if not profile:
+            return func(ctx, *args, **kwargs)
+        return run_profiled(func, ctx, *args, **kwargs)
+
+    # invoke builds the task's CLI flags from the signature, so expose `profile` there
+    signature = inspect.signature(func)
+    profile_param = inspect.Parameter('profile', inspect.Parameter.KEYWORD_ONLY, default=False)
+    wrapper.__signature__ = signature.replace(parameters=[*signature.parameters.values(), profile_param])
+    wrapper.profileable = True
+
+    return wrapper
+
+def run_profiled(func, *args, **kwargs):
+    from sqlalchemy.engine import Engine
+    from utils.instrumentation import QueryRecorder
+
+    profiler = cProfile.Profile()
+    # listening on the Engine class covers every engine profile, including ones created during the run
+    queries = QueryRecorder(Engine)
+    queries.start()
+    profiler.enable()
+    try:
+        return func(*args, **kwargs)
+    finally:
+        profiler.disable()
+        queries.stop()
+
+        os.makedirs(PROFILE_DIR, exist_ok=True)
+        stats_path = os.path.join(PROFILE_DIR, f"{func.__name__}.{datetime.now().strftime('%Y-%m-%dT%H-%M-%S')}.prof")
+        profiler.dump_stats(stats_path)
+
+        _report_functions(profiler)
+        _report_queries(queries)
+        logger.info(f"Profile written to {stats_path} (open with `python -m pstats` or snakeviz)")
+
+def _report_functions(profiler: cProfile.Profile) -> None:
+    buffer = io.StringIO()
+    pstats.Stats(profiler, stream=buffer).sort_stats('cumulative').print_stats(TOP_N)
+    logger.info(f"Top {TOP_N} functions by cumulative time:\n{buffer.getvalue()}")
+
+def _report_queries(queries) -> None:
+    logger.info(f"{queries.count} SQL statements executed in {queries.total_time:.3f}s ({len(queries.statements)} distinct shapes)")
+
+    for title, key in (('count', 'count'), ('total time', 'total_time')):
+        lines = [ f"{stats['count']:>7} calls {stats['total_time']:>9.3f}s  {stats['statement'][:160]}" for stats in queries.top_statements(TOP_N, key=key) ]
+        logger.info(f"Top SQL statements by {title}:\n" + '\n'.join(lines))
+
+    threshold = constants.PROFILE_N_PLUS_ONE_THRESHOLD
+    for stats in queries.top_statements(len(queries.statements), key='count'):
+        if stats['count'] <= threshold:
+            break
+        logger.warning(f"Possible N+1: statement ran {stats['count']} times (threshold {threshold}): {stats['statement'][:160]}")
@@ -0,0 +1,196 @@
+import os
+import gzip
+import json
+import time
+import fcntl
+from config.logger import logger
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterator, List, Optional, Tuple, Any
+
+SEGMENT_SUFFIX = '.jsonl.gz'
+# per segment count of failed loads, kept across drains until the segment loads or is quarantined
+FAILURES_FILE = '.load-failures.json'
+MAX_LOAD_ATTEMPTS = 3
+
+class Spool:
+    """
+    Local write-ahead spool for fetched payloads. Every `append` writes one immutable, gzipped
+    JSONL segment (written to a temp file, fsynced, then renamed into place), so a payload is
+    on disk before the database is touched. `drain` hands whole segments to a loader in batches
+    and deletes them only after the loader has committed; a failed drain leaves them for the next run,
+    and a segment that keeps failing is moved to quarantine so it does not block the ones behind it.
+    """
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        self.quarantine_directory = os.path.join(directory, 'quarantine')
+
+    def append(self, items: List[Dict[str, Any]], entry_type: str, user_id: Optional[str] = None) -> Optional[str]:
+        if not items:
+            return None
+
+        os.makedirs(self.directory, exist_ok=True)
+        # nanosecond timestamp first, so segments sort in the order they were fetched
+        segment_name = f"{time.time_ns()}-{os.getpid()}-{entry_type}{SEGMENT_SUFFIX}"
+        segment_path = os.path.join(self.directory, segment_name)
+        tmp_path = f"{segment_path}.tmp"
+
+        with open(tmp_path, 'wb') as f:
+            with gzip.GzipFile(fileobj=f, mode='wb') as gz:
+                for item in items:
+                    record = {'entry_type': entry_type, 'user_id': user_id, 'payload': item}
+                    gz.write(json.dumps(record, separators=(',', ':')).encode() + b'\n')
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, segment_path)
+        self._fsync_directory()
+
+        logger.info(f"Spooled {len(items)} items to {segment_name}")
+        return segment_path
+
+    def segments(self) -> List[str]:
+        if not os.path.isdir(self.directory):
+            return []
+        return sorted(os.path.join(self.directory, name) for name in os.listdir(self.directory) if name.endswith(SEGMENT_SUFFIX))
+
+    def read_segment(self, segment_path: str) -> List[Dict[str, Any]]:
+        with gzip.open(segment_path, 'rt') as f:
+            return [ json.loads(line) for line in f if line.strip() ]
+
+    def drain(self, load: Callable[[List[Dict[str, Any]]], Any], batch_size: int = 5000, max_attempts: int = MAX_LOAD_ATTEMPTS, transient_errors: Tuple[type, ...] = ()) -> Dict[str, int]:
+        """
+        Calls `load(records)` with the records of one or more whole segments at a time. `load` must
+        commit before returning; the segments of a batch are deleted only once it has.
+
+        When a batch fails, its segments are retried one by one so a bad segment cannot hold back the
+        others. A segment whose load fails `max_attempts` times (counted across drains) is quarantined.
+        Errors of a `transient_errors` type, e.g. the database being unreachable, are not held against
+        any segment: the drain stops and re-raises, leaving everything for the next run.
+        """
+        stats = {'segments': 0, 'records': 0, 'batches': 0, 'failed': 0, 'quarantined': 0}
+        with self._lock() as acquired:
+            if not acquired:
+                logger.warning(f"Another process is draining {self.directory}, skipping")
+                return stats
+
+            for batch in self._batches(batch_size):
+                try:
+                    loaded = self._load(load, batch)
+                except transient_errors:
+                    raise
+                except Exception as e:
+                    if len(batch) == 1:
+                        self._record_failure(batch[0][0], e, max_attempts, stats)
+                        continue
+                    logger.warning(f"Loading a batch of {len(batch)} segments failed, retrying them one by one: {e}")
+                    loaded = []
+                    for segment in batch:
+                        try:
+                            loaded += self._load(load, [segment])
+                        except transient_errors:
+                            raise
+                        except Exception as segment_error:
+                            self._record_failure(segment[0], segment_error, max_attempts, stats)
+
+                if loaded:
+                    stats['segments'] += len(loaded)
+                    stats['records'] += sum(len(records) for _, records in loaded)
+                    stats['batches'] += 1
+                    logger.info(f"Drained {sum(len(records) for _, records in loaded)} records from {len(loaded)} segments")
+
+        return stats
+
+    def remove(self, segment_paths: List[str]) -> None:
+        """
+        Deletes segments whose records have been committed elsewhere
+        """
+        for segment_path in segment_paths:
+            try:
+                os.remove(segment_path)
+            except FileNotFoundError:
+                pass
+        self._fsync_directory()
+        self._forget_failures(segment_paths)
+
+    def _batches(self, batch_size: int) -> Iterator[List[Tuple[str, List[Dict[str, Any]]]]]:
+        batch, batch_records = [], 0
+        for segment_path in self.segments():
+            try:
+                segment_records = self.read_segment(segment_path)
+            except (OSError, EOFError, ValueError) as e:
+                self._quarantine(segment_path, e)
+                continue
+
+            batch.append((segment_path, segment_records))
+            batch_records += len(segment_records)
+            if batch_records >= batch_size:
+                yield batch
+                batch, batch_records = [], 0
+
+        if batch:
+            yield batch
+
+    def _load(self, load: Callable, batch: List[Tuple[str, List[Dict[str, Any]]]]) -> List[Tuple[str, List[Dict[str, Any]]]]:
+        load([ record for _, records in batch for record in records ])
+        self.remove([ segment_path for segment_path, _ in batch ])
+        return batch
+
+    def _record_failure(self, segment_path: str, error: Exception, max_attempts: int, stats: Dict[str, int]) -> None:
+        failures = self._read_failures()
+        name = os.path.basename(segment_path)
+        failures[name] = failures.get(name, 0) + 1
+        stats['failed'] += 1
+        if failures[name] >= max_attempts:
+            del failures[name]
+            self._quarantine(segment_path, f"load failed {max_attempts} times, last error: {error}")
+            stats['quarantined'] += 1
+        else:
+            logger.warning(f"Loading spool segment {name} failed (attempt {failures[name]}/{max_attempts}), keeping it for the next drain: {error}")
+        self._write_failures(failures)
+
+    def _forget_failures(self, segment_paths: List[str]) -> None:
+        failures = self._read_failures()
+        names = { os.path.basename(segment_path) for segment_path in segment_paths } & set(failures)
+        if names:
+            self._write_failures({ name: count for name, count in failures.items() if name not in names })
+
+    def _read_failures(self) -> Dict[str, int]:
+        try:
+            with open(os.path.join(self.directory, FAILURES_FILE), 'r') as f:
+                return json.load(f)
+        except (FileNotFoundError, ValueError):
+            return {}
+
+    def _write_failures(self, failures: Dict[str, int]) -> None:
+        failures_path = os.path.join(self.directory, FAILURES_FILE)
+        with open(f"{failures_path}.tmp", 'w') as f:
+            json.dump(failures, f)
+        os.replace(f"{failures_path}.tmp", failures_path)
+
+    def _quarantine(self, segment_path: str, error: Any) -> None:
+        # an unreadable or unloadable segment must not block the ones behind it, keep it around for inspection
+        os.makedirs(self.quarantine_directory, exist_ok=True)
+        os.replace(segment_path, os.path.join(self.quarantine_directory, os.path.basename(segment_path)))
+        logger.error(f"Moved spool segment {os.path.basename(segment_path)} to quarantine: {error}")
+
+    @contextmanager
+    def _lock(self):
+        os.makedirs(self.directory, exist_ok=True)
+        with open(os.path.join(self.directory, '.drain.lock'), 'w') as lock_file:
+            try:
+                fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                yield False
+                return
+            try:
+                yield True
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _fsync_directory(self) -> None:
+        # makes the rename/unlink itself durable, not just the file contents
+        fd = os.open(self.directory, os.O_RDONLY)
+        try:
+            os.fsync(fd)
+        finally:
+            os.close(fd)
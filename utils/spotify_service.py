@@ -1,22 +1,78 @@
 import requests
+import asyncio
 import base64
 import time
+import threading
 from datetime import datetime
 from config.logger import logger
 import utils.constants as constants
-from typing import Dict, Optional, Any
+from typing import Callable, Dict, List, Optional, Any
 
-class SpotifyService:
-    def __init__(self):
+class RequestBudget:
+    """
+    Token bucket limiting how many Spotify calls may be made per minute by the calls that hold a
+    reference to it. A budget with a `parent` also takes a token from the parent for every call,
+    e.g. one budget per account under an app-wide one, since Spotify also rate limits per app.
+    """
+
+    def __init__(self, requests_per_minute: float, burst: Optional[int] = None, parent: Optional['RequestBudget'] = None):
+        self.rate = requests_per_minute / 60
+        self.capacity = burst or max(int(requests_per_minute // 6), 1)
+        self.tokens = float(self.capacity)
+        self.updated_at = time.monotonic()
+        self.parent = parent
+        self._lock = threading.Lock()
+
+    def acquire(self) -> None:
+        while (wait_time := self._take()) > 0:
+            time.sleep(wait_time)
+        if self.parent:
+            self.parent.acquire()
+
+    async def acquire_async(self) -> None:
+        while (wait_time := self._take()) > 0:
+            await asyncio.sleep(wait_time)
+        if self.parent:
+            await self.parent.acquire_async()
+
+    def _take(self) -> float:
+        """
+        Takes a token if one is available, otherwise returns how long to wait for the next one
+        """
+        with self._lock:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+            self.updated_at = now
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return 0
+            return (1 - self.tokens) / self.rate
+
+class SpotifyClientBase:
+    """
+    Token refresh, refresh token rotation, 429 handling and request accounting shared by SpotifyService
+    and AsyncSpotifyService; the subclasses only perform the I/O and the waiting
+    """
+    MAX_RATE_LIMIT_RETRIES = 3
+    MAX_RETRY_AFTER_SECONDS = 60
+    MAX_TOKEN_ATTEMPTS = 5
+    TRACKS_BATCH_SIZE = 50
+    TOKEN_URL = "https://accounts.spotify.com/api/token"
+
+    def __init__(self, metrics: Optional[Any] = None, refresh_token: Optional[str] = None, request_budget: Optional[RequestBudget] = None, on_refresh_token: Optional[Callable[[str], None]] = None):
+        self.metrics = metrics
+        self.request_budget = request_budget
         self.access_token = None
+        self.access_token_expires_at = 0.0
         self.client_id = constants.SPOTIFY_CLIENT_ID
         self.client_secret = constants.SPOTIFY_CLIENT_SECRET
-        self.refresh_token = constants.SPOTIFY_REFRESH_TOKEN
+        self.refresh_token = refresh_token or constants.SPOTIFY_REFRESH_TOKEN
+        self.on_refresh_token = on_refresh_token
         self.base_url = "https://api.spotify.com/v1"
 
-    def _get_access_token(self, max_retries: int = 5) -> str:
+    def _token_request_kwargs(self) -> Dict[str, Any]:
         """
-        Generate access token using client credentials and refresh token with retry logic
+        Arguments of the call that exchanges the refresh token for an access token
         """
         auth_str = f"{self.client_id}:{self.client_secret}"
         b64_auth_str = base64.b64encode(auth_str.encode()).decode()
@@ -28,30 +84,108 @@ class SpotifyService:
             "grant_type": "refresh_token",
             "refresh_token": self.refresh_token
         }
+        return {'headers': headers, 'data': data, 'timeout': 10}
+
+    def _accept_token(self, token_data: Dict[str, Any]) -> str:
+        # refresh a minute early so long-running callers never send an expired token
+        self.access_token_expires_at = time.monotonic() + token_data.get("expires_in", 3600) - 60
+        if token_data.get("refresh_token") and token_data["refresh_token"] != self.refresh_token:
+            self._rotate_refresh_token(token_data["refresh_token"])
+        logger.info("Successfully generated new access token")
+        return token_data["access_token"]
+
+    def _token_retry_wait(self, attempt: int, error: Exception) -> Optional[float]:
+        """
+        Seconds to wait before retrying a failed token request, None once the attempts are used up
+        """
+        if attempt == self.MAX_TOKEN_ATTEMPTS - 1:
+            logger.error(f"Failed to get access token after {self.MAX_TOKEN_ATTEMPTS} attempts: {str(error)}")
+            return None
+
+        wait_time = (2 ** attempt) + (0.1 * attempt)
+        logger.warning(f"Access token request failed (attempt {attempt + 1}/{self.MAX_TOKEN_ATTEMPTS}), retrying in {wait_time:.1f}s: {str(error)}")
+        return wait_time
+
+    def _rotate_refresh_token(self, refresh_token: str) -> None:
+        # Spotify may return a new refresh token with the access token, the old one can stop working
+        self.refresh_token = refresh_token
+        if self.on_refresh_token:
+            self.on_refresh_token(refresh_token)
+        else:
+            logger.warning("Spotify rotated the refresh token, it is only kept for this run; update SPOTIFY_REFRESH_TOKEN")
+
+    def _token_expired(self) -> bool:
+        return not self.access_token or time.monotonic() >= self.access_token_expires_at
+
+    def _auth_headers(self) -> Dict[str, str]:
+        return {
+            "Authorization": f"Bearer {self.access_token}",
+            "Content-Type": "application/json"
+        }
+
+    def _record_http(self, name: str, started_at: float, status_code: Optional[int]) -> None:
+        if self.metrics:
+            self.metrics.record_http(name, time.perf_counter() - started_at, status_code)
+
+    def _rate_limit_wait(self, name: str, response: Any, attempt: int) -> Optional[float]:
+        """
+        Seconds to wait before retrying a rate limited call (honouring Retry-After), None when the
+        response should be returned as it is
+        """
+        if response.status_code != 429 or attempt == self.MAX_RATE_LIMIT_RETRIES:
+            return None
+
+        wait_time = min(float(response.headers.get('Retry-After', 1)), self.MAX_RETRY_AFTER_SECONDS)
+        logger.warning(f"Rate limited on {name} (attempt {attempt + 1}/{self.MAX_RATE_LIMIT_RETRIES}), retrying in {wait_time:.0f}s")
+        return wait_time
 
-        for attempt in range(max_retries):
+class SpotifyService(SpotifyClientBase):
+    def __init__(self, metrics: Optional[Any] = None, refresh_token: Optional[str] = None, request_budget: Optional[RequestBudget] = None, on_refresh_token: Optional[Callable[[str], None]] = None):
+        super().__init__(metrics, refresh_token, request_budget, on_refresh_token)
+        self.track_cache = {}
+        # keeps the TLS connections to Spotify warm across calls
+        self.http = requests.Session()
+
+    def _get_access_token(self) -> str:
+        """
+        Generate access token using client credentials and refresh token with retry logic
+        """
+        for attempt in range(self.MAX_TOKEN_ATTEMPTS):
             try:
-                response = requests.post(
-                    "https://accounts.spotify.com/api/token",
-                    headers=headers,
-                    data=data,
-                    timeout=10
-                )
+                response = self._request('token', 'POST', self.TOKEN_URL, **self._token_request_kwargs())
                 response.raise_for_status()
-                access_token = response.json()["access_token"]
-                logger.info("Successfully generated new access token")
-                return access_token
-            except (requests.exceptions.RequestException, requests.exceptions.HTTPError) as e:
-                if attempt == max_retries - 1:
-                    logger.error(f"Failed to get access token after {max_retries} attempts: {str(e)}")
+                return self._accept_token(response.json())
+            except requests.exceptions.RequestException as e:
+                wait_time = self._token_retry_wait(attempt, e)
+                if wait_time is None:
                     raise
-
-                wait_time = (2 ** attempt) + (0.1 * attempt)
-                logger.warning(f"Access token request failed (attempt {attempt + 1}/{max_retries}), retrying in {wait_time:.1f}s: {str(e)}")
                 time.sleep(wait_time)
 
+    def _request(self, name: str, method: str, url: str, **kwargs) -> requests.Response:
+        """
+        Performs the HTTP call within the request budget, waits out 429 responses and records timings
+        on the attached metrics, if any
+        """
+        kwargs.setdefault('timeout', 30)
+        for attempt in range(self.MAX_RATE_LIMIT_RETRIES + 1):
+            if self.request_budget:
+                self.request_budget.acquire()
+
+            started_at = time.perf_counter()
+            status_code = None
+            try:
+                response = self.http.request(method, url, **kwargs)
+                status_code = response.status_code
+            finally:
+                self._record_http(name, started_at, status_code)
+
+            wait_time = self._rate_limit_wait(name, response, attempt)
+            if wait_time is None:
+                return response
+            time.sleep(wait_time)
+
     def _ensure_valid_token(self) -> None:
-        if not self.access_token:
+        if self._token_expired():
             self.access_token = self._get_access_token()
 
     def fetch_recently_played(self, limit: int = 50, cutoff_timestamp: str = '2025-06-10T00:00:00.000Z') -> Optional[Dict[str, Any]]:
@@ -63,15 +197,30 @@ class SpotifyService:
         params = {"limit": limit, "after": int(cutoff_timestamp_dt.timestamp() * 1000)}
 
         self._ensure_valid_token()
-        headers = {
-            "Authorization": f"Bearer {self.access_token}",
-            "Content-Type": "application/json"
-        }
-        response = requests.get(url, headers=headers, params=params)
+        response = self._request('recently_played', 'GET', url, headers=self._auth_headers(), params=params)
         response.raise_for_status()
         logger.info(f"Successfully fetched {limit} recently played tracks")
         return response.json()
 
+    def fetch_tracks(self, track_ids: List[str]) -> Dict[str, Optional[Dict[str, Any]]]:
+        """
+        Fetch full track objects (with album and artists) in batches of 50 ids per call. Results,
+        including ids Spotify no longer knows (None), are cached on the service for its lifetime.
+        """
+        missing = [ track_id for track_id in dict.fromkeys(track_ids) if track_id not in self.track_cache ]
+        for start in range(0, len(missing), self.TRACKS_BATCH_SIZE):
+            batch = missing[start:start + self.TRACKS_BATCH_SIZE]
+            self._ensure_valid_token()
+            response = self._request('tracks', 'GET', f"{self.base_url}/tracks", headers=self._auth_headers(), params={"ids": ','.join(batch)})
+            response.raise_for_status()
+            # the response is in request order, unknown ids come back as null
+            for track_id, track in zip(batch, response.json().get('tracks', [])):
+                self.track_cache[track_id] = track
+        if missing:
+            logger.info(f"Fetched {len(missing)} tracks in {-(-len(missing) // self.TRACKS_BATCH_SIZE)} requests")
+
+        return { track_id: self.track_cache.get(track_id) for track_id in track_ids }
+
     def fetch_artists(self):
         pass
 
@@ -0,0 +1,151 @@
+import os
+import sys
+import json
+import time
+import getpass
+from invoke.tasks import task
+from datetime import datetime, timezone
+from typing import Dict, Optional, Any
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from config.logger import logger, log_batch_summary
+
+REFRESH_TOKEN_ENV = 'SPOTIFY_ACCOUNT_REFRESH_TOKEN'
+
+@task()
+def add_account(ctx, user_id, display_name=None):
+    """
+    Registers or updates an account. The refresh token is read from SPOTIFY_ACCOUNT_REFRESH_TOKEN or
+    stdin, never from the command line, where it would end up in shell history and `ps` output.
+    """
+    from db.models.users import User
+    from config.postgres import close_session
+
+    refresh_token = _read_refresh_token()
+    try:
+        existing_user = User.fetch_record_by_id(user_id)
+        if existing_user:
+            existing_user.update_attributes({'refresh_token': refresh_token, 'display_name': display_name or existing_user.display_name, 'is_active': True})
+            logger.info(f"Updated account {user_id}")
+        else:
+            if not User.create_record({'user_id': user_id, 'refresh_token': refresh_token, 'display_name': display_name}):
+                raise RuntimeError(f"Could not add account {user_id}")
+            logger.info(f"Added account {user_id}")
+    finally:
+        close_session()
+
+@task()
+def sync_accounts(ctx, workers=8, requests_per_minute=120, app_requests_per_minute=None):
+    """
+    Syncs recently played for every active account over a bounded worker pool. Accounts are
+    scheduled stalest first, so a slow or rate-limited account only ever ties up one worker.
+    Every account gets its own budget of `requests_per_minute`; `app_requests_per_minute`
+    optionally caps all of them together, Spotify also rate limits the app as a whole.
+    """
+    from config.postgres import pool_capacity
+    from utils.spotify_service import RequestBudget
+
+    accounts = _fetch_accounts_by_staleness()
+    if not accounts:
+        logger.info('No active accounts to sync.')
+        return
+
+    workers = int(workers)
+    capacity = pool_capacity('sync')
+    # a worker holds its session's connection while the cold-tier check and the archive write check out a second one
+    if capacity is not None and workers > capacity // 2:
+        logger.warning(f"Limiting sync-accounts to {capacity // 2} workers, the sync engine pools {capacity} connections")
+        workers = max(capacity // 2, 1)
+
+    app_budget = RequestBudget(float(app_requests_per_minute)) if app_requests_per_minute else None
+    started_at = time.perf_counter()
+    results = {'success': 0, 'error': 0, 'items': 0}
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='account-sync') as pool:
+        futures = {
+            pool.submit(_sync_account, account, RequestBudget(float(requests_per_minute), parent=app_budget)): account['user_id']
+            for account in accounts
+        }
+        for future in as_completed(futures):
+            items = future.result()
+            if items is None:
+                results['error'] += 1
+            else:
+                results['success'] += 1
+                results['items'] += items
+
+    logger.info(f"Synced {len(accounts)} accounts in {time.perf_counter() - started_at:.1f}s: {json.dumps(results)}")
+
+# helper functions
+def _fetch_accounts_by_staleness():
+    from config.postgres import execute_query
+
+    # plain dicts, ORM objects must not cross into the worker threads' sessions
+    result = execute_query("""
+        SELECT user_id, refresh_token, last_played_at
+        FROM spotilens__users
+        WHERE is_active
+        ORDER BY last_synced_at ASC NULLS FIRST, user_id
+    """)
+    return [ dict(zip(result['columns'], row)) for row in result['rows'] ]
+
+def _sync_account(account: Dict[str, Any], request_budget: Any) -> Optional[int]:
+    """
+    Runs in a worker thread; returns the number of items stored, or None on failure
+    """
+    from db.models.users import User
+    from db.models.sync_logs import SyncLog
+    from config.postgres import close_session
+    from utils.helper import store_spotify_track_in_db
+    from utils.spotify_service import SpotifyService
+
+    user_id = account['user_id']
+    log_payload = {
+        'status': None,
+        'sync_source': 'recently-played-api',
+        'response': None
+    }
+    try:
+        spotify_service = SpotifyService(
+            refresh_token=account['refresh_token'],
+            request_budget=request_budget,
+            on_refresh_token=lambda refresh_token: User.update_records({'user_id': user_id}, {'refresh_token': refresh_token})
+        )
+        cursor_params = {'cutoff_timestamp': _to_cursor(account['last_played_at'])} if account['last_played_at'] else {}
+        response = spotify_service.fetch_recently_played(**cursor_params)
+
+        sorted_items = sorted(response['items'], key=lambda x: x['played_at'])
+        for item in sorted_items:
+            store_spotify_track_in_db(item, 'daily-sync', user_id=user_id)
+
+        fields = {'last_synced_at': datetime.now(timezone.utc)}
+        if sorted_items:
+            fields['last_played_at'] = datetime.fromisoformat(sorted_items[-1]['played_at'].replace('Z', '+00:00'))
+        User.update_records({'user_id': user_id}, fields)
+
+        log_payload['status'] = True
+        log_payload['response'] = json.dumps({'user_id': user_id, 'items': len(sorted_items)})
+        return len(sorted_items)
+    except Exception as e:
+        logger.error(f"Could not sync account {user_id}: {str(e)}")
+        log_payload['status'] = False
+        log_payload['response'] = json.dumps({'user_id': user_id, 'error': str(e)})
+        return None
+    finally:
+        SyncLog.create_record(log_payload)
+        log_batch_summary(f"Account {user_id}")
+        close_session()
+
+def _read_refresh_token() -> str:
+    refresh_token = os.getenv(REFRESH_TOKEN_ENV)
+    if not refresh_token:
+        refresh_token = getpass.getpass('Refresh token: ') if sys.stdin.isatty() else sys.stdin.readline()
+    refresh_token = refresh_token.strip()
+    if not refresh_token:
+        raise ValueError(f"No refresh token given, set {REFRESH_TOKEN_ENV} or pipe it to stdin")
+    return refresh_token
+
+def _to_cursor(played_at) -> str:
+    if isinstance(played_at, str):
+        played_at = datetime.fromisoformat(played_at)
+    if played_at.tzinfo is None:
+        played_at = played_at.replace(tzinfo=timezone.utc)
+    return played_at.astimezone(timezone.utc).isoformat(timespec='milliseconds').replace('+00:00', 'Z')
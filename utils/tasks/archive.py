@@ -0,0 +1,170 @@
+import json
+import time
+from invoke.tasks import task
+from config.logger import logger
+from typing import Dict, List, Any
+
+# children before parents, so a plain DELETE works where TRUNCATE ... CASCADE is not available
+DERIVED_TABLES = [
+    'spotilens__listening_history_cold',
+    'spotilens__track_keys',
+    'spotilens__listening_history',
+    'spotilens__track_artists',
+    'spotilens__album_artists',
+    'spotilens__tracks',
+    'spotilens__albums',
+    'spotilens__artists'
+]
+
+@task()
+def rebuild_from_archive(ctx, workers=4, chunk_size=5000, truncate=False):
+    """
+    Regenerates the normalized tables from the raw payload archive. Artists, albums and tracks are
+    rebuilt first, sequentially in first-seen order, so the row kept for an object that changed
+    between fetches is deterministic. Plays are then decoded in parallel id ranges and written in
+    range order, so they get the same play_ids on every rebuild.
+    """
+    import multiprocessing
+    from collections import deque
+    from itertools import islice
+    from concurrent.futures import ProcessPoolExecutor
+    from db.models.sync_logs import SyncLog
+    from config.postgres import close_session, execute_query, get_engine
+    from utils.helper import write_bulk_rows
+
+    log_payload = {
+        'status': None,
+        'sync_source': 'archive-rebuild',
+        'response': None
+    }
+    started_at = time.perf_counter()
+    try:
+        min_id, max_id = execute_query("SELECT MIN(id), MAX(id) FROM spotilens__raw_plays", profile='bulk-load')['rows'][0]
+        if min_id is None:
+            logger.info('Archive is empty, nothing to rebuild.')
+            return
+
+        if truncate:
+            _truncate_derived_tables()
+
+        stats = {'tracks': _rebuild_dimensions(int(chunk_size)), 'plays': 0}
+        logger.info(f"Rebuilt dimensions for {stats['tracks']} archived tracks in {time.perf_counter() - started_at:.1f}s")
+
+        chunk_size = int(chunk_size)
+        ranges = [ (start_id, start_id + chunk_size) for start_id in range(min_id, max_id + 1, chunk_size) ]
+        # spawn, not fork: the parent's engines and their open connections must not be shared
+        with ProcessPoolExecutor(max_workers=int(workers), mp_context=multiprocessing.get_context('spawn')) as pool:
+            # a bounded window of ranges is decoded ahead, results are written strictly in range order
+            remaining_ranges = iter(ranges)
+            pending = deque(pool.submit(_prepare_plays_chunk, *id_range) for id_range in islice(remaining_ranges, 2 * int(workers)))
+            done = 0
+            while pending:
+                chunk_rows = pending.popleft().result()
+                pending.extend(pool.submit(_prepare_plays_chunk, *id_range) for id_range in islice(remaining_ranges, 1))
+                with get_engine('bulk-load').begin() as connection:
+                    for rows in chunk_rows:
+                        stats['plays'] += write_bulk_rows(connection, rows)
+                done += 1
+                if done % 10 == 0 or done == len(ranges):
+                    logger.info(f"Replayed {done}/{len(ranges)} chunks, {stats['plays']} plays inserted")
+
+        stats['seconds'] = round(time.perf_counter() - started_at, 1)
+        log_payload['status'] = 'success'
+        log_payload['response'] = json.dumps(stats)
+        logger.info(f"Archive rebuild completed: {json.dumps(stats)}")
+    except Exception as e:
+        logger.error(f'Archive rebuild failed: {str(e)}', exc_info=True)
+        log_payload['status'] = 'error'
+        log_payload['response'] = str(e)
+    finally:
+        if log_payload['status']:
+            SyncLog.create_record(log_payload)
+        close_session()
+
+@task()
+def archive_historical_data(ctx, path='data/final_listening_history.json', batch_size=5000):
+    """
+    Archives the historical export, so plays loaded before the archive existed survive a rebuild
+    """
+    from config.postgres import get_engine
+    from utils.archive import archive_rows, write_archive_rows, log_archive_stats
+
+    with open(path, 'r') as f:
+        listening_history = sorted(json.load(f), key=lambda x: x['played_at'])
+
+    batch_size = int(batch_size)
+    engine = get_engine('bulk-load')
+    for start in range(0, len(listening_history), batch_size):
+        with engine.begin() as connection:
+            write_archive_rows(connection, archive_rows(listening_history[start:start + batch_size], 'historical-data'))
+        logger.info(f"Archived {min(start + batch_size, len(listening_history))}/{len(listening_history)} items")
+
+    with engine.connect() as connection:
+        log_archive_stats(connection)
+
+# helper functions
+def _truncate_derived_tables() -> None:
+    from config.postgres import get_engine, execute_query
+    from utils.backfill import reset_checkpoints
+
+    # cold plays are truncated too and come back hot, the next move-to-cold-storage run moves them again
+    archived, stored = execute_query("""
+        SELECT (SELECT COUNT(*) FROM spotilens__raw_plays),
+               (SELECT COUNT(*) FROM spotilens__listening_history) + (SELECT COALESCE(SUM(play_count), 0) FROM spotilens__listening_history_cold)
+    """, profile='bulk-load')['rows'][0]
+    if stored > archived:
+        raise RuntimeError(f"Listening history has {stored} plays but the archive only {archived}; run archive-historical-data first or rebuild without --truncate")
+
+    with get_engine('bulk-load').begin() as connection:
+        if connection.dialect.name == 'postgresql':
+            connection.exec_driver_sql(f"TRUNCATE {', '.join(DERIVED_TABLES)} RESTART IDENTITY")
+        else:
+            for table in DERIVED_TABLES:
+                connection.exec_driver_sql(f"DELETE FROM {table}")
+    logger.info(f"Truncated {', '.join(DERIVED_TABLES)}")
+
+    # primary keys start over, the PK-range checkpoints of unfinished backfills no longer line up
+    for table in DERIVED_TABLES:
+        reset_checkpoints(table)
+
+def _rebuild_dimensions(chunk_size: int) -> int:
+    from sqlalchemy import select, func
+    from config.postgres import get_engine
+    from db.models.raw_plays import RawPlay
+    from utils.archive import ObjectResolver
+    from utils.helper import prepare_dimension_rows, write_bulk_rows
+
+    engine = get_engine('bulk-load')
+    with engine.connect() as connection:
+        digests = connection.execute(select(RawPlay.track_digest).group_by(RawPlay.track_digest).order_by(func.min(RawPlay.id))).scalars().all()
+
+    for start in range(0, len(digests), chunk_size):
+        chunk = digests[start:start + chunk_size]
+        with engine.begin() as connection:
+            resolver = ObjectResolver(connection)
+            resolver.load(chunk)
+            write_bulk_rows(connection, prepare_dimension_rows([ resolver.resolve(digest) for digest in chunk ]))
+
+    return len(digests)
+
+def _prepare_plays_chunk(start_id: int, end_id: int) -> List[Dict[str, Any]]:
+    """
+    Runs in a worker process, decodes the raw plays with start_id <= id < end_id into bulk rows per
+    entry type and user, in a fixed order; the parent writes them
+    """
+    from itertools import groupby
+    from config.postgres import get_engine
+    from utils.archive import iter_archived_items
+    from utils.helper import prepare_bulk_rows
+
+    chunk_rows = []
+    with get_engine('bulk-load').connect() as connection:
+        archived = list(iter_archived_items(connection, start_id, end_id))
+    group_key = lambda archived_item: (archived_item[0], archived_item[1] or '')
+    for (entry_type, user_id), group in groupby(sorted(archived, key=group_key), key=group_key):
+        rows = prepare_bulk_rows([ item for _, _, item in group ], entry_type, user_id or None, archive=False)
+        # dimensions were rebuilt up front, only the plays are written
+        rows.update({ table: [] for table in ('artists', 'albums', 'tracks', 'album_artists', 'track_artists') })
+        chunk_rows.append(rows)
+
+    return chunk_rows
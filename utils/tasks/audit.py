@@ -0,0 +1,158 @@
+import json
+from invoke.tasks import task
+from config.logger import logger
+from typing import Dict, Any
+from datetime import timedelta
+
+SAMPLE_SIZE = 20
+# an incremental audit re-checksums the days from this many days before the last audited one, plays
+# can land a little after their day (spool drains, offline plays); older backfills need --full
+LOOKBACK_DAYS = 3
+
+# the checks below run on the analytics engine (the read replica, when configured)
+
+# track_name is part of the checksum, so a play renamed after its day was audited is checked again
+DAILY_CHECKSUMS_QUERY = """
+    SELECT (played_at AT TIME ZONE 'UTC')::date AS day,
+           COUNT(*) AS play_count,
+           md5(string_agg(track_id || '@' || (EXTRACT(EPOCH FROM played_at) * 1000)::bigint || '@' || COALESCE(track_name, ''), ',' ORDER BY played_at, track_id)) AS checksum
+    FROM spotilens__listening_history
+    WHERE CAST(:since AS date) IS NULL OR played_at >= CAST(:since AS timestamp) AT TIME ZONE 'UTC'
+    GROUP BY 1
+"""
+
+# per-play checks, scoped to the days whose checksum changed (:days is NULL for a full audit)
+TRACK_NAME_MISMATCH_QUERY = """
+    SELECT lh.play_id, lh.track_id, lh.track_name, t.name, COUNT(*) OVER () AS total
+    FROM spotilens__listening_history lh
+    JOIN spotilens__tracks t ON t.track_id = lh.track_id
+    WHERE (lh.track_name IS DISTINCT FROM t.name OR btrim(lh.track_name) = '')
+    AND (CAST(:days AS date[]) IS NULL OR (lh.played_at AT TIME ZONE 'UTC')::date = ANY(CAST(:days AS date[])))
+    ORDER BY lh.play_id
+    LIMIT :sample_size
+"""
+
+# catalog-wide checks, the dimension tables are small enough to scan every run
+TRACKS_WITHOUT_ARTISTS_QUERY = """
+    SELECT t.track_id, COUNT(*) OVER () AS total
+    FROM spotilens__tracks t
+    WHERE NOT EXISTS (SELECT 1 FROM spotilens__track_artists ta WHERE ta.track_id = t.track_id)
+    ORDER BY t.track_id
+    LIMIT :sample_size
+"""
+
+ALBUMS_WITHOUT_ARTISTS_QUERY = """
+    SELECT a.album_id, COUNT(*) OVER () AS total
+    FROM spotilens__albums a
+    WHERE NOT EXISTS (SELECT 1 FROM spotilens__album_artists aa WHERE aa.album_id = a.album_id)
+    ORDER BY a.album_id
+    LIMIT :sample_size
+"""
+
+EMPTY_NAMES_QUERY = """
+    SELECT entity, entity_id, COUNT(*) OVER () AS total
+    FROM (
+        SELECT 'track' AS entity, track_id AS entity_id FROM spotilens__tracks WHERE name IS NULL OR btrim(name) = ''
+        UNION ALL
+        SELECT 'album', album_id FROM spotilens__albums WHERE name IS NULL OR btrim(name) = ''
+        UNION ALL
+        SELECT 'artist', artist_id FROM spotilens__artists WHERE name IS NULL OR btrim(name) = ''
+    ) empty_names
+    ORDER BY entity, entity_id
+    LIMIT :sample_size
+"""
+
+STORED_CHECKSUMS_QUERY = "SELECT day, play_count, checksum FROM spotilens__daily_checksums"
+
+MISMATCHED_DAYS_QUERY = """
+    SELECT DISTINCT (lh.played_at AT TIME ZONE 'UTC')::date
+    FROM spotilens__listening_history lh
+    JOIN spotilens__tracks t ON t.track_id = lh.track_id
+    WHERE (lh.track_name IS DISTINCT FROM t.name OR btrim(lh.track_name) = '')
+    AND (lh.played_at AT TIME ZONE 'UTC')::date = ANY(:days)
+"""
+
+UPSERT_CHECKSUM_QUERY = """
+    INSERT INTO spotilens__daily_checksums (day, play_count, checksum)
+    VALUES (:day, :play_count, :checksum)
+    ON CONFLICT (day) DO UPDATE
+    SET play_count = EXCLUDED.play_count, checksum = EXCLUDED.checksum, updated_at = NOW()
+"""
+
+@task()
+def audit_data_consistency(ctx, full=False):
+    from db.models.sync_logs import SyncLog
+    from config.postgres import close_session, execute_query
+
+    log_payload = {
+        'status': None,
+        'sync_source': 'consistency-audit',
+        'response': None
+    }
+    def run_check(query: str, params: Dict[str, Any] = None) -> Dict[str, Any]:
+        return _check_result(execute_query(query, {**(params or {}), 'sample_size': SAMPLE_SIZE}, profile='analytics'))
+
+    try:
+        stored_checksums = _checksums_by_day(execute_query(STORED_CHECKSUMS_QUERY, profile='analytics'))
+        # only days from shortly before the last audited one are checksummed again
+        since = None if full or not stored_checksums else max(stored_checksums) - timedelta(days=LOOKBACK_DAYS)
+        current_checksums = _checksums_by_day(execute_query(DAILY_CHECKSUMS_QUERY, {'since': since}, profile='analytics'))
+
+        if full:
+            changed_days = sorted(current_checksums)
+        else:
+            changed_days = sorted(day for day, checksum in current_checksums.items() if stored_checksums.get(day) != checksum)
+        removed_days = sorted(day for day in set(stored_checksums) - set(current_checksums) if since is None or day >= since)
+
+        scope = 'all days' if since is None else f"days from {since}"
+        logger.info(f"{len(changed_days)} of {len(current_checksums)} checksummed days ({scope}) changed since the last audit")
+
+        report = {
+            'since': since,
+            'days_checked': len(changed_days),
+            'days_removed': len(removed_days),
+            'track_name_mismatches': run_check(TRACK_NAME_MISMATCH_QUERY, {'days': None if full else changed_days}) if changed_days else _empty_check(),
+            'tracks_without_artists': run_check(TRACKS_WITHOUT_ARTISTS_QUERY),
+            'albums_without_artists': run_check(ALBUMS_WITHOUT_ARTISTS_QUERY),
+            'empty_names': run_check(EMPTY_NAMES_QUERY)
+        }
+
+        # days with bad plays keep their old checksum so the next audit looks at them again
+        flagged_days = { row[0] for row in execute_query(MISMATCHED_DAYS_QUERY, {'days': changed_days}, profile='analytics')['rows'] } if report['track_name_mismatches']['count'] else set()
+        checksum_rows = [
+            {'day': day, 'play_count': current_checksums[day][0], 'checksum': current_checksums[day][1]}
+            for day in changed_days if day not in flagged_days
+        ]
+        if checksum_rows:
+            execute_query(UPSERT_CHECKSUM_QUERY, checksum_rows, commit=True)
+        if removed_days:
+            execute_query("DELETE FROM spotilens__daily_checksums WHERE day = ANY(:days)", {'days': removed_days}, commit=True)
+
+        for check, result in report.items():
+            if isinstance(result, dict) and result['count']:
+                logger.warning(f"Consistency check '{check}' found {result['count']} issue(s), e.g. {result['sample'][:5]}")
+
+        log_payload['status'] = 'success'
+        log_payload['response'] = json.dumps(report, default=str)
+        logger.info('Consistency audit completed.')
+    except Exception as e:
+        logger.error(f'Consistency audit failed: {str(e)}', exc_info=True)
+        log_payload['response'] = str(e)
+        log_payload['status'] = 'error'
+    finally:
+        SyncLog.create_record(log_payload)
+        close_session()
+
+# helper functions
+def _checksums_by_day(result: Dict[str, Any]) -> Dict[Any, tuple]:
+    return { day: (play_count, checksum) for day, play_count, checksum in result['rows'] }
+
+def _check_result(result: Dict[str, Any]) -> Dict[str, Any]:
+    rows = result.get('rows', [])
+    return {
+        'count': rows[0][-1] if rows else 0,
+        'sample': [ row[:-1] for row in rows ]
+    }
+
+def _empty_check() -> Dict[str, Any]:
+    return {'count': 0, 'sample': []}
@@ -1,40 +1,168 @@
+import json
 from invoke.tasks import task
-from config.logger import logger
-from db.models.sync_logs import SyncLog
-from config.postgres import close_session
-from utils.spotify_service import SpotifyService
-from utils.helper import store_spotify_track_in_db
+from config.logger import logger, log_batch_summary
+import utils.constants as constants
 
 @task()
 def sync_data_with_spotify(ctx):
-    spotify_service = SpotifyService()
+    from utils.instrumentation import SyncMetrics
+    from utils.spotify_service import SpotifyService
 
-    _sync_recently_played(spotify_service)
+    metrics = SyncMetrics('recently-played-api')
+    spotify_service = SpotifyService(metrics=metrics)
+
+    _sync_recently_played(spotify_service, metrics)
     _sync_artists(spotify_service)
     _sync_albums(spotify_service)
 
     logger.info('Syncing completed.')
 
+@task()
+def sync_data_with_spotify_async(ctx, batch_size=500, queue_size=8):
+    """
+    Alternative to sync-data-with-spotify on asyncio (utils.async_pipeline.IngestPipeline), through the
+    spool like the synchronous path. Recently-played serves at most 50 plays, so this is usually one
+    page and one write; the pipeline pays off with several sources.
+    """
+    import asyncio
+    from sqlalchemy.engine import Engine
+    from db.models.sync_logs import SyncLog
+    from config.postgres import close_session
+    from utils.instrumentation import SyncMetrics
+
+    metrics = SyncMetrics('recently-played-api')
+    log_payload = {
+        'status': None,
+        'sync_source': 'recently-played-api',
+        'response': None
+    }
+    error, stats = None, None
+    try:
+        with metrics.recording(Engine), metrics.stage('pipeline'):
+            stats = asyncio.run(_run_async_pipeline(metrics, int(batch_size), int(queue_size)))
+        log_batch_summary(f"Stored {stats['inserted']} of {stats['fetched']} recently played items")
+        if stats['errors']:
+            raise RuntimeError(f"Fetching failed: {stats['errors']}")
+        log_payload['status'] = True
+    except Exception as e:
+        logger.error(f'Could not sync with spotify: {str(e)}')
+        error = str(e)
+        log_payload['status'] = False
+    except (asyncio.CancelledError, KeyboardInterrupt):
+        # not Exceptions, but the interrupted run still gets its sync log before they propagate
+        logger.error('Sync with spotify was cancelled')
+        error = 'cancelled'
+        log_payload['status'] = False
+        raise
+    finally:
+        summary = metrics.summary()
+        logger.info(f'Sync metrics: {json.dumps(summary)}, pipeline: {json.dumps(stats)}')
+        log_payload['response'] = json.dumps({'error': error, 'metrics': summary, 'pipeline': stats})
+        if constants.PROMETHEUS_TEXTFILE_DIR:
+            _write_prometheus_textfile(metrics)
+        SyncLog.create_record(log_payload)
+        close_session()
+
+    logger.info('Syncing completed.')
+
+@task()
+def drain_spool(ctx, batch_size=5000):
+    """
+    Loads spooled payloads left behind by a sync that could not reach the database
+    """
+    _drain_spool(int(batch_size))
+
 # helper functions
-def _sync_recently_played(spotify_service):
+def _sync_recently_played(spotify_service, metrics):
+    from sqlalchemy.engine import Engine
+    from db.models.sync_logs import SyncLog
+    from config.postgres import close_session
+
     log_payload = {
         'status': None,
         'sync_source': 'recently-played-api',
         'response': None
     }
+    error, drain_stats = None, None
     try:
-        response = spotify_service.fetch_recently_played()
-        sorted_items = sorted(response['items'], key=lambda x: x['played_at'])
-        [ store_spotify_track_in_db(item, 'daily-sync') for item in sorted_items ]
+        # the engine class covers the bulk-load engine the drain writes through
+        with metrics.recording(Engine):
+            with metrics.stage('fetch_recently_played'):
+                response = spotify_service.fetch_recently_played()
+            # on disk before the database is touched, a failed drain is retried by the next run
+            with metrics.stage('spool'):
+                _get_spool().append(response['items'], 'daily-sync')
+            with metrics.stage('drain_spool'):
+                drain_stats = _drain_spool()
+        # the drain keeps going past segments it cannot load, the run still failed to store them
+        if drain_stats['failed'] or drain_stats['quarantined']:
+            raise RuntimeError(f"Could not load {drain_stats['failed']} spool segments ({drain_stats['quarantined']} quarantined)")
         log_payload['status'] = True
     except Exception as e:
         logger.error(f'Could not sync with spotify: {str(e)}')
-        log_payload['response'] = str(e)
+        error = str(e)
         log_payload['status'] = False
     finally:
+        summary = metrics.summary()
+        logger.info(f'Sync metrics: {json.dumps(summary)}')
+        log_payload['response'] = json.dumps({'error': error, 'metrics': summary, 'drain': drain_stats})
+        if constants.PROMETHEUS_TEXTFILE_DIR:
+            _write_prometheus_textfile(metrics)
         SyncLog.create_record(log_payload)
         close_session()
 
+async def _run_async_pipeline(metrics, batch_size, queue_size):
+    import signal
+    import asyncio
+    from config.postgres import create_async_engine
+    from utils.async_pipeline import IngestPipeline
+    from utils.async_spotify_service import AsyncSpotifyService
+
+    # SIGTERM cancels the pipeline like Ctrl-C does, the open transaction is rolled back
+    main_task = asyncio.current_task()
+    asyncio.get_running_loop().add_signal_handler(signal.SIGTERM, main_task.cancel)
+
+    engine = create_async_engine('bulk-load')
+    try:
+        async with AsyncSpotifyService(metrics=metrics) as spotify_service:
+            pipeline = IngestPipeline(engine, 'daily-sync', batch_size=batch_size, queue_size=queue_size, spool=_get_spool())
+            return await pipeline.run([ (None, spotify_service.iter_recently_played()) ])
+    finally:
+        await engine.dispose()
+
+def _get_spool():
+    from utils.spool import Spool
+
+    return Spool(constants.SPOOL_DIR)
+
+def _drain_spool(batch_size=5000):
+    from itertools import groupby
+    from sqlalchemy.exc import OperationalError, InterfaceError
+    from config.postgres import get_engine
+    from utils.helper import prepare_bulk_rows, write_bulk_rows
+
+    def load(records):
+        # one transaction per batch, its segments are only removed once all of it is committed; a
+        # batch can mix segments from different sources, keep plays sorted within each group
+        group_key = lambda record: (record['entry_type'], record['user_id'] or '')
+        with get_engine('bulk-load').begin() as connection:
+            for (entry_type, user_id), group in groupby(sorted(records, key=group_key), key=group_key):
+                items = sorted((record['payload'] for record in group), key=lambda x: x['played_at'])
+                rows = prepare_bulk_rows(items, entry_type, user_id or None)
+                if rows['plays']:
+                    write_bulk_rows(connection, rows)
+
+    # an unreachable database is not the segments' fault, they stay for the next run
+    stats = _get_spool().drain(load, batch_size=batch_size, transient_errors=(OperationalError, InterfaceError))
+    logger.info(f"Drained spool: {json.dumps(stats)}")
+    return stats
+
+def _write_prometheus_textfile(metrics):
+    try:
+        metrics.write_prometheus_textfile(constants.PROMETHEUS_TEXTFILE_DIR)
+    except OSError as e:
+        logger.warning(f'Could not write prometheus textfile: {str(e)}')
+
 def _sync_artists(spotify_service):
     pass
 
@@ -0,0 +1,45 @@
+import time
+from invoke.tasks import task
+from config.logger import logger
+import utils.constants as constants
+from datetime import datetime, timedelta, timezone
+
+@task()
+def snapshot_listening_history(ctx, path=None):
+    """
+    Rebuilds the columnar listening history snapshot the explore tasks read from
+    """
+    from utils.listening_store import ListeningStore
+
+    started_at = time.perf_counter()
+    ListeningStore.build().save(path or constants.LISTENING_SNAPSHOT_PATH)
+    logger.info(f"Snapshot built in {time.perf_counter() - started_at:.1f}s")
+
+@task()
+def top(ctx, by='track', days=30, limit=10, user_id=None, rebuild=False):
+    """
+    Most played tracks, albums or artists over the last `days` days (0 for all time), or plays per
+    hour/weekday, from the snapshot (built on first use)
+    """
+    from utils.listening_store import ListeningStore
+
+    started_at = time.perf_counter()
+    store = ListeningStore.load_or_build(constants.LISTENING_SNAPSHOT_PATH, rebuild=rebuild)
+    loaded_at = time.perf_counter()
+
+    start = datetime.now(timezone.utc) - timedelta(days=int(days)) if int(days) else None
+    limit = int(limit)
+    if by == 'track':
+        rows = [ f"{row['plays']:>6}  {row['name']} ({row['track_id']})" for row in store.top_tracks(limit, start, user_id=user_id) ]
+    elif by == 'album':
+        rows = [ f"{row['plays']:>6}  {row['name']} ({row['album_id']})" for row in store.top_albums(limit, start, user_id=user_id) ]
+    elif by == 'artist':
+        rows = [ f"{row['plays']:>6}  {row['name']} ({row['artist_id']})" for row in store.top_artists(limit, start, user_id=user_id) ]
+    elif by in ('hour', 'weekday'):
+        rows = [ f"{plays:>6}  {bucket}" for bucket, plays in sorted(store.group_by(by, start, user_id=user_id).items()) ]
+    else:
+        raise ValueError(f"Unknown --by '{by}', expected track, album, artist, hour or weekday")
+
+    queried_at = time.perf_counter()
+    logger.info(f"Plays by {by}, snapshot of {store.meta['built_at']}:\n" + '\n'.join(rows))
+    logger.info(f"Loaded {len(store)} plays in {(loaded_at - started_at) * 1000:.1f}ms, queried in {(queried_at - loaded_at) * 1000:.2f}ms")
@@ -1,9 +1,6 @@
 import json
-from sqlalchemy import text
 from invoke.tasks import task
-from config.logger import logger
-from utils.helper import store_spotify_track_in_db
-from config.postgres import db_session, close_session, execute_query
+from config.logger import logger, log_batch_summary
 
 @task()
 def create_tables_in_db(ctx):
@@ -14,45 +11,63 @@ def create_tables_in_db(ctx):
     from db.models.track_artists import TrackArtist
     from db.models.listening_history import ListeningHistory
     from db.models.sync_logs import SyncLog
-    import utils.constants as constants
-    from sqlalchemy import create_engine
+    from db.models.daily_checksums import DailyChecksum
+    from db.models.users import User
+    from db.models.raw_objects import RawObject
+    from db.models.raw_plays import RawPlay
+    from db.models.track_keys import TrackKey
+    from db.models.listening_history_cold import ListeningHistoryCold
+    from config.postgres import get_engine
     from db.models.base_model import Base
 
-    engine = create_engine(constants.SUPABASE_DB_URL)
-    Base.metadata.create_all(engine)
+    Base.metadata.create_all(get_engine())
 
 @task()
-def populate_db_with_historical_listening_data(ctx):
-    logger.setLevel('WARNING')
+def populate_db_with_historical_listening_data(ctx, batch_size=500):
+    from config.postgres import close_session
+    from utils.helper import store_spotify_track_in_db
 
     with open('data/final_listening_history.json', 'r') as f:
         listening_history = json.load(f)
 
     listening_history_sorted = sorted(listening_history, key=lambda x: x['played_at'])
+    total = len(listening_history_sorted)
 
     for i, item in enumerate(listening_history_sorted, 1):
         try:
-            print(f"Processing item {i}/{len(listening_history_sorted)}")
             store_spotify_track_in_db(item, 'historical-data')
         except Exception as e:
-            print(f"Error processing track with id {item.get('track', {}).get('id')}: {e}")
-            print('continuing...')
+            logger.error(f"Error processing track with id {item.get('track', {}).get('id')}, continuing: {e}")
+        if i % batch_size == 0 or i == total:
+            log_batch_summary(f"Processed {i}/{total} items")
     close_session()
 
 @task()
-def populate_track_names_bulk(ctx):
+def populate_track_names_bulk(ctx, chunk_size=5000, rows_per_second=0.0, resume=True):
+    from utils.backfill import ChunkedBackfill
+    from config.postgres import db_session, close_session
+
     try:
-        # Raw SQL query to update track_name from tracks table
-        # CORRECTED: Proper explicit JOIN syntax for PostgreSQL UPDATE
+        # Walks listening history in play_id ranges, one committed transaction per chunk
         update_query = """
             UPDATE spotilens__listening_history
             SET track_name = t.name, updated_at = NOW()
             FROM spotilens__tracks t
             WHERE spotilens__listening_history.track_id = t.track_id
             AND spotilens__listening_history.track_name IS NULL
+            AND spotilens__listening_history.play_id >= :start_id
+            AND spotilens__listening_history.play_id < :end_id
         """
 
-        result = execute_query(update_query)
+        backfill = ChunkedBackfill(
+            name='populate-track-names',
+            table='spotilens__listening_history',
+            pk_column='play_id',
+            chunk_query=update_query,
+            chunk_size=int(chunk_size),
+            rows_per_second=float(rows_per_second)
+        )
+        result = backfill.run(resume=resume)
 
         logger.info(f"Bulk update completed. Updated {result.get('rows_affected', 0)} records with track names.")
 
@@ -63,4 +78,67 @@ def populate_track_names_bulk(ctx):
         db_session.rollback()
         return False
     finally:
-        db_session.close()
+        close_session()
+
+@task()
+def import_extended_history(ctx, path='data/extended', workers=4, min_ms_played=None, batch_size=5000, user_id=None):
+    """
+    Imports Spotify's extended streaming history export (the Streaming_History_Audio_*.json files in
+    `path`). Files are parsed in parallel, track metadata is resolved once per distinct track, and the
+    plays are bulk-loaded in played_at order with their ms_played and remaining export fields.
+    Plays already stored from recently-played (within a few seconds) are skipped.
+    """
+    import glob
+    import os
+    import time
+    from concurrent.futures import ProcessPoolExecutor
+    from functools import partial
+    from db.models.sync_logs import SyncLog
+    from config.postgres import close_session
+    from utils.helper import bulk_store_spotify_tracks
+    from utils.extended_history import DEFAULT_MIN_MS_PLAYED, parse_export_file, resolve_tracks, build_items, without_stored_plays
+
+    log_payload = {
+        'status': None,
+        'sync_source': 'extended-history-import',
+        'response': None
+    }
+    started_at = time.perf_counter()
+    try:
+        files = sorted(glob.glob(os.path.join(path, 'Streaming_History_Audio_*.json')))
+        if not files:
+            logger.info(f"No Streaming_History_Audio_*.json files in {path}, nothing to import.")
+            return
+
+        plays, stats = [], {'files': len(files), 'entries': 0, 'not_a_track': 0, 'too_short': 0}
+        with ProcessPoolExecutor(max_workers=int(workers)) as pool:
+            for file_path, (file_plays, file_stats) in zip(files, pool.map(partial(parse_export_file, min_ms_played=int(min_ms_played or DEFAULT_MIN_MS_PLAYED)), files)):
+                plays.extend(file_plays)
+                for key, value in file_stats.items():
+                    stats[key] += value
+                logger.info(f"Parsed {len(file_plays)} plays from {os.path.basename(file_path)}")
+
+        tracks, resolve_stats = resolve_tracks(track_id for track_id, _, _, _ in plays)
+        stats.update(resolve_stats)
+
+        items = sorted(build_items(plays, tracks), key=lambda x: x['played_at'])
+        stats.update({'plays': len(plays), 'skipped_unresolved': len(plays) - len(items), 'inserted': 0})
+        items, stats['skipped_stored'] = without_stored_plays(items, user_id)
+
+        batch_size = int(batch_size)
+        for start in range(0, len(items), batch_size):
+            stats['inserted'] += bulk_store_spotify_tracks(items[start:start + batch_size], 'extended-history', user_id)
+            logger.info(f"Loaded {min(start + batch_size, len(items))}/{len(items)} plays")
+
+        stats['seconds'] = round(time.perf_counter() - started_at, 1)
+        log_payload['status'] = 'success'
+        log_payload['response'] = json.dumps(stats)
+        logger.info(f"Extended history import completed: {json.dumps(stats)}")
+    except Exception as e:
+        logger.error(f'Extended history import failed: {str(e)}', exc_info=True)
+        log_payload['status'] = 'error'
+        log_payload['response'] = str(e)
+    finally:
+        if log_payload['status']:
+            SyncLog.create_record(log_payload)
+        close_session()
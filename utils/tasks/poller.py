@@ -0,0 +1,109 @@
+import json
+import signal
+import threading
+from typing import Optional
+from invoke.tasks import task
+from datetime import datetime, timezone
+from config.logger import logger, log_batch_summary
+import utils.constants as constants
+
+# the endpoint only returns the last 50 plays, and Spotify counts a play after 30s of listening,
+# so 50 back-to-back short plays can fill the window in 25 minutes; stay well inside that
+RECENTLY_PLAYED_LIMIT = 50
+MIN_PLAY_SECONDS = 30
+WINDOW_SAFETY_FACTOR = 0.6
+MAX_SAFE_INTERVAL = RECENTLY_PLAYED_LIMIT * MIN_PLAY_SECONDS * WINDOW_SAFETY_FACTOR
+
+@task()
+def poll_recently_played(ctx, min_interval=60, max_interval=900):
+    """
+    Stays resident and ingests recently played items as they arrive. Polls every
+    `min_interval` seconds while plays keep coming and backs off exponentially when idle,
+    never waiting longer than it takes to overrun the 50 item window. Stops on SIGINT/SIGTERM.
+    """
+    from config.postgres import close_session
+    from utils.spotify_service import SpotifyService
+
+    stop_event = threading.Event()
+    _install_signal_handlers(stop_event)
+
+    min_interval = float(min_interval)
+    max_interval = min(float(max_interval), MAX_SAFE_INTERVAL)
+    spotify_service = SpotifyService()
+    cursor = _latest_played_at()
+    interval = min_interval
+
+    logger.info(f"Poller started, cursor {cursor}, interval {min_interval:.0f}s-{max_interval:.0f}s")
+    while not stop_event.is_set():
+        try:
+            items = _poll_once(spotify_service, cursor)
+            if items:
+                cursor = items[-1]['played_at']
+                if len(items) >= RECENTLY_PLAYED_LIMIT:
+                    logger.warning(f"Poll returned a full page of {len(items)} items, older plays may have been missed")
+                interval = min_interval
+            else:
+                interval = min(interval * 2, max_interval)
+        except Exception as e:
+            logger.error(f"Poll failed, retrying in {min_interval:.0f}s: {str(e)}", exc_info=True)
+            interval = min_interval
+        finally:
+            close_session()
+
+        stop_event.wait(interval)
+
+    logger.info('Poller stopped.')
+
+# helper functions
+def _poll_once(spotify_service, cursor):
+    from db.models.sync_logs import SyncLog
+    from utils.spool import Spool
+    from utils.helper import store_spotify_track_in_db
+
+    cursor_params = {'cutoff_timestamp': cursor} if cursor else {}
+    response = spotify_service.fetch_recently_played(limit=RECENTLY_PLAYED_LIMIT, **cursor_params)
+    items = sorted(response.get('items', []), key=lambda x: x['played_at'])
+    if not items:
+        return items
+
+    # one bad item (e.g. a local file without a track id) must not pin the cursor and stall the poller,
+    # it is spooled instead and retried, then quarantined, by the next spool drain
+    failed = []
+    for item in items:
+        try:
+            store_spotify_track_in_db(item, 'daily-sync')
+        except Exception as e:
+            logger.error(f"Could not store track {(item.get('track') or {}).get('id')} played at {item.get('played_at')}, spooling it: {str(e)}")
+            failed.append(item)
+    if failed:
+        Spool(constants.SPOOL_DIR).append(failed, 'daily-sync')
+    log_batch_summary(f"Polled {len(items)} new items")
+
+    SyncLog.create_record({
+        'sync_source': 'recently-played-poller',
+        'status': True,
+        'response': json.dumps({'items': len(items), 'failed': len(failed), 'cursor': items[-1]['played_at']})
+    })
+    return items
+
+def _latest_played_at() -> Optional[str]:
+    from config.postgres import execute_query
+
+    # the poller follows the default account only, other accounts' plays must not move its cursor
+    result = execute_query("SELECT MAX(played_at) FROM spotilens__listening_history WHERE user_id IS NULL")
+    latest = result['rows'][0][0]
+    if latest is None:
+        return None
+    if isinstance(latest, str):
+        latest = datetime.fromisoformat(latest)
+    if latest.tzinfo is None:
+        latest = latest.replace(tzinfo=timezone.utc)
+    return latest.astimezone(timezone.utc).isoformat(timespec='milliseconds').replace('+00:00', 'Z')
+
+def _install_signal_handlers(stop_event: threading.Event) -> None:
+    def _handle_signal(signum, frame):
+        logger.info(f"Received {signal.Signals(signum).name}, finishing the current poll and shutting down")
+        stop_event.set()
+
+    signal.signal(signal.SIGINT, _handle_signal)
+    signal.signal(signal.SIGTERM, _handle_signal)
@@ -0,0 +1,72 @@
+import json
+import time
+from invoke.tasks import task
+from config.logger import logger
+import utils.constants as constants
+from datetime import datetime, timedelta, timezone
+
+@task()
+def move_to_cold_storage(ctx, older_than_days=None, days_per_batch=30):
+    """
+    Moves plays older than `older_than_days` (HOT_RETENTION_DAYS by default) from the listening history
+    into the compact cold table, whole UTC days at a time, one transaction per `days_per_batch` days.
+    Read both tiers through utils.cold_storage.iter_plays.
+    """
+    from sqlalchemy import select, func, delete
+    from db.models.sync_logs import SyncLog
+    from db.models.listening_history import ListeningHistory
+    from db.models.daily_checksums import DailyChecksum
+    from config.postgres import get_engine, close_session
+    from utils.cold_storage import move_to_cold, utc_midnight, log_tier_sizes
+
+    log_payload = {
+        'status': None,
+        'sync_source': 'cold-storage',
+        'response': None
+    }
+    started_at = time.perf_counter()
+    try:
+        older_than_days = int(older_than_days) if older_than_days is not None else constants.HOT_RETENTION_DAYS
+        cutoff = utc_midnight(datetime.now(timezone.utc) - timedelta(days=older_than_days))
+        engine = get_engine('bulk-load')
+
+        with engine.connect() as connection:
+            oldest = connection.execute(select(func.min(ListeningHistory.played_at))).scalar()
+        if oldest is None or utc_midnight(_to_datetime(oldest)) >= cutoff:
+            logger.info(f"No plays before {cutoff.date()} in the hot tier, nothing to move.")
+            return
+
+        stats = {'cutoff': cutoff.date().isoformat(), 'plays': 0, 'days': 0, 'cold_rows': 0}
+        batch_start = utc_midnight(_to_datetime(oldest))
+        while batch_start < cutoff:
+            batch_end = min(batch_start + timedelta(days=int(days_per_batch)), cutoff)
+            with engine.begin() as connection:
+                moved = move_to_cold(connection, batch_start, batch_end)
+                # the audit checksums hot days only, a moved day would otherwise be reported as removed
+                connection.execute(delete(DailyChecksum).where(DailyChecksum.day >= batch_start.date(), DailyChecksum.day < batch_end.date()))
+            for key, value in moved.items():
+                stats[key] += value
+            if moved['plays']:
+                logger.info(f"Moved {moved['plays']} plays of {moved['days']} days before {batch_end.date()} to cold storage")
+            batch_start = batch_end
+
+        with engine.connect() as connection:
+            log_tier_sizes(connection)
+
+        stats['seconds'] = round(time.perf_counter() - started_at, 1)
+        log_payload['status'] = 'success'
+        log_payload['response'] = json.dumps(stats)
+        logger.info(f"Cold storage move completed: {json.dumps(stats)}")
+    except Exception as e:
+        logger.error(f'Cold storage move failed: {str(e)}', exc_info=True)
+        log_payload['status'] = 'error'
+        log_payload['response'] = str(e)
+    finally:
+        if log_payload['status']:
+            SyncLog.create_record(log_payload)
+        close_session()
+
+# helper functions
+def _to_datetime(value) -> datetime:
+    # sqlite hands timestamps back as strings
+    return datetime.fromisoformat(value) if isinstance(value, str) else value